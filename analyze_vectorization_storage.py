@@ -2,6 +2,7 @@
 # analyze_vectorization_storage.py - 分析向量化和存储过程
 
 import json
+import argparse
 from enhanced_embedding_system import EnhancedVectorDatabaseManager
 from data_loader import KnowledgeDataLoader
 
@@ -80,6 +81,36 @@ def analyze_chromadb_storage():
     except Exception as e:
         print(f"  ❌ 访问数据库时出错: {e}")
 
+def analyze_snapshot_storage(snapshot_path: str):
+    """分析索引快照：直接加载为NumPy矩阵和pandas DataFrame"""
+    print(f"\n⚡ 索引快照分析: {snapshot_path}")
+    print("=" * 40)
+    
+    from index_snapshot import load_snapshot
+    import numpy as np
+    
+    snapshot = load_snapshot(snapshot_path)
+    vectors = snapshot.to_numpy()
+    
+    print(f"  向量矩阵: {vectors.shape}, {vectors.dtype}, {vectors.nbytes / (1024 * 1024):.1f} MB (内存映射)")
+    sample = np.asarray(vectors[:1000], dtype=np.float32)
+    print(f"  前{len(sample)}条向量范数均值: {np.linalg.norm(sample, axis=1).mean():.4f}")
+    
+    try:
+        frame = snapshot.to_dataframe()
+    except ImportError:
+        print("  ⚠️ pandas未安装，跳过DataFrame分析")
+        return
+    
+    print(f"  DataFrame列: {list(frame.columns)}")
+    if 'rel' in frame.columns:
+        print(f"  关系数量: {frame['rel'].nunique()}")
+        print(f"  最常见关系:")
+        for rel, count in frame['rel'].value_counts().head(5).items():
+            print(f"    {rel}: {count}")
+    if 'sub_type' in frame.columns:
+        print(f"  主语类型数量: {frame['sub_type'].nunique()}")
+
 def explain_vectorization_vs_metadata():
     """解释向量化 vs 元数据存储的区别"""
     print(f"\n💡 向量化 vs 元数据存储的区别:")
@@ -185,6 +216,10 @@ def demonstrate_with_example():
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="分析向量化和存储过程")
+    parser.add_argument('--snapshot', help='额外分析指定的索引快照文件')
+    args = parser.parse_args()
+    
     print("🔍 增强系统向量化和存储分析")
     print("=" * 60)
     
@@ -194,6 +229,9 @@ def main():
     # 2. 分析ChromaDB存储结构
     analyze_chromadb_storage()
     
+    if args.snapshot:
+        analyze_snapshot_storage(args.snapshot)
+    
     # 3. 解释向量化vs元数据的区别
     explain_vectorization_vs_metadata()
     
@@ -0,0 +1,71 @@
+# batch_reranker.py - 跨问题批量Cross-Encoder重排
+
+from typing import List, Dict, Tuple
+import numpy as np
+import config
+
+def _pair_length(pair) -> int:
+    """句子对长度的廉价估计（按空白切分的词数），用于长度分桶"""
+    return len(pair[0].split()) + len(pair[1].split())
+
+def predict_batched(model, sentence_pairs: List[List[str]], batch_size: int = None) -> np.ndarray:
+    """
+    对任意数量的句子对打分：按长度排序后切成大批次（动态padding只补齐到批内最长），
+    打分后按原顺序放回
+
+    Args:
+        model: 提供 predict(pairs, batch_size=...) 的Cross-Encoder
+        sentence_pairs: [查询, 文档] 句子对
+        batch_size: 每批句子对数量，默认使用config.RERANK_BATCH_SIZE
+    """
+    batch_size = batch_size or config.RERANK_BATCH_SIZE
+    if not sentence_pairs:
+        return np.empty(0, dtype=np.float32)
+
+    order = sorted(range(len(sentence_pairs)), key=lambda i: _pair_length(sentence_pairs[i]))
+    scores = np.empty(len(sentence_pairs), dtype=np.float32)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        bucket_scores = model.predict([sentence_pairs[i] for i in bucket], batch_size=len(bucket),
+                                      show_progress_bar=False)
+        scores[bucket] = np.asarray(bucket_scores, dtype=np.float32).reshape(-1)
+    return scores
+
+def rerank_groups(model, groups: List[Tuple[str, List[Dict]]], batch_size: int = None) -> List[np.ndarray]:
+    """
+    多个 (查询, 候选列表) 一起打分：展平为一个句子对列表批量推理，再按查询切分分数
+
+    Returns:
+        与groups一一对应的分数数组
+    """
+    sentence_pairs, boundaries = [], [0]
+    for query, candidates in groups:
+        sentence_pairs.extend([query, candidate['document']] for candidate in candidates)
+        boundaries.append(len(sentence_pairs))
+
+    scores = predict_batched(model, sentence_pairs, batch_size)
+    return [scores[boundaries[i]:boundaries[i + 1]] for i in range(len(groups))]
+
+# 测试函数
+def test_batch_reranker():
+    """测试分桶批量打分后分数能按原顺序放回"""
+
+    class _MockModel:
+        def __init__(self):
+            self.batch_sizes = []
+
+        def predict(self, pairs, batch_size=32, show_progress_bar=False):
+            self.batch_sizes.append(len(pairs))
+            return [float(len(document)) for _, document in pairs]
+
+    model = _MockModel()
+    groups = [
+        ("who leads Belgium", [{'document': 'a' * n} for n in (5, 1, 30)]),
+        ("where is Schiphol", [{'document': 'b' * n} for n in (12, 2)])
+    ]
+    scores = rerank_groups(model, groups, batch_size=2)
+    print(f"分数: {[s.tolist() for s in scores]} (预期: [[5, 1, 30], [12, 2]])")
+    print(f"批次大小: {model.batch_sizes}")
+
+if __name__ == '__main__':
+    test_batch_reranker()
@@ -0,0 +1,235 @@
+# binary_index.py - 1-bit量化嵌入索引（Hamming预筛选 + float32/int8重打分）
+
+import argparse
+import time
+from typing import List, Dict
+import numpy as np
+import config
+from index_snapshot import SnapshotCollection, QUERY_CHUNK_ROWS
+
+SUPPORTED_RESCORE = ('float32', 'int8')
+
+# 每个字节的置位数查找表（numpy < 2.0 没有 np.bitwise_count）
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def binary_index_paths(snapshot_path: str) -> Dict[str, str]:
+    """二值码、int8向量和int8缩放系数的文件路径（均为可内存映射的.npy）"""
+    return {
+        'codes': f"{snapshot_path}.bin1.npy",
+        'int8': f"{snapshot_path}.int8.npy",
+        'int8_scale': f"{snapshot_path}.int8scale.npy"
+    }
+
+def pack_binary(vectors: np.ndarray) -> np.ndarray:
+    """按符号位量化为1 bit并打包为uint8 (每8维1字节)"""
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """一个查询二值码与一批二值码的Hamming距离"""
+    xor = np.bitwise_xor(codes, query_code)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT_TABLE[xor].sum(axis=1, dtype=np.int32)
+
+def build_binary_index(snapshot_path: str, with_int8: bool = True) -> Dict[str, str]:
+    """
+    从索引快照构建二值量化索引（可选同时生成int8向量用于重打分）
+    """
+    snapshot = SnapshotCollection(snapshot_path)
+    vectors = snapshot.to_numpy()
+    total, dim = vectors.shape
+    paths = binary_index_paths(snapshot_path)
+
+    print(f"🔄 构建二值量化索引: {total} 条, {dim} 维 -> {(dim + 7) // 8} 字节/条")
+
+    codes = np.lib.format.open_memmap(paths['codes'], mode='w+', dtype=np.uint8,
+                                      shape=(total, (dim + 7) // 8))
+    if with_int8:
+        int8_vectors = np.lib.format.open_memmap(paths['int8'], mode='w+', dtype=np.int8, shape=(total, dim))
+        scales = np.empty(total, dtype=np.float32)
+
+    for start in range(0, total, QUERY_CHUNK_ROWS):
+        block = np.asarray(vectors[start:start + QUERY_CHUNK_ROWS], dtype=np.float32)
+        end = start + len(block)
+        codes[start:end] = pack_binary(block)
+        if with_int8:
+            block_scale = np.abs(block).max(axis=1)
+            block_scale[block_scale == 0] = 1.0
+            int8_vectors[start:end] = np.round(block / block_scale[:, None] * 127).astype(np.int8)
+            scales[start:end] = block_scale / 127
+
+    codes.flush()
+    del codes
+    if with_int8:
+        int8_vectors.flush()
+        del int8_vectors
+        np.save(paths['int8_scale'], scales)
+
+    print(f"✅ 二值量化索引已保存: {paths['codes']}")
+    return paths
+
+class BinaryQuantizedCollection:
+    """
+    二值量化检索集合
+
+    第一阶段用打包的1-bit码做Hamming距离Top-(n_results * oversample)预筛选，
+    再用float32（快照向量）或int8向量对幸存候选重打分。
+    接口与ChromaDB集合的 count/get/query 一致。
+    """
+
+    def __init__(self, snapshot_path: str, rescore: str = 'float32', oversample: int = None):
+        if rescore not in SUPPORTED_RESCORE:
+            raise ValueError(f"不支持的重打分精度: {rescore}，可选值: {SUPPORTED_RESCORE}")
+
+        self.snapshot = SnapshotCollection(snapshot_path)
+        self.name = self.snapshot.name
+        self.rescore = rescore
+        self.oversample = oversample or config.BINARY_SEARCH_OVERSAMPLE
+
+        paths = binary_index_paths(snapshot_path)
+        self.codes = np.load(paths['codes'], mmap_mode='r')
+        if rescore == 'int8':
+            self.int8_vectors = np.load(paths['int8'], mmap_mode='r')
+            self.int8_scales = np.load(paths['int8_scale'], mmap_mode='r')
+
+    def count(self) -> int:
+        return self.snapshot.count()
+
+    def get(self, *args, **kwargs) -> Dict:
+        return self.snapshot.get(*args, **kwargs)
+
+    def search(self, query_vector, n_results: int):
+        """Hamming预筛选 + 重打分，返回 (行号数组, 距离数组)"""
+        total = self.count()
+        n_candidates = min(total, n_results * self.oversample)
+        if n_candidates <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        query_code = pack_binary(query)
+
+        candidate_rows, candidate_distances = [], []
+        for start in range(0, total, QUERY_CHUNK_ROWS):
+            distances = hamming_distances(self.codes[start:start + QUERY_CHUNK_ROWS], query_code)
+            if len(distances) > n_candidates:
+                top = np.argpartition(distances, n_candidates - 1)[:n_candidates]
+            else:
+                top = np.arange(len(distances))
+            candidate_rows.append(top + start)
+            candidate_distances.append(distances[top])
+
+        rows = np.concatenate(candidate_rows)
+        distances = np.concatenate(candidate_distances)
+        if len(rows) > n_candidates:
+            rows = rows[np.argpartition(distances, n_candidates - 1)[:n_candidates]]
+        rows = np.sort(rows)
+
+        if self.rescore == 'int8':
+            candidates = np.asarray(self.int8_vectors[rows], dtype=np.float32) * self.int8_scales[rows][:, None]
+        else:
+            candidates = np.asarray(self.snapshot.vectors[rows], dtype=np.float32)
+        scores = candidates @ query
+
+        order = np.argsort(-scores)[:n_results]
+        return rows[order], 1.0 - scores[order]
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10) -> Dict:
+        results = {'ids': [], 'distances': [], 'documents': [], 'metadatas': []}
+        for query_vector in query_embeddings:
+            indices, distances = self.search(query_vector, n_results)
+            self.snapshot._append_rows(results, indices, distances)
+        return results
+
+    def memory_stats(self) -> Dict:
+        """二值码与全精度向量的存储大小 (MB)"""
+        return {
+            'full_mb': self.snapshot.vectors.nbytes / (1024 * 1024),
+            'binary_mb': self.codes.nbytes / (1024 * 1024)
+        }
+
+def benchmark_binary_index(snapshot_path: str, k: int = 10, num_queries: int = 100) -> List[Dict]:
+    """对比二值预筛选与全精度精确检索的recall@k和延迟"""
+    full = SnapshotCollection(snapshot_path)
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(full.count(), size=min(num_queries, full.count()), replace=False))
+    query_vectors = np.asarray(full.vectors[rows], dtype=np.float32)
+    query_vectors += 0.02 * rng.normal(size=query_vectors.shape).astype(np.float32)
+
+    start = time.perf_counter()
+    truth = [set(full.search(q, k)[0].tolist()) for q in query_vectors]
+    full_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+
+    report = []
+    for rescore in SUPPORTED_RESCORE:
+        for oversample in [4, 10, 20]:
+            try:
+                index = BinaryQuantizedCollection(snapshot_path, rescore=rescore, oversample=oversample)
+            except FileNotFoundError:
+                continue
+            start = time.perf_counter()
+            found = [set(index.search(q, k)[0].tolist()) for q in query_vectors]
+            binary_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+            report.append({
+                'rescore': rescore,
+                'oversample': oversample,
+                f'recall@{k}': float(np.mean([len(f & t) / k for f, t in zip(found, truth)])),
+                'binary_ms': binary_ms,
+                'full_ms': full_ms,
+                **index.memory_stats()
+            })
+    return report
+
+def main():
+    """命令行入口 - 构建二值量化索引并输出基准报告"""
+    parser = argparse.ArgumentParser(description="1-bit量化嵌入索引 (Hamming预筛选 + 重打分)")
+    parser.add_argument('snapshot', help='索引快照文件 (index_snapshot.py导出)')
+    parser.add_argument('--no-int8', action='store_true', help='不生成int8重打分向量')
+    parser.add_argument('--k', type=int, default=10, help='recall@k中的k')
+
+    args = parser.parse_args()
+
+    build_binary_index(args.snapshot, with_int8=not args.no_int8)
+
+    print(f"\n📊 基准测试 (recall@{args.k} 相对全精度精确检索):")
+    for row in benchmark_binary_index(args.snapshot, k=args.k):
+        print(f"   rescore={row['rescore']:<7} oversample={row['oversample']:<3} "
+              f"recall@{args.k}={row[f'recall@{args.k}']:.4f} "
+              f"延迟 {row['binary_ms']:.2f}ms vs {row['full_ms']:.2f}ms "
+              f"内存 {row['binary_mb']:.1f}MB vs {row['full_mb']:.1f}MB")
+
+# 测试函数
+def test_binary_index():
+    """在随机语料上测试二值量化检索"""
+    import tempfile
+    from pathlib import Path
+    from index_snapshot import export_snapshot
+
+    class _MockCollection:
+        name = "mock_collection"
+
+        def __init__(self, count=5000, dim=256):
+            self.embeddings = np.random.default_rng(0).normal(size=(count, dim)).astype(np.float32)
+
+        def count(self):
+            return len(self.embeddings)
+
+        def get(self, limit, offset, include):
+            rows = range(offset, min(offset + limit, self.count()))
+            return {
+                'ids': [f"id_{i}" for i in rows],
+                'documents': [f"doc {i}" for i in rows],
+                'metadatas': [{'rel': 'leader'} for _ in rows],
+                'embeddings': self.embeddings[offset:offset + len(rows)]
+            }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "mock.kgsnap")
+        export_snapshot(_MockCollection(), path)
+        build_binary_index(path)
+        for row in benchmark_binary_index(path, k=10, num_queries=50):
+            print(f"rescore={row['rescore']} oversample={row['oversample']} "
+                  f"recall@10={row['recall@10']:.3f} 内存 {row['binary_mb']:.2f}MB vs {row['full_mb']:.2f}MB")
+
+if __name__ == '__main__':
+    main()
@@ -87,22 +87,11 @@ def analyze_data_quality():
     db_manager = VectorDatabaseManager()
     db_manager.initialize_collection()
     
-    # 获取所有数据进行分析
-    all_results = db_manager.query_database("", n_results=50)  # 获取更多数据
-    
-    # 统计关系类型
-    relation_counts = {}
-    schema_counts = {}
-    
-    for result in all_results:
-        triple = result['triple']
-        schema = result['schema']
-        
-        rel = triple[1]
-        rel_type = schema[1]
-        
-        relation_counts[rel] = relation_counts.get(rel, 0) + 1
-        schema_counts[rel_type] = schema_counts.get(rel_type, 0) + 1
+    # 关系分布使用入库时维护的语料统计（覆盖全部数据，无需全量读取）
+    stats = db_manager.get_database_stats(include_corpus_stats=True)
+    corpus_stats = stats.get('corpus_stats', {})
+    relation_counts = corpus_stats.get('relations', {})
+    schema_counts = corpus_stats.get('rel_types', {})
     
     print(f"🔗 关系类型分布 (Top 10):")
     sorted_relations = sorted(relation_counts.items(), key=lambda x: x[1], reverse=True)
@@ -116,6 +105,7 @@ def analyze_data_quality():
     
     # 检查是否有Belgium的leader信息
     print(f"\n🔍 专项检查:")
+    all_results = db_manager.query_database("", n_results=50)
     
     belgium_leader_found = False
     amsterdam_location_found = False
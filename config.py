@@ -8,6 +8,16 @@ EMBEDDING_MODEL = "BAAI/bge-m3"
 
 # --- OpenAI API Configuration (for QA generation) ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+LLM_CACHE_ENABLED = True  # 是否持久化缓存LLM响应（按模型、消息、温度和最大token数）
+LLM_CACHE_FILE = os.path.join("evaluation", "llm_response_cache.db")  # LLM响应缓存的SQLite文件
+LLM_CACHE_MAX_ENTRIES = 50000  # 缓存条目上限，超出时淘汰最久未使用的条目
+LLM_CACHE_DEFAULT_POLICY = "deterministic"  # 未单独配置的调用方: 只缓存temperature=0的调用
+LLM_CACHE_POLICIES = {  # 各调用方的缓存策略: 'always'、'deterministic'、'refresh' 或 'off'
+    "cotkr_answer_extraction": "deterministic",
+    "pure_llm_evaluation": "always",  # 纯LLM基线用于对比评估，重复运行复用同一回答
+    "text_qa_generation": "off",  # QA生成需要多样性，不缓存
+    "enhanced_qa_generation": "off"
+}
 
 # --- Data and Database Paths ---
 # 只使用train数据集进行向量数据库嵌入
@@ -22,13 +32,54 @@ DEV_DATASET_PATH = r"D:\dataset\train"
 CHROMA_DB_PATH = r"D:\dataset\chroma_data\new_system_db" 
 COLLECTION_NAME = f"new_kg_system_{EMBEDDING_MODEL.replace('/', '_')}"
 ENHANCED_COLLECTION_NAME = f"enhanced_kg_system_{EMBEDDING_MODEL.replace('/', '_')}"
+HNSW_SETTINGS_FILE = os.path.join(CHROMA_DB_PATH, "hnsw_settings.json")  # hnsw_tuner.py选出的HNSW参数
+COLLECTION_ALIASES_FILE = os.path.join(CHROMA_DB_PATH, "collection_aliases.json")  # 集合别名 -> 实际集合 (reindex.py切换)
+SNAPSHOT_DIR = "snapshots"  # 可内存映射的索引快照目录 (index_snapshot.py)
+SHARDED_COLLECTIONS = False  # 是否按领域（来源文件）分片存储集合
+SHARD_ROUTING_TOP_N = 2  # 分片路由时按质心相似度选取的分片数（实体命中的分片额外加入）
+REDUCED_SEARCH_OVERSAMPLE = 4  # 降维检索的候选扩充倍数（候选数 = n_results * oversample）
+PARALLEL_SEARCH_WORKERS = 0  # 多进程分区检索的工作进程数，0表示使用全部CPU核心
+BINARY_SEARCH_OVERSAMPLE = 10  # 二值量化检索的候选扩充倍数（Hamming预筛选候选数 = n_results * oversample）
+IVF_NPROBE = 16  # IVF-PQ检索时探测的倒排列表数
+IVF_RERANK_OVERSAMPLE = 4  # IVF-PQ精确重打分的候选扩充倍数
+REINDEX_SPOT_CHECK_SIZE = 50  # 影子集合切换前抽查的条目数
+REINDEX_MIN_RECALL = 0.95  # 影子集合抽查的最低自检索召回率，低于该值不切换别名
 
 # --- Enhanced System Configuration ---
 RERANKING_ENABLED = True
 RERANK_TOP_K_MULTIPLIER = 4  # 第一阶段检索数量 = n_results * multiplier
+ADAPTIVE_STAGE1_DEPTH = False  # 是否根据第一阶段分数分布自适应决定候选数量（上限为 n_results * RERANK_TOP_K_MULTIPLIER）
+ADAPTIVE_INITIAL_MULTIPLIER = 2  # 自适应模式的初始候选数 = n_results * multiplier，模糊时逐次翻倍
+ADAPTIVE_MIN_TOP_GAP = 0.05  # Top-1与Top-2相似度差低于该值视为模糊
+ADAPTIVE_MAX_ENTROPY = 0.9  # 第一阶段分数的归一化熵高于该值视为模糊
+ADAPTIVE_SCORE_TEMPERATURE = 0.05  # 计算分数熵时softmax的温度
+RERANK_MODEL_NAME = "BAAI/bge-reranker-base"  # Cross-Encoder重排模型
+RERANK_MAX_LENGTH = 512
+RERANK_BATCH_SIZE = 64  # 批量重排时每次推理的句子对数量
+RERANK_METHOD = "cross_encoder"  # 增强检索引擎的重排方法: 'original'、'cross_encoder' 或 'cascade'
+CASCADE_RERANK_SURVIVORS = 0  # 级联重排中进入Cross-Encoder的候选数M，0表示按启发式分数差自适应
+CASCADE_SCORE_MARGIN = 0.15  # 自适应M：保留启发式分数与最高分相差不超过该值的候选
+CASCADE_MIN_SURVIVORS = 8  # 自适应M的下限（同时不小于n_results）
+RERANK_RUNTIME = "pytorch"  # 重排推理后端: 'pytorch' (sentence-transformers) 或 'onnx' (onnxruntime)
+ONNX_RERANK_MODEL_DIR = "models/bge-reranker-base-onnx"  # onnx_reranker.py导出的模型目录
+ONNX_RERANK_MAX_LENGTH = 128  # 三元组文档很短，ONNX推理使用较小的最大序列长度
+ONNX_RERANK_THREADS = 0  # onnxruntime的intra-op线程数，0表示使用全部CPU核心
+RERANK_CACHE_ENABLED = True  # 是否缓存Cross-Encoder分数（按模型、归一化查询和文档）
+RERANK_CACHE_SIZE = 100000  # 内存LRU缓存的最大条目数
+RERANK_CACHE_PERSIST = False  # 是否同时把分数持久化到磁盘（跨运行复用）
+RERANK_CACHE_FILE = os.path.join("evaluation", "rerank_score_cache.db")  # 持久化分数缓存的SQLite文件
+RERANK_PRETOKENIZE = True  # 缓存文档token id，每次请求只对查询分词并直接拼装模型输入
+RERANK_TOKEN_CACHE_SIZE = 200000  # 文档token缓存的最大文档数
+RERANK_SERVICE_ENABLED = False  # 是否优先使用共享重排服务（reranker_service.py），连接失败时回退到进程内模型
+RERANK_SERVICE_ADDRESS = "/tmp/kg_rag_reranker.sock"  # 重排服务的Unix socket路径
+RERANK_SERVICE_BATCH_WINDOW_MS = 10  # 服务端合并各客户端请求的等待窗口（毫秒）
+RERANK_SERVICE_MAX_BATCH_PAIRS = 256  # 服务端每批最多合并的句子对数
+RERANK_SERVICE_AUTHKEY = os.getenv("RERANK_SERVICE_AUTHKEY")  # 服务连接认证密钥，未设置时使用下面的密钥文件
+RERANK_SERVICE_AUTHKEY_FILE = os.path.expanduser("~/.kg_rag_reranker.key")  # 密钥文件（权限0600，服务首次启动时生成）
 
 # --- Processing Configuration ---
 BATCH_SIZE = 32
+DEDUPLICATE_TRIPLES = True  # 入库时相同的嵌入文本只嵌入一次，来源条目保存在元数据中
 
 # --- Logging Configuration ---
 EMBEDDING_LOG_FILE = "new_system_embedding_log.txt"
@@ -45,4 +96,11 @@ SAVE_SUMMARY_CHARTS = True    # 是否保存图表
 
 # --- CoTKR Configuration ---
 COTKR_TEMPERATURE = 0.3
-COTKR_MAX_TOKENS = 1024
\ No newline at end of file
+COTKR_MAX_TOKENS = 1024
+COTKR_BATCH_EXTRACTION = True  # 批量检索时把多个问题的答案提取合并到一次LLM请求
+COTKR_EXTRACTION_BATCH_SIZE = 8  # 每次批量答案提取请求包含的问题数
+
+# --- Question Type Router Configuration ---
+QUESTION_ROUTER_ENABLED = True  # 有质心文件时用查询嵌入判断问题类型，否则使用关键词规则
+QUESTION_ROUTER_FILE = os.path.join("models", "question_type_centroids.npz")  # question_router.py拟合的质心文件
+QUESTION_ROUTER_MIN_MARGIN = 0.02  # 最高与次高质心相似度的最小差值，低于该值回退到关键词规则
@@ -0,0 +1,163 @@
+# corpus_stats.py - 语料统计（入库时增量维护，避免全量collection.get()扫描）
+
+import json
+from collections import Counter
+from pathlib import Path
+from typing import List, Dict, Optional
+import config
+
+# 每种关系保留的样例条目数量
+SAMPLES_PER_RELATION = 5
+# 回退扫描时每页读取的条目数
+SCAN_PAGE_SIZE = 1000
+
+class CorpusStats:
+    """
+    集合的语料统计：关系直方图、实体频率、类型计数和每种关系的样例
+
+    统计在入库时随每个批次增量更新，并以JSON文件保存在集合旁边
+    """
+
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+        self.total_entries = 0
+        self.relations = Counter()
+        self.entities = Counter()
+        self.sub_types = Counter()
+        self.rel_types = Counter()
+        self.obj_types = Counter()
+        self.relation_samples: Dict[str, List[Dict]] = {}
+
+    def update(self, ids: List[str], metadatas: List[Dict]):
+        """用一个已写入集合的批次更新统计"""
+        for entry_id, metadata in zip(ids, metadatas):
+            rel = metadata.get('rel', 'unknown')
+            sub = metadata.get('sub', 'unknown')
+            obj = metadata.get('obj', 'unknown')
+
+            self.total_entries += 1
+            self.relations[rel] += 1
+            self.entities[sub] += 1
+            self.entities[obj] += 1
+            self.sub_types[metadata.get('sub_type', 'unknown')] += 1
+            self.rel_types[metadata.get('rel_type', 'unknown')] += 1
+            self.obj_types[metadata.get('obj_type', 'unknown')] += 1
+
+            samples = self.relation_samples.setdefault(rel, [])
+            if len(samples) < SAMPLES_PER_RELATION:
+                samples.append({
+                    'id': entry_id,
+                    'sub': sub,
+                    'obj': obj,
+                    'sub_type': metadata.get('sub_type', ''),
+                    'obj_type': metadata.get('obj_type', '')
+                })
+
+    def to_dict(self) -> Dict:
+        return {
+            'collection_name': self.collection_name,
+            'total_entries': self.total_entries,
+            'relations': dict(self.relations),
+            'entities': dict(self.entities),
+            'sub_types': dict(self.sub_types),
+            'rel_types': dict(self.rel_types),
+            'obj_types': dict(self.obj_types),
+            'relation_samples': self.relation_samples
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CorpusStats':
+        stats = cls(data['collection_name'])
+        stats.total_entries = data.get('total_entries', 0)
+        stats.relations = Counter(data.get('relations', {}))
+        stats.entities = Counter(data.get('entities', {}))
+        stats.sub_types = Counter(data.get('sub_types', {}))
+        stats.rel_types = Counter(data.get('rel_types', {}))
+        stats.obj_types = Counter(data.get('obj_types', {}))
+        stats.relation_samples = data.get('relation_samples', {})
+        return stats
+
+    def save(self, path: Optional[str] = None):
+        path = Path(path or stats_path(self.collection_name))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, collection_name: str) -> Optional['CorpusStats']:
+        """读取保存的统计，文件不存在或损坏时返回None"""
+        path = Path(stats_path(collection_name))
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except (IOError, ValueError, KeyError) as e:
+            print(f"⚠️ 语料统计文件读取失败: {e}")
+            return None
+
+    @classmethod
+    def scan_collection(cls, collection, page_size: int = SCAN_PAGE_SIZE) -> 'CorpusStats':
+        """回退方案：分页流式扫描集合的元数据重建统计"""
+        stats = cls(collection.name)
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(limit=page_size, offset=offset, include=['metadatas'])
+            if not page or not page['ids']:
+                break
+            stats.update(page['ids'], page['metadatas'])
+        return stats
+
+def stats_path(collection_name: str) -> str:
+    """统计文件路径：与集合保存在同一个数据库目录下"""
+    return str(Path(config.CHROMA_DB_PATH) / f"{collection_name}_corpus_stats.json")
+
+def delete_corpus_stats(collection_name: str):
+    """删除集合的统计文件（重置集合时调用）"""
+    path = Path(stats_path(collection_name))
+    if path.exists():
+        path.unlink()
+
+def get_corpus_stats(collection, rebuild: bool = False) -> CorpusStats:
+    """
+    获取集合的语料统计
+
+    优先读取入库时维护的统计文件；文件缺失或条目数与集合不一致时，
+    通过分页扫描重建并保存
+    """
+    stats = None if rebuild else CorpusStats.load(collection.name)
+    if stats is not None and stats.total_entries == collection.count():
+        return stats
+
+    print(f"🔄 语料统计缺失或已过期，分页扫描集合重建: {collection.name}")
+    stats = CorpusStats.scan_collection(collection)
+    try:
+        stats.save()
+    except IOError as e:
+        print(f"⚠️ 语料统计保存失败: {e}")
+    return stats
+
+# 测试函数
+def test_corpus_stats():
+    """测试语料统计的增量更新和序列化"""
+    stats = CorpusStats("mock_collection")
+    stats.update(
+        ['1', '2', '3'],
+        [
+            {'sub': 'Belgium', 'rel': 'leader', 'obj': 'Philippe_of_Belgium',
+             'sub_type': 'Country', 'rel_type': 'leader', 'obj_type': 'Royalty'},
+            {'sub': 'Belgium', 'rel': 'capital', 'obj': 'Brussels',
+             'sub_type': 'Country', 'rel_type': 'capital', 'obj_type': 'City'},
+            {'sub': 'Brussels_Airport', 'rel': 'location', 'obj': 'Belgium',
+             'sub_type': 'Airport', 'rel_type': 'location', 'obj_type': 'Country'}
+        ]
+    )
+
+    restored = CorpusStats.from_dict(stats.to_dict())
+    print(f"总条目数: {restored.total_entries}")
+    print(f"关系分布: {restored.relations.most_common()}")
+    print(f"实体频率: {restored.entities.most_common(3)}")
+    print(f"leader样例: {restored.relation_samples['leader']}")
+
+if __name__ == '__main__':
+    test_corpus_stats()
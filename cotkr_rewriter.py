@@ -1,9 +1,11 @@
 # cotkr_rewriter.py - CoTKR知识重写器
 
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterator
+import json
 import re
 import config
-from openai import OpenAI
+from llm_gateway import chat_completion, stream_chat_completion
+from question_router import get_question_router
 
 class CoTKRRewriter:
     """CoTKR知识重写器 - 基于思维链的知识重写"""
@@ -31,8 +33,23 @@ class CoTKRRewriter:
             ]
         }
     
-    def detect_question_type(self, question: str) -> str:
-        """检测问题类型 - 支持四种特定类型"""
+    def detect_question_type(self, question: str, query_embedding: List[float] = None) -> str:
+        """
+        检测问题类型 - 支持四种特定类型
+        
+        传入检索时已计算的查询嵌入且存在问题类型质心时，按最近质心判断；
+        置信度不足或没有嵌入时使用关键词规则
+        """
+        if query_embedding is not None:
+            router = get_question_router()
+            if router is not None:
+                question_type = router.classify(query_embedding)
+                if question_type:
+                    return question_type
+        return self._keyword_question_type(question)
+    
+    def _keyword_question_type(self, question: str) -> str:
+        """关键词规则判断问题类型"""
         question_lower = question.lower()
         
         # 优先检查relationship类型（因为它的模式比较特殊）
@@ -57,7 +74,8 @@ class CoTKRRewriter:
         # 默认返回subject类型
         return 'subject'
     
-    def rewrite_knowledge(self, retrieved_items: List[Dict], question: str, prompt_type: str = None) -> str:
+    def rewrite_knowledge(self, retrieved_items: List[Dict], question: str, prompt_type: str = None,
+                          question_type: str = None) -> str:
         """
         使用CoTKR方法重写知识
         根据四种问题类型生成相应的思维链推理
@@ -66,6 +84,7 @@ class CoTKRRewriter:
             retrieved_items: 检索到的项目列表
             question: 查询问题或文本
             prompt_type: 问题类型 ('sub', 'obj', 'rel', 'type')，如果提供则直接使用，不进行检测
+            question_type: 调用方已检测出的内部问题类型（避免重复检测）
         """
         if not retrieved_items:
             return "No relevant information found."
@@ -80,7 +99,7 @@ class CoTKRRewriter:
                 'type': 'type'
             }
             question_type = type_mapping.get(prompt_type, 'subject')
-        else:
+        elif not question_type:
             # 否则检测问题类型
             question_type = self.detect_question_type(question)
         
@@ -317,7 +336,71 @@ class CoTKRRewriter:
         if not retrieved_items:
             return "Information not available in the knowledge base."
         
-        # 1. 构建一个新的、清晰的Prompt，要求LLM根据生成的"思维链"来回答问题
+        # 调用LLM来生成答案（Prompt见 _extraction_messages）
+        try:
+            if not config.OPENAI_API_KEY or config.OPENAI_API_KEY == "your-openai-api-key-here":
+                print("⚠️ OpenAI API key not set. Falling back to simple extraction.")
+                # 如果没有API密钥，回退到简单的规则式提取
+                return self._fallback_extraction(question, retrieved_items, prompt_type)
+            
+            # 经共享网关调用：复用客户端，0温度的相同请求直接命中响应缓存
+            final_answer = chat_completion(
+                model="gpt-3.5-turbo",
+                messages=self._extraction_messages(question, cotkr_knowledge),
+                temperature=0.0,  # 使用0温度，让答案更具确定性
+                max_tokens=60,    # 答案通常很短，不需要太多token
+                caller="cotkr_answer_extraction"
+            ).strip()
+            return final_answer
+            
+        except Exception as e:
+            print(f"❌ LLM-based answer extraction failed: {e}")
+            # 如果API调用失败，回退到简单的规则式提取
+            return self._fallback_extraction(question, retrieved_items, prompt_type)
+    
+    def stream_answer_from_knowledge(self, question: str, cotkr_knowledge: str, retrieved_items: List[Dict],
+                                     prompt_type: str = None) -> Iterator[str]:
+        """
+        流式版本的 extract_answer_from_knowledge：LLM生成的答案片段一到达就产出
+        
+        没有API密钥或在第一个片段之前失败时，产出规则式提取的完整答案
+        """
+        if not retrieved_items:
+            yield "Information not available in the knowledge base."
+            return
+        
+        if not config.OPENAI_API_KEY or config.OPENAI_API_KEY == "your-openai-api-key-here":
+            print("⚠️ OpenAI API key not set. Falling back to simple extraction.")
+            yield self._fallback_extraction(question, retrieved_items, prompt_type)
+            return
+        
+        started = False
+        try:
+            for delta in stream_chat_completion(
+                model="gpt-3.5-turbo",
+                messages=self._extraction_messages(question, cotkr_knowledge),
+                temperature=0.0,
+                max_tokens=60,
+                caller="cotkr_answer_extraction"
+            ):
+                # 去掉答案开头的空白，与非流式版本的strip()一致
+                if not started:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                    started = True
+                yield delta
+        except Exception as e:
+            print(f"❌ LLM-based answer extraction failed: {e}")
+            if started:
+                return
+        
+        if not started:
+            yield self._fallback_extraction(question, retrieved_items, prompt_type)
+    
+    def _extraction_messages(self, question: str, cotkr_knowledge: str) -> List[Dict]:
+        """答案提取请求的消息：要求LLM只根据"思维链"回答问题"""
+        # 构建一个新的、清晰的Prompt，要求LLM根据生成的"思维链"来回答问题
         prompt = f"""You are an intelligent assistant. Your task is to provide a direct and concise answer to the user's question based *only* on the provided "Reasoning Steps".
 
 User's Question:
@@ -332,39 +415,147 @@ Based on the reasoning steps above, what is the final answer to the question?
 Provide only the answer itself, without any extra explanation.
 
 Final Answer:"""
+        
+        return [
+            {
+                "role": "system", 
+                "content": "You are a helpful assistant that provides a final, concise answer based on the reasoning context provided."
+            },
+            {
+                "role": "user", 
+                "content": prompt
+            }
+        ]
+    
+    def extract_answers_batch(self, extraction_items: List[Tuple[str, str, List[Dict], Optional[str]]],
+                              batch_size: int = None) -> List[str]:
+        """
+        批量答案提取：每K个问题及其推理步骤打包成一个请求，要求LLM按问题编号返回JSON
 
-        # 2. 调用LLM来生成答案
-        try:
-            if not config.OPENAI_API_KEY or config.OPENAI_API_KEY == "your-openai-api-key-here":
-                print("⚠️ OpenAI API key not set. Falling back to simple extraction.")
-                # 如果没有API密钥，回退到简单的规则式提取
-                return self._fallback_extraction(question, retrieved_items, prompt_type)
-            
-            client = OpenAI(api_key=config.OPENAI_API_KEY)
-            
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a helpful assistant that provides a final, concise answer based on the reasoning context provided."
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                temperature=0.0,  # 使用0温度，让答案更具确定性
-                max_tokens=60     # 答案通常很短，不需要太多token
-            )
+        Args:
+            extraction_items: [(问题, CoTKR知识, 检索项目, prompt_type), ...]
+            batch_size: 每个请求包含的问题数，默认使用config.COTKR_EXTRACTION_BATCH_SIZE
+
+        Returns:
+            与输入一一对应的答案；某个问题没有解析出答案时单独回退到规则式提取
+        """
+        batch_size = batch_size or config.COTKR_EXTRACTION_BATCH_SIZE
+        answers = [None] * len(extraction_items)
+        
+        # 没有检索结果的问题不需要请求LLM
+        pending = []
+        for i, (question, cotkr_knowledge, retrieved_items, prompt_type) in enumerate(extraction_items):
+            if retrieved_items:
+                pending.append(i)
+            else:
+                answers[i] = "Information not available in the knowledge base."
+        
+        if not config.OPENAI_API_KEY or config.OPENAI_API_KEY == "your-openai-api-key-here":
+            print("⚠️ OpenAI API key not set. Falling back to simple extraction.")
+            for i in pending:
+                question, _, retrieved_items, prompt_type = extraction_items[i]
+                answers[i] = self._fallback_extraction(question, retrieved_items, prompt_type)
+            return answers
+        
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            if len(chunk) == 1:
+                # 单个问题沿用原有请求（与逐条调用共享响应缓存）
+                answers[chunk[0]] = self.extract_answer_from_knowledge(*extraction_items[chunk[0]])
+                continue
             
-            final_answer = response.choices[0].message.content.strip()
-            return final_answer
+            parsed = {}
+            try:
+                parsed = self._request_batch_answers([extraction_items[i] for i in chunk])
+            except Exception as e:
+                print(f"❌ Batched answer extraction failed: {e}")
             
-        except Exception as e:
-            print(f"❌ LLM-based answer extraction failed: {e}")
-            # 如果API调用失败，回退到简单的规则式提取
-            return self._fallback_extraction(question, retrieved_items, prompt_type)
+            for position, i in enumerate(chunk, 1):
+                answer = parsed.get(position)
+                if not answer:
+                    question, _, retrieved_items, prompt_type = extraction_items[i]
+                    answer = self._fallback_extraction(question, retrieved_items, prompt_type)
+                answers[i] = answer
+        
+        return answers
+    
+    def _request_batch_answers(self, chunk: List[Tuple[str, str, List[Dict], Optional[str]]]) -> Dict[int, str]:
+        """发送一次批量答案提取请求，返回 {问题编号(从1开始): 答案}"""
+        blocks = []
+        for index, (question, cotkr_knowledge, _, _) in enumerate(chunk, 1):
+            blocks.append(f"""### Question {index}
+"{question}"
+
+Reasoning Steps:
+---
+{cotkr_knowledge}
+---""")
+        questions_text = "\n\n".join(blocks)
+        
+        prompt = f"""You are an intelligent assistant. For each numbered question below, provide a direct and concise answer based *only* on that question's "Reasoning Steps".
+
+{questions_text}
+
+Return a single JSON object mapping each question number to its final answer, for example {{"1": "answer", "2": "answer"}}.
+Provide only the answers themselves, without any extra explanation.
+
+JSON:"""
+        
+        content = chat_completion(
+            model="gpt-3.5-turbo",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are a helpful assistant that provides final, concise answers based on the reasoning context provided. Reply with JSON only."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.0,
+            max_tokens=60 * len(chunk) + 20,  # 每个答案保持与单条请求相同的token预算
+            caller="cotkr_answer_extraction"
+        )
+        return self._parse_batch_answers(content, len(chunk))
+    
+    def _parse_batch_answers(self, content: str, count: int) -> Dict[int, str]:
+        """
+        解析批量提取的回复：优先按JSON解析（允许代码块包裹或列表形式），
+        失败时按 "1: answer" / "1. answer" 逐行解析
+        """
+        text = content.strip()
+        data = None
+        for left, right in ((text.find('{'), text.rfind('}')), (text.find('['), text.rfind(']'))):
+            if 0 <= left < right:
+                try:
+                    data = json.loads(text[left:right + 1])
+                    break
+                except json.JSONDecodeError:
+                    continue
+        
+        if isinstance(data, dict):
+            items = list(data.items())
+        elif isinstance(data, list):
+            items = list(enumerate(data, 1))
+        else:
+            items = []
+            for line in text.splitlines():
+                match = re.match(r'^\s*(?:Question\s*)?"?(\d+)"?\s*[:.)\-]\s*(.+?)\s*,?$', line)
+                if match:
+                    items.append((match.group(1), match.group(2).strip('"')))
+        
+        answers = {}
+        for key, value in items:
+            if isinstance(value, dict):
+                value = value.get('answer', '')
+            try:
+                index = int(str(key).strip())
+            except ValueError:
+                continue
+            if 1 <= index <= count and value is not None and str(value).strip():
+                answers[index] = str(value).strip()
+        return answers
     
     def _fallback_extraction(self, question: str, retrieved_items: List[Dict], prompt_type: str = None) -> str:
         """回退方案：简单的规则式答案提取"""
@@ -13,35 +13,20 @@ def analyze_database_content():
     db_manager = EnhancedVectorDatabaseManager()
     db_manager.initialize_collection()
     
-    # 获取数据库中的所有数据
-    all_data = db_manager.collection.get()
+    # 使用入库时维护的语料统计（关系直方图和每种关系的样例），无需读取全部数据
+    stats = db_manager.get_database_stats(include_corpus_stats=True)
+    corpus_stats = stats.get('corpus_stats')
     
-    if not all_data or not all_data['metadatas']:
+    if not corpus_stats or not corpus_stats['total_entries']:
         print("❌ 数据库为空")
         return []
     
-    # 分析不同类型的关系
-    relations = {}
-    for metadata in all_data['metadatas']:
-        rel = metadata.get('rel', '')
-        sub = metadata.get('sub', '')
-        obj = metadata.get('obj', '')
-        sub_type = metadata.get('sub_type', '')
-        obj_type = metadata.get('obj_type', '')
-        
-        if rel not in relations:
-            relations[rel] = []
-        
-        relations[rel].append({
-            'sub': sub,
-            'obj': obj,
-            'sub_type': sub_type,
-            'obj_type': obj_type
-        })
+    relations = corpus_stats['relation_samples']
+    relation_counts = corpus_stats['relations']
     
     print(f"📊 发现 {len(relations)} 种关系类型:")
-    for rel, items in relations.items():
-        print(f"  - {rel}: {len(items)} 条记录")
+    for rel, count in relation_counts.items():
+        print(f"  - {rel}: {count} 条记录")
     
     # 生成基于实际数据的测试问题
     test_questions = []
@@ -1,10 +1,11 @@
 # data_loader.py - 数据加载器
 
 import os
+import json
 import xml.etree.ElementTree as ET
 from pathlib import Path
 from tqdm import tqdm
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Callable
 import config
 
 class KnowledgeDataLoader:
@@ -99,6 +100,57 @@ class KnowledgeDataLoader:
         """获取知识条目（用于向量化）"""
         return self.load_all_knowledge_entries()
 
+def group_entries_by_document(knowledge_entries: List[Dict],
+                              to_document: Callable[[tuple, tuple], str]) -> List[Tuple[str, List[Dict]]]:
+    """
+    按嵌入文本对知识条目去重分组
+    
+    同一个三元组经常出现在多个XML条目中，这里让每个唯一的嵌入文本只保留一组，
+    组内按出现顺序保存所有来源条目
+    
+    Args:
+        knowledge_entries: 知识条目列表
+        to_document: 由(triple, schema)生成嵌入文本的函数
+    
+    Returns:
+        [(嵌入文本, [来源条目, ...]), ...]，保持首次出现的顺序
+    """
+    groups = {}
+    for entry in knowledge_entries:
+        document = to_document(entry["triple"], entry["schema"])
+        groups.setdefault(document, []).append(entry)
+    return list(groups.items())
+
+def build_provenance_metadata(group: List[Dict]) -> Dict:
+    """
+    生成去重后条目的来源信息元数据
+    
+    ChromaDB的元数据只支持标量值，列表以JSON字符串保存，可用parse_provenance还原
+    """
+    return {
+        "source_ids": json.dumps([entry["id"] for entry in group], ensure_ascii=False),
+        "source_texts": json.dumps([entry.get("text", "") for entry in group], ensure_ascii=False),
+        "source_files": json.dumps(list(dict.fromkeys(entry.get("source_file", "") for entry in group)),
+                                   ensure_ascii=False),
+        "duplicate_count": len(group)
+    }
+
+def parse_provenance(metadata: Dict) -> Dict:
+    """从元数据中还原来源条目ID、文本、文件列表和重复次数（未去重的旧数据返回单个来源）"""
+    if "source_ids" not in metadata:
+        return {
+            "source_ids": [],
+            "source_texts": [metadata.get("text", "")],
+            "source_files": [metadata.get("source_file", "")],
+            "duplicate_count": 1
+        }
+    return {
+        "source_ids": json.loads(metadata["source_ids"]),
+        "source_texts": json.loads(metadata.get("source_texts", "[]")),
+        "source_files": json.loads(metadata.get("source_files", "[]")),
+        "duplicate_count": metadata.get("duplicate_count", 1)
+    }
+
 # 测试函数
 def test_data_loader():
     """测试数据加载器"""
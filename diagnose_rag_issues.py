@@ -187,25 +187,16 @@ class RAGDiagnostics:
         print("-" * 30)
         
         try:
-            # 获取数据库统计
-            stats = self.db_manager.get_database_stats()
+            # 获取数据库统计（包含入库时维护的语料统计）
+            stats = self.db_manager.get_database_stats(include_corpus_stats=True)
             print(f"   总文档数: {stats['total_documents']}")
             print(f"   集合状态: {stats['status']}")
             
             # 检查关系类型分布
-            all_data = self.db_manager.collection.get()
-            if all_data and all_data['metadatas']:
-                relations = Counter()
-                entities = Counter()
-                
-                for metadata in all_data['metadatas']:
-                    rel = metadata.get('rel', 'unknown')
-                    sub = metadata.get('sub', 'unknown')
-                    obj = metadata.get('obj', 'unknown')
-                    
-                    relations[rel] += 1
-                    entities[sub] += 1
-                    entities[obj] += 1
+            corpus_stats = stats.get('corpus_stats')
+            if corpus_stats:
+                relations = Counter(corpus_stats['relations'])
+                entities = Counter(corpus_stats['entities'])
                 
                 print(f"\n   关系类型分布 (Top 10):")
                 for rel, count in relations.most_common(10):
@@ -1,61 +1,291 @@
 # enhanced_embedding_system.py - 增强的嵌入系统
 
-import chromadb
 from typing import List, Dict, Optional, Tuple
 from tqdm import tqdm
 import config
-from data_loader import KnowledgeDataLoader
-from embedding_client import EmbeddingClient
+from data_loader import KnowledgeDataLoader, group_entries_by_document, build_provenance_metadata, parse_provenance
+from corpus_stats import CorpusStats, delete_corpus_stats, get_corpus_stats
+from shared_resources import (get_chroma_client, get_embedding_client, get_or_create_collection, get_rerank_model,
+                              get_onnx_rerank_model, resolve_collection_alias, get_alias_version)
+from sharded_collection import ShardedCollection, collection_query
+from batch_reranker import rerank_groups
+from rerank_cache import cached_rerank_scores
+from pretokenized_reranker import get_pretokenized_scorer
+from reranker_service import RerankerServiceClient, connect_reranker_service
+from heuristic_features import score_candidates, encode_features, WEIGHTS as HEURISTIC_WEIGHTS
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 
-# 新增：导入sentence-transformers的CrossEncoder
-try:
-    from sentence_transformers import CrossEncoder
-    CROSS_ENCODER_AVAILABLE = True
-except ImportError:
-    print("⚠️ sentence-transformers未安装，将使用原有的重排方法")
-    CROSS_ENCODER_AVAILABLE = False
+def stage1_score_ambiguity(scores: List[float]) -> Dict:
+    """
+    判断第一阶段分数分布是否模糊
+    
+    - top_gap: Top-1与Top-2的相似度差
+    - entropy: softmax(分数 / 温度) 的归一化熵，越接近1分布越平
+    Top-1领先幅度足够且分布不平坦时视为明确的查询
+    """
+    if len(scores) < 2:
+        return {'top_gap': 1.0, 'entropy': 0.0, 'ambiguous': False}
+    
+    ordered = np.sort(np.asarray(scores, dtype=np.float64))[::-1]
+    top_gap = float(ordered[0] - ordered[1])
+    logits = (ordered - ordered[0]) / config.ADAPTIVE_SCORE_TEMPERATURE
+    probabilities = np.exp(logits) / np.exp(logits).sum()
+    entropy = float(-(probabilities * np.log(probabilities + 1e-12)).sum() / np.log(len(ordered)))
+    
+    ambiguous = top_gap < config.ADAPTIVE_MIN_TOP_GAP or entropy > config.ADAPTIVE_MAX_ENTROPY
+    return {'top_gap': top_gap, 'entropy': entropy, 'ambiguous': ambiguous}
 
 class EnhancedVectorDatabaseManager:
     """增强的向量数据库管理器 - 实现更好的嵌入策略和多阶段检索"""
     
+    QUERY_EMBEDDING_MEMORY = 256  # 记录的最近查询嵌入数
+    STAGE1_DEPTH_LOG_SIZE = 1000  # 记录的最近自适应深度数
+    
     def __init__(self):
-        self.client = chromadb.PersistentClient(path=config.CHROMA_DB_PATH)
+        # 使用进程级共享的客户端，避免多个引擎重复创建；第一次访问时才打开（使用快照时不打开）
+        self._client = None
         self.collection = None
-        self.embedding_client = EmbeddingClient()
+        self.collection_alias = None
+        self._alias_collection = None
+        self._alias_version = 0.0
+        # 最近查询的嵌入（按查询文本，有界）
+        self._query_embeddings = OrderedDict()
+        self.embedding_client = get_embedding_client()
+        
+        # Cross-Encoder重排模型在第一次需要时才加载（同一进程内共享一份），
+        # 不做Cross-Encoder重排的工具不必导入torch
+        self._rerank_model = None
+        self._rerank_load_attempted = False
+        self.rerank_model_name = config.RERANK_MODEL_NAME
+        
+        # 自适应第一阶段深度的记录（最近的查询，有界）
+        self.last_stage1_depth = None
+        self.stage1_depth_log = deque(maxlen=self.STAGE1_DEPTH_LOG_SIZE)
+        
+    @property
+    def client(self):
+        """ChromaDB客户端，第一次访问时打开"""
+        if self._client is None:
+            self._client = get_chroma_client(config.CHROMA_DB_PATH)
+        return self._client
+        
+    @property
+    def rerank_model(self):
+        """重排模型，第一次访问时加载；加载失败返回None（回退到原有重排方法）"""
+        if self._rerank_model is None and not self._rerank_load_attempted:
+            self._rerank_load_attempted = True
+            if config.RERANK_SERVICE_ENABLED and self.use_reranker_service():
+                return self._rerank_model
+            if config.RERANK_RUNTIME != 'onnx' or not self.use_onnx_reranker():
+                self._rerank_model = get_rerank_model(config.RERANK_MODEL_NAME, config.RERANK_MAX_LENGTH)
+        return self._rerank_model
+    
+    @rerank_model.setter
+    def rerank_model(self, model):
+        self._rerank_model = model
+        self._rerank_load_attempted = True
         
-        # 【新】初始化Cross-Encoder重排模型
-        self.rerank_model = None
-        if CROSS_ENCODER_AVAILABLE:
-            try:
-                print("🔄 加载Cross-Encoder重排模型...")
-                self.rerank_model = CrossEncoder('BAAI/bge-reranker-base', max_length=512)
-                print("✅ Cross-Encoder模型加载成功")
-            except Exception as e:
-                print(f"⚠️ Cross-Encoder模型加载失败: {e}")
-                self.rerank_model = None
+    def warm_up_reranker(self) -> bool:
+        """
+        预先加载重排模型并做一次推理（服务启动时调用，避免第一个请求承担加载延迟）
         
-    def initialize_collection(self, collection_name: str = None, reset: bool = False):
-        """初始化或重置集合"""
+        Returns:
+            重排模型是否可用
+        """
+        model = self.rerank_model
+        if model is None:
+            return False
+        model.predict([["warm up query", "warm up document"]])
+        return True
+        
+    def initialize_collection(self, collection_name: str = None, reset: bool = False,
+                              sharded: bool = None):
+        """
+        初始化或重置集合
+        
+        Args:
+            collection_name: 集合名称，默认为增强集合
+            reset: 是否删除现有集合
+            sharded: 是否使用按领域分片的集合，默认使用config.SHARDED_COLLECTIONS
+        """
         if collection_name is None:
             collection_name = config.COLLECTION_NAME + "_enhanced"
+        if sharded is None:
+            sharded = config.SHARDED_COLLECTIONS
+            
+        # 集合名可能是别名（reindex.py切换影子集合后指向新的实际集合）
+        physical_name = collection_name if sharded else resolve_collection_alias(collection_name)
             
         if reset and self.collection:
             try:
-                self.client.delete_collection(name=collection_name)
-                print(f"🗑 已删除现有集合: {collection_name}")
+                if isinstance(self.collection, ShardedCollection):
+                    self.collection.delete_all()
+                else:
+                    self.client.delete_collection(name=physical_name)
+                delete_corpus_stats(physical_name)
+                print(f"🗑 已删除现有集合: {physical_name}")
             except:
                 pass
         
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine"}
-        )
+        if sharded:
+            self.collection = ShardedCollection(self.client, collection_name)
+            self._alias_collection = None
+        else:
+            self.collection = get_or_create_collection(self.client, physical_name)
+            self.collection_alias = collection_name
+            self._alias_collection = self.collection
+            self._alias_version = get_alias_version()
         
-        print(f"✅ 增强集合初始化完成: {collection_name}")
+        print(f"✅ 增强集合初始化完成: {physical_name}")
         print(f"   - 当前文档数量: {self.collection.count()}")
         
+    def refresh_collection_alias(self):
+        """别名被切换后重新打开别名指向的集合（只对通过别名打开的ChromaDB集合生效）"""
+        if self.collection is None or self.collection is not self._alias_collection:
+            return
+        version = get_alias_version()
+        if version == self._alias_version:
+            return
+        self._alias_version = version
+        physical_name = resolve_collection_alias(self.collection_alias)
+        if physical_name != self.collection.name:
+            # 只打开已存在的集合；别名指向的集合不存在时继续使用当前集合，不新建空集合
+            try:
+                collection = self.client.get_collection(name=physical_name)
+            except Exception as e:
+                print(f"⚠️ 别名 {self.collection_alias} 指向的集合 {physical_name} 无法打开，继续使用 {self.collection.name}: {e}")
+                return
+            self.collection = collection
+            self._alias_collection = self.collection
+            print(f"🔀 集合别名已切换: {self.collection_alias} -> {physical_name}")
+        
+    def remember_query_embedding(self, query: str, embedding: List[float]):
+        """记录检索时计算的查询嵌入（问题类型路由等后续步骤直接复用）"""
+        self._query_embeddings[query] = embedding
+        self._query_embeddings.move_to_end(query)
+        while len(self._query_embeddings) > self.QUERY_EMBEDDING_MEMORY:
+            self._query_embeddings.popitem(last=False)
+    
+    def get_query_embedding(self, query: str) -> Optional[List[float]]:
+        """最近检索过的查询的嵌入，没有时返回None"""
+        return self._query_embeddings.get(query)
+        
+    def use_snapshot(self, snapshot_path: str):
+        """使用只读索引快照代替ChromaDB集合（快速启动，多进程共享内存页）"""
+        from index_snapshot import load_snapshot
+        self.close()
+        self.collection = load_snapshot(snapshot_path)
+        
+    def use_parallel_search(self, snapshot_path: str, num_workers: int = None):
+        """
+        使用多进程分区检索作为第一阶段（适用于单进程内存和单核算力不足的大索引）
+        
+        Args:
+            snapshot_path: 索引快照文件（由index_snapshot.py导出）
+            num_workers: 工作进程数，默认使用config.PARALLEL_SEARCH_WORKERS
+        """
+        from parallel_search import ParallelSearchCollection
+        self.close()
+        self.collection = ParallelSearchCollection(snapshot_path, num_workers=num_workers)
+        print(f"✅ 已启用多进程分区检索: {self.collection.name} "
+              f"({self.collection.count()} 条, {len(self.collection.partitions)} 个分区)")
+        
+    def close(self):
+        """释放当前集合持有的资源（如多进程分区检索的进程池），切换集合前自动调用"""
+        if hasattr(self.collection, 'close'):
+            self.collection.close()
+        
+    def use_reduced_index(self, snapshot_path: str, method: str = 'pca', target_dim: int = 256,
+                          oversample: int = None):
+        """
+        使用降维索引作为第一阶段：在降维向量上粗排，再用全精度向量重打分
+        
+        Args:
+            snapshot_path: 索引快照文件（需先用reduced_index.py构建降维索引）
+            method: 降维方法 ('pca' 或 'prefix')
+            target_dim: 降维后的维度
+            oversample: 候选扩充倍数，默认使用config.REDUCED_SEARCH_OVERSAMPLE
+        """
+        from reduced_index import ReducedDimensionCollection
+        self.close()
+        self.collection = ReducedDimensionCollection(snapshot_path, method, target_dim, oversample)
+        memory = self.collection.memory_stats()
+        print(f"✅ 已启用降维检索: {method} {target_dim}维, "
+              f"{memory['reduced_mb']:.1f}MB (全精度 {memory['full_mb']:.1f}MB)")
+        
+    def use_binary_index(self, snapshot_path: str, rescore: str = 'float32', oversample: int = None):
+        """
+        使用二值量化索引作为第一阶段：1-bit码Hamming预筛选，再对候选重打分
+        
+        Args:
+            snapshot_path: 索引快照文件（需先用binary_index.py构建二值码）
+            rescore: 重打分精度 ('float32' 或 'int8')
+            oversample: 候选扩充倍数，默认使用config.BINARY_SEARCH_OVERSAMPLE
+        """
+        from binary_index import BinaryQuantizedCollection
+        self.close()
+        self.collection = BinaryQuantizedCollection(snapshot_path, rescore, oversample)
+        memory = self.collection.memory_stats()
+        print(f"✅ 已启用二值量化检索: {rescore}重打分, "
+              f"{memory['binary_mb']:.1f}MB (全精度 {memory['full_mb']:.1f}MB)")
+        
+    def use_ivfpq_index(self, snapshot_path: str, nprobe: int = None, rerank: bool = True):
+        """
+        使用磁盘驻留的IVF-PQ索引作为第一阶段（语料大于内存时使用）
+        
+        Args:
+            snapshot_path: 索引快照文件（需先用ivfpq_index.py构建IVF-PQ索引）
+            nprobe: 探测的倒排列表数，默认使用config.IVF_NPROBE
+            rerank: 是否用快照中的全精度向量对PQ候选精确重打分
+        """
+        from ivfpq_index import IVFPQCollection
+        self.close()
+        self.collection = IVFPQCollection(snapshot_path, nprobe=nprobe, rerank=rerank)
+        memory = self.collection.memory_stats()
+        print(f"✅ 已启用IVF-PQ检索: nprobe={self.collection.nprobe}, "
+              f"PQ码 {memory['codes_mb']:.1f}MB (全精度 {memory['full_mb']:.1f}MB)")
+        
+    def use_onnx_reranker(self, model_dir: str = None, max_length: int = None,
+                          num_threads: int = None) -> bool:
+        """
+        使用ONNX / int8量化的Cross-Encoder作为重排模型（需先运行 onnx_reranker.py --export）
+        
+        Args:
+            model_dir: 导出的模型目录，默认使用config.ONNX_RERANK_MODEL_DIR
+            max_length: 最大序列长度，默认使用config.ONNX_RERANK_MAX_LENGTH
+            num_threads: intra-op线程数，默认使用config.ONNX_RERANK_THREADS
+        
+        Returns:
+            是否切换成功（失败时保留原有重排模型）
+        """
+        onnx_model = get_onnx_rerank_model(model_dir, max_length, num_threads)
+        if onnx_model is None:
+            return False
+        self.rerank_model = onnx_model
+        # int8模型的分数与PyTorch模型不同，分数缓存按模型文件区分
+        self.rerank_model_name = f"onnx:{onnx_model.model_path}"
+        return True
+        
+    def use_reranker_service(self, address: str = None) -> bool:
+        """
+        通过共享重排服务打分（需先运行 reranker_service.py），本进程不加载模型
+        
+        Args:
+            address: 服务的Unix socket路径，默认使用config.RERANK_SERVICE_ADDRESS
+        
+        Returns:
+            是否连接成功（失败时保留原有重排模型）
+        """
+        client, model_name = connect_reranker_service(address)
+        if client is None:
+            return False
+        self.rerank_model = client
+        # 与服务端模型同名，本地分数缓存与直接加载同一模型时通用
+        self.rerank_model_name = model_name
+        print(f"✅ 使用重排服务: {client.address} ({model_name})")
+        return True
+        
     def enhanced_triple_to_text(self, triple: tuple, schema: tuple) -> str:
         """
         增强的三元组到文本转换 - 使用更自然的模板句子
@@ -121,10 +351,23 @@ class EnhancedVectorDatabaseManager:
             "text": entry.get("text", "")
         }
         
+        # 启发式重排使用的词特征（入库时预计算，查询时无需再切分字符串）
+        metadata["heuristic_features"] = encode_features(metadata)
+        
         return metadata
     
-    def populate_enhanced_database(self, knowledge_entries: Optional[List[Dict]] = None):
-        """使用增强策略填充向量数据库"""
+    def populate_enhanced_database(self, knowledge_entries: Optional[List[Dict]] = None,
+                                   deduplicate: bool = None):
+        """
+        使用增强策略填充向量数据库
+        
+        Args:
+            knowledge_entries: 知识条目，默认从数据集加载
+            deduplicate: 是否按嵌入文本去重，默认使用config.DEDUPLICATE_TRIPLES
+        """
+        if deduplicate is None:
+            deduplicate = config.DEDUPLICATE_TRIPLES
+        
         if not self.collection:
             self.initialize_collection()
         
@@ -139,19 +382,33 @@ class EnhancedVectorDatabaseManager:
         
         print(f"🔄 开始填充增强数据库，共 {len(knowledge_entries)} 个条目")
         
-        # 准备数据
-        ids = [entry['id'] for entry in knowledge_entries]
+        # 准备数据：相同的嵌入文本只嵌入一次，所有来源条目记录为provenance
+        if deduplicate:
+            groups = group_entries_by_document(knowledge_entries, self.enhanced_triple_to_text)
+            print(f"🔁 去重后剩余 {len(groups)} 个唯一文本 (原始条目 {len(knowledge_entries)} 个)")
+        else:
+            groups = [(self.enhanced_triple_to_text(entry["triple"], entry["schema"]), [entry])
+                      for entry in knowledge_entries]
+        
+        ids = [group[0]['id'] for _, group in groups]
         
         # 使用增强的文本转换
-        documents = [self.enhanced_triple_to_text(entry["triple"], entry["schema"]) 
-                    for entry in knowledge_entries]
+        documents = [document for document, _ in groups]
         
         # 创建增强的元数据
-        metadatas = [self.create_enhanced_metadata(entry) for entry in knowledge_entries]
+        metadatas = []
+        for _, group in groups:
+            metadata = self.create_enhanced_metadata(group[0])
+            if deduplicate:
+                metadata.update(build_provenance_metadata(group))
+            metadatas.append(metadata)
         
         # 分批处理
         batch_size = config.BATCH_SIZE
         
+        # 语料统计随批次增量更新
+        corpus_stats = CorpusStats.load(self.collection.name) or CorpusStats(self.collection.name)
+        
         for i in tqdm(range(0, len(ids), batch_size), desc="增强嵌入处理"):
             batch_ids = ids[i:i+batch_size]
             batch_documents = documents[i:i+batch_size]
@@ -167,34 +424,54 @@ class EnhancedVectorDatabaseManager:
                     documents=batch_documents,
                     metadatas=batch_metadatas
                 )
+                corpus_stats.update(batch_ids, batch_metadatas)
             else:
                 print(f"⚠ 跳过批次 {i}，嵌入失败")
         
+        if isinstance(self.collection, ShardedCollection):
+            self.collection.save_router()
+        
+        # 统计与集合不一致（例如重复ID或外部写入）时重新扫描
+        if corpus_stats.total_entries == self.collection.count():
+            corpus_stats.save()
+        else:
+            get_corpus_stats(self.collection, rebuild=True)
+        
         print(f"✅ 增强数据库填充完成，总条目数: {self.collection.count()}")
     
     def multi_stage_retrieval(self, query: str, n_results: int = 10, 
-                             rerank_top_k: int = 20, rerank_method: str = 'original') -> List[Dict]:
+                             rerank_top_k: int = 20, rerank_method: str = 'original',
+                             adaptive_depth: bool = False) -> List[Dict]:
         """
         多阶段检索重排
         
         Args:
             query: 查询问题
             n_results: 最终返回的结果数量
-            rerank_top_k: 第一阶段检索的数量，用于重排
-            rerank_method: 重排方法 ('original' 或 'cross_encoder')
+            rerank_top_k: 第一阶段检索的数量，用于重排（自适应模式下为上限）
+            rerank_method: 重排方法 ('original'、'cross_encoder' 或 'cascade')
+            adaptive_depth: 是否根据第一阶段分数分布自适应决定候选数量
         """
         if not self.collection:
             print("❌ 集合未初始化")
             return []
         
+        # 只有本次查询走自适应路径并成功时才有深度记录
+        self.last_stage1_depth = None
+        
         # 第一阶段：扩大检索范围
-        stage1_results = self._stage1_retrieval(query, rerank_top_k)
+        if adaptive_depth:
+            stage1_results = self._adaptive_stage1_retrieval(query, n_results, rerank_top_k)
+        else:
+            stage1_results = self._stage1_retrieval(query, rerank_top_k)
         
         if not stage1_results:
             return []
         
         # 第二阶段：选择重排方法
-        if rerank_method == 'cross_encoder' and self.rerank_model is not None:
+        if rerank_method == 'cascade' and self.rerank_model is not None:
+            stage2_results = self._stage2_cascade_reranking(query, stage1_results, n_results)
+        elif rerank_method == 'cross_encoder' and self.rerank_model is not None:
             stage2_results = self._stage2_cross_encoder_reranking(query, stage1_results)
         else:
             # 使用原有的多策略重排
@@ -203,19 +480,49 @@ class EnhancedVectorDatabaseManager:
         # 返回Top-K结果
         return stage2_results[:n_results]
     
-    def _stage1_retrieval(self, query: str, n_results: int) -> List[Dict]:
-        """第一阶段：基础向量检索"""
-        # 获取查询嵌入
+    def _adaptive_stage1_retrieval(self, query: str, n_results: int, max_depth: int) -> List[Dict]:
+        """
+        自适应深度的第一阶段检索
+        
+        先取较小的候选池，只有分数分布模糊（Top-1领先幅度小或分数熵高）时才翻倍扩大，
+        直到max_depth。最近查询选定的深度记录在 self.stage1_depth_log
+        """
         query_embedding = self.embedding_client.get_embeddings_batch([query])
         if not query_embedding:
             print("❌ 查询嵌入失败")
             return []
         
-        # 执行向量检索
-        results = self.collection.query(
-            query_embeddings=query_embedding,
-            n_results=n_results
-        )
+        depth = min(max_depth, max(n_results * config.ADAPTIVE_INITIAL_MULTIPLIER, n_results + 1))
+        rounds = 0
+        while True:
+            rounds += 1
+            candidates = self._stage1_retrieval(query, depth, query_embedding[0])
+            ambiguity = stage1_score_ambiguity([c['stage1_score'] for c in candidates])
+            if not ambiguity['ambiguous'] or depth >= max_depth or len(candidates) < depth:
+                break
+            depth = min(max_depth, depth * 2)
+        
+        record = {'query': query, 'depth': depth, 'max_depth': max_depth, 'rounds': rounds, **ambiguity}
+        self.last_stage1_depth = record
+        self.stage1_depth_log.append(record)
+        return candidates
+    
+    def _stage1_retrieval(self, query: str, n_results: int,
+                          query_embedding: Optional[List[float]] = None) -> List[Dict]:
+        """第一阶段：基础向量检索（可传入已计算的查询嵌入）"""
+        # 获取查询嵌入
+        if query_embedding is not None:
+            query_embedding = [query_embedding]
+        else:
+            query_embedding = self.embedding_client.get_embeddings_batch([query])
+        if not query_embedding:
+            print("❌ 查询嵌入失败")
+            return []
+        self.remember_query_embedding(query, query_embedding[0])
+        
+        # 执行向量检索（分片集合会按问题路由到相关分片）
+        self.refresh_collection_alias()
+        results = collection_query(self.collection, query_embedding, n_results, query)
         
         # 格式化结果
         formatted_results = []
@@ -232,6 +539,7 @@ class EnhancedVectorDatabaseManager:
                     'document': results['documents'][0][i],
                     'text': metadata.get('text', ''),
                     'source_file': metadata.get('source_file', ''),
+                    'provenance': parse_provenance(metadata),
                     'metadata': metadata,
                     'stage1_score': 1 - results['distances'][0][i]  # 转换为相似度分数
                 })
@@ -239,35 +547,16 @@ class EnhancedVectorDatabaseManager:
         return formatted_results
     
     def _stage2_reranking(self, query: str, candidates: List[Dict]) -> List[Dict]:
-        """第二阶段：多策略重排"""
+        """第二阶段：多策略重排（基于入库时预计算的词特征，一次向量化计算全部候选）"""
+        if not candidates:
+            return candidates
         
-        # 计算多种相关性分数
-        for candidate in candidates:
-            scores = {}
-            
-            # 1. 实体匹配分数
-            scores['entity_match'] = self._calculate_entity_match_score(query, candidate)
-            
-            # 2. 关系匹配分数  
-            scores['relation_match'] = self._calculate_relation_match_score(query, candidate)
-            
-            # 3. 类型匹配分数
-            scores['type_match'] = self._calculate_type_match_score(query, candidate)
-            
-            # 4. 语义相似度分数 (来自第一阶段)
-            scores['semantic_similarity'] = candidate['stage1_score']
-            
-            # 5. 综合分数 (可调权重)
-            weights = {
-                'entity_match': 0.3,
-                'relation_match': 0.25, 
-                'type_match': 0.2,
-                'semantic_similarity': 0.25
-            }
-            
-            final_score = sum(weights[key] * scores[key] for key in weights)
-            candidate['rerank_score'] = final_score
-            candidate['detailed_scores'] = scores
+        # 实体匹配、关系匹配、类型匹配 + 语义相似度 (来自第一阶段) 的加权综合分数
+        scores = score_candidates(query, candidates)
+        
+        for i, candidate in enumerate(candidates):
+            candidate['rerank_score'] = float(scores['final'][i])
+            candidate['detailed_scores'] = {key: float(scores[key][i]) for key in HEURISTIC_WEIGHTS}
         
         # 按重排分数排序
         candidates.sort(key=lambda x: x['rerank_score'], reverse=True)
@@ -284,139 +573,156 @@ class EnhancedVectorDatabaseManager:
             return self._stage2_reranking(query, candidates)
         
         try:
-            # 创建模型需要输入的句子对：(查询, 候选文档的文本)
-            sentence_pairs = [[query, candidate['document']] for candidate in candidates]
-            
-            # 模型会为每个句子对计算一个相关性分数
-            scores = self.rerank_model.predict(sentence_pairs)
+            # 模型为每个 (查询, 候选文档) 句子对计算相关性分数，已缓存的句子对不再推理
+            scores = self._cross_encoder_scores([(query, candidates)])[0]
             
-            # 将分数添加回候选文档中
-            for i in range(len(candidates)):
-                candidates[i]['rerank_score'] = float(scores[i])
-                candidates[i]['rerank_method'] = 'cross_encoder'
-                # 保留原有的详细分数用于对比
-                candidates[i]['original_stage1_score'] = candidates[i].get('stage1_score', 0)
-            
-            # 按新的重排分数降序排序
-            candidates.sort(key=lambda x: x['rerank_score'], reverse=True)
-            
-            return candidates
+            return self._apply_cross_encoder_scores(candidates, scores)
             
         except Exception as e:
             print(f"⚠️ Cross-Encoder重排失败: {e}")
             # 回退到原有重排方法
             return self._stage2_reranking(query, candidates)
     
-    def _calculate_entity_match_score(self, query: str, candidate: Dict) -> float:
-        """计算实体匹配分数"""
-        query_lower = query.lower()
-        metadata = candidate['metadata']
+    def _cascade_prune(self, query: str, candidates: List[Dict], n_results: int) -> Tuple[List[Dict], List[Dict]]:
+        """
+        级联重排的第一步：启发式打分后只保留前M个候选交给Cross-Encoder
         
-        score = 0.0
+        M = config.CASCADE_RERANK_SURVIVORS；为0时自适应：保留与最高启发式分数相差
+        不超过config.CASCADE_SCORE_MARGIN的候选。M不小于n_results和config.CASCADE_MIN_SURVIVORS。
         
-        # 检查主语实体匹配
-        sub_clean = metadata['sub_clean'].lower()
-        if sub_clean in query_lower:
-            score += 0.5
+        Returns:
+            (进入Cross-Encoder的候选, 被剪枝的候选)
+        """
+        ranked = self._stage2_reranking(query, candidates)
+        for candidate in ranked:
+            candidate['heuristic_score'] = candidate['rerank_score']
         
-        # 检查宾语实体匹配
-        obj_clean = metadata['obj_clean'].lower()
-        if obj_clean in query_lower:
-            score += 0.5
+        if config.CASCADE_RERANK_SURVIVORS > 0:
+            survivors = config.CASCADE_RERANK_SURVIVORS
+        else:
+            best = ranked[0]['heuristic_score'] if ranked else 0.0
+            survivors = sum(1 for candidate in ranked
+                            if candidate['heuristic_score'] >= best - config.CASCADE_SCORE_MARGIN)
+        survivors = max(survivors, n_results, config.CASCADE_MIN_SURVIVORS)
+        
+        pruned = ranked[survivors:]
+        for candidate in pruned:
+            candidate['rerank_method'] = 'cascade_pruned'
+        return ranked[:survivors], pruned
+    
+    def _stage2_cascade_reranking(self, query: str, candidates: List[Dict], n_results: int) -> List[Dict]:
+        """第二阶段：【级联】启发式剪枝 + Cross-Encoder精排，被剪枝的候选排在后面"""
+        survivors, pruned = self._cascade_prune(query, candidates, n_results)
+        if not survivors:
+            return pruned
         
-        # 部分匹配
-        sub_words = sub_clean.split()
-        obj_words = obj_clean.split()
-        query_words = query_lower.split()
+        try:
+            scores = self._cross_encoder_scores([(query, survivors)])[0]
+        except Exception as e:
+            print(f"⚠️ Cross-Encoder重排失败，使用启发式排序: {e}")
+            return survivors + pruned
         
-        for word in sub_words + obj_words:
-            if len(word) > 3 and word in query_words:
-                score += 0.1
+        return self._apply_cross_encoder_scores(survivors, scores) + pruned
+    
+    def _cross_encoder_scores(self, groups: List[Tuple[str, List[Dict]]], batch_size: int = None) -> List:
+        """
+        为多组 (查询, 候选列表) 计算Cross-Encoder分数，命中分数缓存的句子对跳过推理；
+        使用重排服务时由服务端合批打分；模型暴露分词器时使用缓存的文档token，只对查询分词
+        """
+        pretokenized = get_pretokenized_scorer(self.rerank_model)
+        if isinstance(self.rerank_model, RerankerServiceClient):
+            scorer = lambda missing_groups: self.rerank_model.score_groups(missing_groups, batch_size)
+        elif pretokenized is not None:
+            scorer = lambda missing_groups: pretokenized.score_groups(missing_groups, batch_size)
+        else:
+            scorer = lambda missing_groups: rerank_groups(self.rerank_model, missing_groups, batch_size)
+        return cached_rerank_scores(self.rerank_model_name, groups, scorer)
+    
+    def _apply_cross_encoder_scores(self, candidates: List[Dict], scores) -> List[Dict]:
+        """将Cross-Encoder分数写回候选并按分数降序排序"""
+        for i in range(len(candidates)):
+            candidates[i]['rerank_score'] = float(scores[i])
+            candidates[i]['rerank_method'] = 'cross_encoder'
+            # 保留原有的详细分数用于对比
+            candidates[i]['original_stage1_score'] = candidates[i].get('stage1_score', 0)
+        
+        # 按新的重排分数降序排序
+        candidates.sort(key=lambda x: x['rerank_score'], reverse=True)
         
-        return min(score, 1.0)  # 限制在[0,1]范围
+        return candidates
     
-    def _calculate_relation_match_score(self, query: str, candidate: Dict) -> float:
-        """计算关系匹配分数"""
-        query_lower = query.lower()
-        metadata = candidate['metadata']
-        
-        score = 0.0
-        
-        # 关系词匹配
-        rel_clean = metadata['rel_clean'].lower()
-        rel_words = rel_clean.split()
-        
-        # 定义关系关键词映射
-        relation_keywords = {
-            'leader': ['leader', 'president', 'king', 'queen', 'head', 'chief'],
-            'location': ['location', 'located', 'place', 'where', 'country', 'city'],
-            'capital': ['capital'],
-            'type': ['type', 'kind', 'category'],
-            'runway': ['runway', 'strip'],
-            'owner': ['owner', 'owned', 'belong']
-        }
+    def batch_multi_stage_retrieval(self, queries: List[str], n_results: int = 10,
+                                    rerank_top_k: int = 20, rerank_method: str = 'cross_encoder',
+                                    batch_size: int = None) -> List[List[Dict]]:
+        """
+        批量多阶段检索：查询嵌入一次请求，所有问题的候选合并成大批次做Cross-Encoder重排
         
-        # 检查直接匹配
-        for rel_word in rel_words:
-            if rel_word in query_lower:
-                score += 0.4
+        Args:
+            queries: 查询问题列表
+            n_results: 每个问题最终返回的结果数量
+            rerank_top_k: 每个问题第一阶段检索的数量
+            rerank_method: 重排方法 ('original'、'cross_encoder' 或 'cascade')
+            batch_size: 重排批次大小，默认使用config.RERANK_BATCH_SIZE
+        """
+        if not self.collection:
+            print("❌ 集合未初始化")
+            return [[] for _ in queries]
+        
+        # 第一阶段：查询嵌入合并为一次请求
+        query_embeddings = self.embedding_client.get_embeddings_batch(queries) if queries else None
+        if not query_embeddings:
+            query_embeddings = [None] * len(queries)
+        stage1_results = [self._stage1_retrieval(query, rerank_top_k, query_embedding)
+                          for query, query_embedding in zip(queries, query_embeddings)]
+        
+        # 第二阶段
+        if rerank_method not in ('cross_encoder', 'cascade') or self.rerank_model is None:
+            return [self._stage2_reranking(query, candidates)[:n_results] if candidates else []
+                    for query, candidates in zip(queries, stage1_results)]
+        
+        # 级联模式下先做启发式剪枝，只有幸存的候选进入Cross-Encoder
+        if rerank_method == 'cascade':
+            splits = [self._cascade_prune(query, candidates, n_results)
+                      for query, candidates in zip(queries, stage1_results)]
+        else:
+            splits = [(candidates, []) for candidates in stage1_results]
         
-        # 检查语义匹配
-        for rel_type, keywords in relation_keywords.items():
-            if rel_type in rel_clean:
-                for keyword in keywords:
-                    if keyword in query_lower:
-                        score += 0.3
-                        break
+        try:
+            all_scores = self._cross_encoder_scores(
+                [(query, survivors) for query, (survivors, _) in zip(queries, splits)], batch_size
+            )
+        except Exception as e:
+            print(f"⚠️ 批量Cross-Encoder重排失败: {e}")
+            return [self._stage2_reranking(query, candidates)[:n_results] if candidates else []
+                    for query, candidates in zip(queries, stage1_results)]
         
-        return min(score, 1.0)
+        return [(self._apply_cross_encoder_scores(survivors, scores) + pruned)[:n_results]
+                for (survivors, pruned), scores in zip(splits, all_scores)]
     
-    def _calculate_type_match_score(self, query: str, candidate: Dict) -> float:
-        """计算类型匹配分数"""
-        query_lower = query.lower()
-        metadata = candidate['metadata']
-        
-        score = 0.0
-        
-        # 类型关键词映射
-        type_keywords = {
-            'country': ['country', 'nation'],
-            'airport': ['airport'],
-            'city': ['city', 'town'],
-            'person': ['person', 'people', 'who'],
-            'organization': ['organization', 'company'],
-            'location': ['location', 'place', 'where']
-        }
-        
-        sub_type = metadata['sub_type'].lower()
-        obj_type = metadata['obj_type'].lower()
+    def get_database_stats(self, include_corpus_stats: bool = False) -> Dict:
+        """
+        获取数据库统计信息
         
-        # 检查类型匹配
-        for entity_type in [sub_type, obj_type]:
-            if entity_type in query_lower:
-                score += 0.4
-            
-            # 检查语义匹配
-            for type_name, keywords in type_keywords.items():
-                if type_name in entity_type:
-                    for keyword in keywords:
-                        if keyword in query_lower:
-                            score += 0.2
-                            break
-        
-        return min(score, 1.0)
-    
-    def get_database_stats(self) -> Dict:
-        """获取数据库统计信息"""
+        Args:
+            include_corpus_stats: 是否附带语料统计（关系直方图、实体频率、类型计数、关系样例）
+        """
         if not self.collection:
             return {"status": "Collection not initialized"}
         
-        return {
+        stats = {
             "collection_name": self.collection.name,
             "total_documents": self.collection.count(),
             "status": "ready",
             "enhancement": "multi-stage retrieval with reranking"
         }
+        
+        if isinstance(self.collection, ShardedCollection):
+            stats["shards"] = self.collection.get_shard_stats()
+        
+        if include_corpus_stats:
+            stats["corpus_stats"] = get_corpus_stats(self.collection).to_dict()
+        
+        return stats
 
 # 测试函数
 def test_enhanced_system():
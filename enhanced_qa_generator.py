@@ -187,10 +187,9 @@ Answer: [your answer]"""
                 print("⚠ OpenAI API密钥未设置，使用模拟QA生成")
                 return self._generate_mock_qa_response(prompt)
             
-            from openai import OpenAI
-            client = OpenAI(api_key=self.openai_api_key)
+            from llm_gateway import chat_completion
             
-            response = client.chat.completions.create(
+            content = chat_completion(
                 model="gpt-4o",
                 messages=[
                     {
@@ -203,10 +202,10 @@ Answer: [your answer]"""
                     }
                 ],
                 temperature=0.3,
-                max_tokens=200
-            )
-            
-            content = response.choices[0].message.content.strip()
+                max_tokens=200,
+                caller="enhanced_qa_generation",
+                api_key=self.openai_api_key
+            ).strip()
             return self._parse_qa_response(content)
             
         except Exception as e:
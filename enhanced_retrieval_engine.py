@@ -3,6 +3,8 @@
 from typing import List, Dict, Optional
 from enhanced_embedding_system import EnhancedVectorDatabaseManager
 from cotkr_rewriter import CoTKRRewriter
+from data_loader import parse_provenance
+from sharded_collection import collection_query
 import config
 
 class EnhancedRetrievalEngine:
@@ -32,12 +34,65 @@ class EnhancedRetrievalEngine:
                 query=question, 
                 n_results=n_results,
                 rerank_top_k=n_results * config.RERANK_TOP_K_MULTIPLIER,  # 扩大初始检索范围
-                rerank_method='cross_encoder'  # 使用Cross-Encoder重排方法
+                rerank_method=config.RERANK_METHOD,  # 默认使用Cross-Encoder重排方法
+                adaptive_depth=config.ADAPTIVE_STAGE1_DEPTH  # 明确的查询使用更小的候选池
             )
         else:
             # 回退到基础检索（用于对比）
             retrieved_items = self._basic_retrieval(question, n_results)
         
+        result = self._rewrite_and_answer(question, retrieved_items, prompt_type, use_reranking)
+        depth_record = self.db_manager.last_stage1_depth
+        if use_reranking and config.ADAPTIVE_STAGE1_DEPTH and depth_record and 'retrieval_stats' in result:
+            result['retrieval_stats']['stage1_depth'] = depth_record['depth']
+        return result
+    
+    def batch_retrieve(self, questions: List[str], n_results: int = 5,
+                       prompt_type: str = None) -> List[Dict]:
+        """
+        批量检索和重写：所有问题的候选合并成大批次做Cross-Encoder重排
+        
+        Args:
+            questions: 问题列表
+            n_results: 每个问题的检索结果数量
+            prompt_type: 问题类型 ('sub', 'obj', 'rel', 'type')
+        """
+        all_items = self.db_manager.batch_multi_stage_retrieval(
+            questions,
+            n_results=n_results,
+            rerank_top_k=n_results * config.RERANK_TOP_K_MULTIPLIER,
+            rerank_method=config.RERANK_METHOD
+        )
+        if not config.COTKR_BATCH_EXTRACTION:
+            return [self._rewrite_and_answer(question, retrieved_items, prompt_type, True)
+                    for question, retrieved_items in zip(questions, all_items)]
+        
+        # 答案提取合并成少量LLM请求
+        detected_types = [self._detect_question_type(question, prompt_type) for question in questions]
+        extraction_items = [
+            (question, self.cotkr_rewriter.rewrite_knowledge(retrieved_items, question, prompt_type,
+                                                             question_type=detected_type),
+             retrieved_items, prompt_type)
+            for question, retrieved_items, detected_type in zip(questions, all_items, detected_types)
+        ]
+        answers = self.cotkr_rewriter.extract_answers_batch(extraction_items)
+        return [self._rewrite_and_answer(question, retrieved_items, prompt_type, True,
+                                         cotkr_knowledge=cotkr_knowledge, final_answer=final_answer,
+                                         detected_type=detected_type)
+                for (question, cotkr_knowledge, retrieved_items, _), final_answer, detected_type
+                in zip(extraction_items, answers, detected_types)]
+    
+    def _detect_question_type(self, question: str, prompt_type: Optional[str]) -> Optional[str]:
+        """检测一次问题类型（复用检索时计算的查询嵌入）；提供了prompt_type时不检测"""
+        if prompt_type:
+            return None
+        return self.cotkr_rewriter.detect_question_type(question, self.db_manager.get_query_embedding(question))
+    
+    def _rewrite_and_answer(self, question: str, retrieved_items: List[Dict],
+                            prompt_type: Optional[str], use_reranking: bool,
+                            cotkr_knowledge: str = None, final_answer: str = None,
+                            detected_type: str = None) -> Dict:
+        """CoTKR重写检索到的知识并提取答案（批量模式下传入已重写的知识、已提取的答案和问题类型）"""
         if not retrieved_items:
             return {
                 'question': question,
@@ -47,20 +102,26 @@ class EnhancedRetrievalEngine:
                 'retrieval_method': 'enhanced_multi_stage' if use_reranking else 'basic'
             }
         
+        if detected_type is None:
+            detected_type = self._detect_question_type(question, prompt_type)
+        
         # 2. 使用CoTKR方法重写检索到的知识
-        cotkr_knowledge = self.cotkr_rewriter.rewrite_knowledge(retrieved_items, question, prompt_type)
+        if cotkr_knowledge is None:
+            cotkr_knowledge = self.cotkr_rewriter.rewrite_knowledge(retrieved_items, question, prompt_type,
+                                                                    question_type=detected_type)
         
         # 3. 从重写的知识中提取答案
-        final_answer = self.cotkr_rewriter.extract_answer_from_knowledge(
-            question, cotkr_knowledge, retrieved_items, prompt_type
-        )
+        if final_answer is None:
+            final_answer = self.cotkr_rewriter.extract_answer_from_knowledge(
+                question, cotkr_knowledge, retrieved_items, prompt_type
+            )
         
         # 确定问题类型
         if prompt_type:
             question_type = prompt_type
         else:
             is_question = question.strip().endswith('?') or any(question.lower().startswith(word) for word in ['who', 'what', 'where', 'when', 'why', 'how'])
-            question_type = self.cotkr_rewriter.detect_question_type(question) if is_question else 'statement'
+            question_type = detected_type if is_question else 'statement'
         
         # 计算增强的统计信息
         enhanced_stats = self._calculate_enhanced_stats(retrieved_items, use_reranking)
@@ -85,12 +146,11 @@ class EnhancedRetrievalEngine:
         query_embedding = self.db_manager.embedding_client.get_embeddings_batch([query])
         if not query_embedding:
             return []
+        self.db_manager.remember_query_embedding(query, query_embedding[0])
         
         # 执行查询
-        results = self.db_manager.collection.query(
-            query_embeddings=query_embedding,
-            n_results=n_results
-        )
+        self.db_manager.refresh_collection_alias()
+        results = collection_query(self.db_manager.collection, query_embedding, n_results, query)
         
         # 格式化结果
         formatted_results = []
@@ -107,6 +167,7 @@ class EnhancedRetrievalEngine:
                     'document': results['documents'][0][i],
                     'text': metadata.get('text', ''),
                     'source_file': metadata.get('source_file', ''),
+                    'provenance': parse_provenance(metadata),
                     'metadata': metadata if 'sub_clean' in metadata else None
                 })
         
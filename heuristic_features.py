@@ -0,0 +1,170 @@
+# heuristic_features.py - 启发式重排的入库时特征与向量化打分
+
+import re
+import zlib
+from typing import List, Dict
+import numpy as np
+
+# 关系关键词映射（与原启发式重排一致）
+RELATION_KEYWORDS = {
+    'leader': ['leader', 'president', 'king', 'queen', 'head', 'chief'],
+    'location': ['location', 'located', 'place', 'where', 'country', 'city'],
+    'capital': ['capital'],
+    'type': ['type', 'kind', 'category'],
+    'runway': ['runway', 'strip'],
+    'owner': ['owner', 'owned', 'belong']
+}
+
+# 类型关键词映射（与原启发式重排一致）
+TYPE_KEYWORDS = {
+    'country': ['country', 'nation'],
+    'airport': ['airport'],
+    'city': ['city', 'town'],
+    'person': ['person', 'people', 'who'],
+    'organization': ['organization', 'company'],
+    'location': ['location', 'place', 'where']
+}
+
+# 特征向量布局（uint32），入库时以十六进制字符串存入元数据 'heuristic_features'
+SUB_PHRASE, OBJ_PHRASE = 0, 1
+ENTITY_WORDS = slice(2, 10)      # 主语/宾语中长度>3的词（最多8个）
+RELATION_WORDS = slice(10, 14)   # 关系词（最多4个）
+SUB_TYPE_PHRASE, OBJ_TYPE_PHRASE = 14, 15
+RELATION_MASK, SUB_TYPE_MASK, OBJ_TYPE_MASK = 16, 17, 18
+FEATURE_WIDTH = 19
+
+# 查询中参与短语匹配的最长n-gram
+MAX_PHRASE_TOKENS = 8
+
+WEIGHTS = {
+    'entity_match': 0.3,
+    'relation_match': 0.25,
+    'type_match': 0.2,
+    'semantic_similarity': 0.25
+}
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+def token_hash(text: str) -> int:
+    """词或短语的32位哈希，0保留为填充值"""
+    return zlib.crc32(text.encode('utf-8')) or 1
+
+def _keyword_mask(keyword_groups: Dict[str, List[str]], text: str) -> int:
+    """文本包含名称的关键词组位掩码（第i位对应第i个组）"""
+    return sum(1 << i for i, name in enumerate(keyword_groups) if name in text)
+
+def _query_keyword_mask(keyword_groups: Dict[str, List[str]], query_lower: str) -> int:
+    """查询中出现任一关键词的关键词组位掩码"""
+    return sum(1 << i for i, keywords in enumerate(keyword_groups.values())
+               if any(keyword in query_lower for keyword in keywords))
+
+def compute_features(metadata: Dict) -> np.ndarray:
+    """从三元组元数据计算启发式特征向量"""
+    features = np.zeros(FEATURE_WIDTH, dtype=np.uint32)
+    sub_clean = metadata['sub'].replace('_', ' ').lower()
+    obj_clean = metadata['obj'].replace('_', ' ').lower()
+    rel_clean = metadata['rel'].replace('_', ' ').lower()
+    sub_type = metadata['sub_type'].lower()
+    obj_type = metadata['obj_type'].lower()
+
+    features[SUB_PHRASE] = token_hash(' '.join(tokenize(sub_clean)))
+    features[OBJ_PHRASE] = token_hash(' '.join(tokenize(obj_clean)))
+
+    # 实体词按空白切分，与查询的空白切分词比较（与原启发式一致）
+    entity_words = [word for word in sub_clean.split() + obj_clean.split() if len(word) > 3]
+    entity_words = entity_words[:ENTITY_WORDS.stop - ENTITY_WORDS.start]
+    features[ENTITY_WORDS.start:ENTITY_WORDS.start + len(entity_words)] = [token_hash(w) for w in entity_words]
+
+    relation_words = tokenize(rel_clean)[:RELATION_WORDS.stop - RELATION_WORDS.start]
+    features[RELATION_WORDS.start:RELATION_WORDS.start + len(relation_words)] = [token_hash(w) for w in relation_words]
+
+    features[SUB_TYPE_PHRASE] = token_hash(' '.join(tokenize(sub_type)))
+    features[OBJ_TYPE_PHRASE] = token_hash(' '.join(tokenize(obj_type)))
+    features[RELATION_MASK] = _keyword_mask(RELATION_KEYWORDS, rel_clean)
+    features[SUB_TYPE_MASK] = _keyword_mask(TYPE_KEYWORDS, sub_type)
+    features[OBJ_TYPE_MASK] = _keyword_mask(TYPE_KEYWORDS, obj_type)
+    return features
+
+def encode_features(metadata: Dict) -> str:
+    """入库时调用：特征向量编码为紧凑的十六进制字符串（ChromaDB元数据只支持标量）"""
+    return compute_features(metadata).tobytes().hex()
+
+def candidate_features(candidates: List[Dict]) -> np.ndarray:
+    """候选特征矩阵 (候选数 x FEATURE_WIDTH)；旧集合中没有预计算特征的条目现场计算"""
+    rows = []
+    for candidate in candidates:
+        encoded = candidate['metadata'].get('heuristic_features')
+        if encoded:
+            rows.append(np.frombuffer(bytes.fromhex(encoded), dtype=np.uint32))
+        else:
+            rows.append(compute_features(candidate['metadata']))
+    return np.vstack(rows) if rows else np.zeros((0, FEATURE_WIDTH), dtype=np.uint32)
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    return sum((values >> bit) & 1 for bit in range(max(len(RELATION_KEYWORDS), len(TYPE_KEYWORDS))))
+
+def score_candidates(query: str, candidates: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    一次性为全部候选计算启发式分数（实体、关系、类型匹配 + 第一阶段语义相似度）
+
+    与逐条计算的区别：实体和类型名称按完整词序列匹配，而不是子串匹配；
+    关系词同样按完整词匹配（如关系词 'own' 不再命中查询中的 'owner'）
+    """
+    features = candidate_features(candidates)
+    query_lower = query.lower()
+    query_tokens = tokenize(query)
+
+    word_hashes = np.array([token_hash(word) for word in set(query_lower.split())], dtype=np.uint32)
+    token_hashes = np.array([token_hash(token) for token in set(query_tokens)], dtype=np.uint32)
+    phrase_hashes = np.array(sorted({
+        token_hash(' '.join(query_tokens[start:start + size]))
+        for size in range(1, MAX_PHRASE_TOKENS + 1)
+        for start in range(len(query_tokens) - size + 1)
+    }), dtype=np.uint32)
+    relation_query_mask = _query_keyword_mask(RELATION_KEYWORDS, query_lower)
+    type_query_mask = _query_keyword_mask(TYPE_KEYWORDS, query_lower)
+
+    # 1. 实体匹配：完整实体名 0.5，实体中长度>3的词各 0.1
+    entity = (0.5 * np.isin(features[:, SUB_PHRASE], phrase_hashes)
+              + 0.5 * np.isin(features[:, OBJ_PHRASE], phrase_hashes)
+              + 0.1 * np.isin(features[:, ENTITY_WORDS], word_hashes).sum(axis=1))
+
+    # 2. 关系匹配：关系词各 0.4，关系关键词组各 0.3
+    relation = (0.4 * np.isin(features[:, RELATION_WORDS], token_hashes).sum(axis=1)
+                + 0.3 * _popcount(features[:, RELATION_MASK] & relation_query_mask))
+
+    # 3. 类型匹配：类型名 0.4，类型关键词组各 0.2
+    type_match = (0.4 * np.isin(features[:, SUB_TYPE_PHRASE], phrase_hashes)
+                  + 0.4 * np.isin(features[:, OBJ_TYPE_PHRASE], phrase_hashes)
+                  + 0.2 * _popcount(features[:, SUB_TYPE_MASK] & type_query_mask)
+                  + 0.2 * _popcount(features[:, OBJ_TYPE_MASK] & type_query_mask))
+
+    scores = {
+        'entity_match': np.minimum(entity, 1.0),
+        'relation_match': np.minimum(relation, 1.0),
+        'type_match': np.minimum(type_match, 1.0),
+        'semantic_similarity': np.array([candidate['stage1_score'] for candidate in candidates], dtype=np.float64)
+    }
+    scores['final'] = sum(WEIGHTS[key] * scores[key] for key in WEIGHTS)
+    return scores
+
+# 测试函数
+def test_heuristic_features():
+    """测试向量化启发式打分"""
+    def make(sub, rel, obj, sub_type, obj_type, stage1_score):
+        metadata = {'sub': sub, 'rel': rel, 'obj': obj, 'sub_type': sub_type, 'obj_type': obj_type}
+        metadata['heuristic_features'] = encode_features(metadata)
+        return {'metadata': metadata, 'stage1_score': stage1_score}
+
+    candidates = [
+        make('Belgium', 'leader', 'Philippe_of_Belgium', 'Country', 'Person', 0.6),
+        make('Brussels_Airport', 'location', 'Belgium', 'Airport', 'Country', 0.7),
+        make('Aarhus_Airport', 'runwayLength', '2776.0', 'Airport', 'Number', 0.5)
+    ]
+    scores = score_candidates("Who is the leader of Belgium?", candidates)
+    for key, values in scores.items():
+        print(f"{key}: {np.round(values, 3).tolist()}")
+
+if __name__ == '__main__':
+    test_heuristic_features()
@@ -0,0 +1,245 @@
+# hnsw_tuner.py - HNSW参数自动调优（recall@k vs 延迟/内存）
+
+import argparse
+import itertools
+import json
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional
+import numpy as np
+import config
+from shared_resources import get_chroma_client, get_embedding_client, resolve_collection_alias
+
+DEFAULT_M_VALUES = [8, 16, 32]
+DEFAULT_CONSTRUCTION_EF_VALUES = [100, 200]
+DEFAULT_SEARCH_EF_VALUES = [10, 50, 100]
+
+def load_sample_questions(dataset_path: str = config.QA_OUTPUT_DIR, sample_size: int = 200,
+                          seed: int = 42) -> List[str]:
+    """从QA数据集中随机抽取问题"""
+    questions = []
+    for qa_file in Path(dataset_path).glob("*.json"):
+        try:
+            with open(qa_file, 'r', encoding='utf-8') as f:
+                qa_data = json.load(f)
+        except (IOError, ValueError) as e:
+            print(f"⚠️ 跳过无法读取的QA文件 {qa_file.name}: {e}")
+            continue
+        if isinstance(qa_data, list):
+            questions.extend(item['question'] for item in qa_data
+                             if isinstance(item, dict) and item.get('question'))
+
+    questions = list(dict.fromkeys(questions))
+    random.Random(seed).shuffle(questions)
+    return questions[:sample_size]
+
+def load_corpus_embeddings(collection, page_size: int = 1000) -> Dict:
+    """分页读取集合中的全部ID和嵌入向量"""
+    ids, blocks = [], []
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(limit=page_size, offset=offset, include=['embeddings'])
+        if not page or not page['ids']:
+            break
+        ids.extend(page['ids'])
+        blocks.append(np.asarray(page['embeddings'], dtype=np.float32))
+    return {'ids': ids, 'embeddings': np.vstack(blocks) if blocks else np.empty((0, 0), dtype=np.float32)}
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """暴力计算每个查询的精确余弦Top-K（返回行号）"""
+    corpus_norm = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+    query_norm = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+    # 按查询分块，避免一次生成 (问题数 x 语料数) 的完整分数矩阵
+    truth = []
+    for i in range(0, len(query_norm), 16):
+        scores = query_norm[i:i + 16] @ corpus_norm.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        truth.append(np.take_along_axis(top, order, axis=1))
+    return np.vstack(truth)
+
+def estimate_index_memory_mb(count: int, dim: int, m: int) -> float:
+    """
+    估算HNSW索引内存：每个向量 dim*4 字节 + 第0层 2M 个邻居、上层约 M 个邻居（4字节ID）
+    """
+    bytes_per_vector = dim * 4 + (2 * m + m) * 4 + 16
+    return count * bytes_per_vector / (1024 * 1024)
+
+class HNSWTuner:
+    """HNSW参数调优器：对参数网格逐一建索引，测量recall@k、延迟和内存"""
+
+    def __init__(self, collection_name: str = None, k: int = 10):
+        self.collection_name = collection_name or config.COLLECTION_NAME + "_enhanced"
+        self.k = k
+        self.embedding_client = get_embedding_client()
+
+    def _embed_questions(self, questions: List[str]) -> np.ndarray:
+        vectors = []
+        for i in range(0, len(questions), config.BATCH_SIZE):
+            batch = self.embedding_client.get_embeddings_batch(questions[i:i + config.BATCH_SIZE])
+            if batch:
+                vectors.extend(batch)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _evaluate_setting(self, client, corpus_ids: List[str], corpus: np.ndarray,
+                          queries: np.ndarray, truth: np.ndarray, setting: Dict) -> Dict:
+        """用一组参数建立临时索引并测量"""
+        name = f"hnsw_tune_{setting['hnsw:M']}_{setting['hnsw:construction_ef']}_{setting['hnsw:search_ef']}"
+        try:
+            client.delete_collection(name=name)
+        except Exception:
+            pass
+        collection = client.create_collection(name=name, metadata={"hnsw:space": "cosine", **setting})
+
+        build_start = time.time()
+        for i in range(0, len(corpus_ids), 5000):
+            collection.add(ids=corpus_ids[i:i + 5000], embeddings=corpus[i:i + 5000].tolist())
+        build_seconds = time.time() - build_start
+
+        id_to_row = {doc_id: row for row, doc_id in enumerate(corpus_ids)}
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=self.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found = {id_to_row[doc_id] for doc_id in result['ids'][0]}
+            recalls.append(len(found & set(expected.tolist())) / self.k)
+
+        client.delete_collection(name=name)
+
+        return {
+            **setting,
+            f'recall@{self.k}': float(np.mean(recalls)),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'estimated_memory_mb': estimate_index_memory_mb(len(corpus_ids), corpus.shape[1], setting['hnsw:M']),
+            'build_seconds': build_seconds
+        }
+
+    def tune(self, sample_size: int = 200, recall_target: float = 0.95,
+             m_values: List[int] = None, construction_ef_values: List[int] = None,
+             search_ef_values: List[int] = None, max_corpus: Optional[int] = None) -> Dict:
+        """
+        扫描HNSW参数网格，选出满足召回率目标的最便宜设置
+
+        Args:
+            sample_size: 从qa_datasets抽取的问题数
+            recall_target: recall@k目标
+            max_corpus: 只用前N条语料调优（大语料时加快扫描，真值在同一子集上计算）
+        """
+        import chromadb
+
+        # 集合名可能是别名（reindex.py切换影子集合后指向新的实际集合）
+        physical_name = resolve_collection_alias(self.collection_name)
+        source = get_chroma_client(config.CHROMA_DB_PATH).get_collection(name=physical_name)
+        corpus_data = load_corpus_embeddings(source)
+        corpus_ids, corpus = corpus_data['ids'], corpus_data['embeddings']
+        if max_corpus:
+            corpus_ids, corpus = corpus_ids[:max_corpus], corpus[:max_corpus]
+        if len(corpus_ids) < self.k:
+            print("❌ 语料数量少于k，无法调优")
+            return {}
+
+        questions = load_sample_questions(sample_size=sample_size)
+        if not questions:
+            print("❌ 未找到QA问题")
+            return {}
+        queries = self._embed_questions(questions)
+        print(f"📊 语料 {len(corpus_ids)} 条, 维度 {corpus.shape[1]}, 问题 {len(queries)} 个, k={self.k}")
+
+        truth = exact_top_k(corpus, queries, self.k)
+
+        client = chromadb.EphemeralClient()
+        grid = itertools.product(m_values or DEFAULT_M_VALUES,
+                                 construction_ef_values or DEFAULT_CONSTRUCTION_EF_VALUES,
+                                 search_ef_values or DEFAULT_SEARCH_EF_VALUES)
+        results = []
+        for m, construction_ef, search_ef in grid:
+            setting = {'hnsw:M': m, 'hnsw:construction_ef': construction_ef, 'hnsw:search_ef': search_ef}
+            result = self._evaluate_setting(client, corpus_ids, corpus, queries, truth, setting)
+            results.append(result)
+            print(f"   M={m:<3} construction_ef={construction_ef:<4} search_ef={search_ef:<4} "
+                  f"recall@{self.k}={result[f'recall@{self.k}']:.4f} "
+                  f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                  f"mem≈{result['estimated_memory_mb']:.1f}MB")
+
+        recall_key = f'recall@{self.k}'
+        qualified = [r for r in results if r[recall_key] >= recall_target]
+        if qualified:
+            chosen = min(qualified, key=lambda r: (r['p95_ms'], r['estimated_memory_mb']))
+        else:
+            print(f"⚠️ 没有设置达到recall目标 {recall_target}，选择召回率最高的设置")
+            chosen = max(results, key=lambda r: (r[recall_key], -r['p95_ms']))
+
+        return {
+            'collection_name': self.collection_name,
+            'k': self.k,
+            'recall_target': recall_target,
+            'corpus_size': len(corpus_ids),
+            'num_questions': len(queries),
+            'results': results,
+            'chosen': chosen
+        }
+
+def save_hnsw_settings(chosen: Dict, settings_file: str = None):
+    """把选出的HNSW参数写入配置文件，之后新建的集合会使用这些参数"""
+    settings_file = Path(settings_file or config.HNSW_SETTINGS_FILE)
+    settings_file.parent.mkdir(parents=True, exist_ok=True)
+    settings = {key: value for key, value in chosen.items() if key.startswith('hnsw:')}
+    settings['tuned_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    settings['metrics'] = {key: value for key, value in chosen.items() if not key.startswith('hnsw:')}
+    with open(settings_file, 'w', encoding='utf-8') as f:
+        json.dump(settings, f, ensure_ascii=False, indent=2)
+    print(f"💾 HNSW参数已写入: {settings_file}")
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="HNSW参数自动调优")
+    parser.add_argument('--collection', default=None, help='用于调优的集合名称（默认增强集合）')
+    parser.add_argument('--k', type=int, default=10, help='recall@k中的k')
+    parser.add_argument('--sample-size', type=int, default=200, help='抽取的问题数量')
+    parser.add_argument('--recall-target', type=float, default=0.95, help='recall@k目标')
+    parser.add_argument('--m', type=int, nargs='+', default=None, help='M候选值')
+    parser.add_argument('--construction-ef', type=int, nargs='+', default=None, help='construction_ef候选值')
+    parser.add_argument('--search-ef', type=int, nargs='+', default=None, help='search_ef候选值')
+    parser.add_argument('--max-corpus', type=int, default=None, help='只用前N条语料调优')
+    parser.add_argument('--no-save', action='store_true', help='只输出报告，不写入HNSW参数')
+
+    args = parser.parse_args()
+
+    tuner = HNSWTuner(args.collection, k=args.k)
+    report = tuner.tune(sample_size=args.sample_size, recall_target=args.recall_target,
+                        m_values=args.m, construction_ef_values=args.construction_ef,
+                        search_ef_values=args.search_ef, max_corpus=args.max_corpus)
+    if not report:
+        return
+
+    chosen = report['chosen']
+    print(f"\n✅ 选中参数: M={chosen['hnsw:M']}, construction_ef={chosen['hnsw:construction_ef']}, "
+          f"search_ef={chosen['hnsw:search_ef']} (recall@{args.k}={chosen[f'recall@{args.k}']:.4f}, "
+          f"p95={chosen['p95_ms']:.2f}ms)")
+
+    output_dir = Path(config.EVALUATION_OUTPUT_DIR)
+    output_dir.mkdir(exist_ok=True)
+    report_file = output_dir / f"hnsw_tuning_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 调优报告已保存: {report_file}")
+
+    if not args.no_save:
+        save_hnsw_settings(chosen)
+        print("💡 新参数只对之后新建的集合生效，需要重建集合 (--reset) 才能应用到现有数据")
+
+# 测试函数
+def test_hnsw_tuner():
+    """测试暴力Top-K真值和内存估算"""
+    rng = np.random.default_rng(0)
+    corpus = rng.normal(size=(100, 8)).astype(np.float32)
+    truth = exact_top_k(corpus, corpus[:3], k=5)
+    print(f"查询自身排在第一位: {truth[:, 0].tolist()} (预期: [0, 1, 2])")
+    print(f"100万条1024维向量, M=16 的估算内存: {estimate_index_memory_mb(1_000_000, 1024, 16):.0f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+# index_snapshot.py - 可内存映射的索引快照（快速启动的只读检索）
+
+import argparse
+import hashlib
+import json
+import mmap
+import shutil
+import struct
+import time
+from array import array
+from pathlib import Path
+from typing import List, Dict, Optional
+import numpy as np
+import config
+
+# 文件布局:
+#   [8字节魔数][8字节头部长度][头部JSON，空格填充到4KB]
+#   [向量矩阵][行偏移表][ID索引][行记录]
+# 向量矩阵按行存储、已做L2归一化；行偏移表 (count+1 个uint64) 指向每行的记录
+# (JSON编码的 [id, 文档, 元数据])；ID索引是按ID哈希排序的 (哈希, 行号) 两列。
+# 所有部分都直接内存映射，检索时只解析命中的行，多个进程共享同一份页缓存
+SNAPSHOT_MAGIC = b"KGSNAP01"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER_SIZE = 4096
+SUPPORTED_DTYPES = ('float32', 'float16')
+
+# 查询时每次参与矩阵乘法的行数，float16快照按块转换为float32计算
+QUERY_CHUNK_ROWS = 65536
+
+def _id_hash(doc_id: str) -> int:
+    """ID的64位哈希（ID索引按该值排序）"""
+    return int.from_bytes(hashlib.blake2b(doc_id.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def _write_padding(f, alignment: int = 8):
+    """把文件位置填充到alignment字节对齐"""
+    remainder = f.tell() % alignment
+    if remainder:
+        f.write(b'\0' * (alignment - remainder))
+
+def export_snapshot(collection, output_path: str, dtype: str = 'float32',
+                    page_size: int = 1000) -> Dict:
+    """
+    将Chroma集合导出为单个可内存映射的快照文件
+
+    向量和行记录按页流式写出，内存中只保留每行一个偏移量和一个ID哈希
+
+    Args:
+        collection: ChromaDB集合
+        output_path: 快照文件路径
+        dtype: 向量存储精度 ('float32' 或 'float16')
+        page_size: 分页读取集合时每页的条目数
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"不支持的dtype: {dtype}，可选值: {SUPPORTED_DTYPES}")
+
+    total = collection.count()
+    print(f"🔄 导出快照: {collection.name} ({total} 条) -> {output_path}")
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(output_path.suffix + '.tmp')
+    records_path = output_path.with_suffix(output_path.suffix + '.rows.tmp')
+
+    row_offsets = array('Q', [0])
+    id_hashes = array('Q')
+    dim = None
+    try:
+        with open(tmp_path, 'wb') as f, open(records_path, 'wb') as records:
+            # 头部在写完所有数据后回填
+            f.write(b'\0' * SNAPSHOT_HEADER_SIZE)
+            for offset in range(0, total, page_size):
+                page = collection.get(limit=page_size, offset=offset,
+                                      include=['embeddings', 'documents', 'metadatas'])
+                if not page or not page['ids']:
+                    break
+
+                vectors = np.asarray(page['embeddings'], dtype=np.float32)
+                if dim is None:
+                    dim = vectors.shape[1]
+                elif vectors.shape[1] != dim:
+                    raise ValueError(f"向量维度不一致: {vectors.shape[1]} != {dim}")
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                f.write((vectors / norms).astype(dtype).tobytes(order='C'))
+
+                for doc_id, document, metadata in zip(page['ids'], page['documents'], page['metadatas']):
+                    record = json.dumps([doc_id, document, metadata or {}], ensure_ascii=False).encode('utf-8')
+                    records.write(record)
+                    row_offsets.append(row_offsets[-1] + len(record))
+                    id_hashes.append(_id_hash(doc_id))
+
+            count = len(id_hashes)
+            if not count:
+                print("❌ 集合为空，未生成快照")
+                return {}
+
+            records.flush()
+            _write_padding(f)
+            row_offsets_offset = f.tell()
+            f.write(np.frombuffer(row_offsets, dtype=np.uint64).astype('<u8').tobytes())
+
+            hashes = np.frombuffer(id_hashes, dtype=np.uint64)
+            order = np.argsort(hashes, kind='stable')
+            id_hashes_offset = f.tell()
+            f.write(hashes[order].astype('<u8').tobytes())
+            id_rows_offset = f.tell()
+            f.write(order.astype('<u8').tobytes())
+            del hashes, order
+
+            records_offset = f.tell()
+            with open(records_path, 'rb') as records_in:
+                shutil.copyfileobj(records_in, f, length=16 * 1024 * 1024)
+
+            header = {
+                "version": SNAPSHOT_VERSION,
+                "collection_name": collection.name,
+                "embedding_model": config.EMBEDDING_MODEL,
+                "count": count,
+                "dim": int(dim),
+                "dtype": dtype,
+                "normalized": True,
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "vectors_offset": SNAPSHOT_HEADER_SIZE,
+                "row_offsets_offset": row_offsets_offset,
+                "id_hashes_offset": id_hashes_offset,
+                "id_rows_offset": id_rows_offset,
+                "records_offset": records_offset,
+                "records_length": int(row_offsets[-1])
+            }
+            header_bytes = json.dumps(header).encode('utf-8')
+            max_header_length = SNAPSHOT_HEADER_SIZE - len(SNAPSHOT_MAGIC) - 8
+            if len(header_bytes) > max_header_length:
+                raise ValueError("快照头部过长")
+            f.seek(0)
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack('<Q', max_header_length))
+            f.write(header_bytes.ljust(max_header_length, b' '))
+        tmp_path.replace(output_path)
+    finally:
+        records_path.unlink(missing_ok=True)
+        tmp_path.unlink(missing_ok=True)
+
+    size_mb = output_path.stat().st_size / (1024 * 1024)
+    print(f"✅ 快照导出完成: {header['count']} 条, 维度 {header['dim']}, {dtype}, {size_mb:.1f} MB")
+    return header
+
+def read_snapshot_header(snapshot_path: str) -> Dict:
+    """读取快照头部信息（不加载向量和元数据）"""
+    with open(snapshot_path, 'rb') as f:
+        magic = f.read(len(SNAPSHOT_MAGIC))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"不是有效的索引快照文件: {snapshot_path}")
+        (header_length,) = struct.unpack('<Q', f.read(8))
+        return json.loads(f.read(header_length).decode('utf-8'))
+
+class SnapshotCollection:
+    """
+    从快照文件提供只读检索的集合
+
+    接口与ChromaDB集合的 count/get/query 保持一致，可以直接替换
+    VectorDatabaseManager / EnhancedVectorDatabaseManager 的 collection。
+    向量、行偏移表、ID索引和行记录都只做内存映射，get/query只解析结果行
+    """
+
+    def __init__(self, snapshot_path: str):
+        self.snapshot_path = str(snapshot_path)
+        self.header = read_snapshot_header(self.snapshot_path)
+        if self.header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"快照格式版本 {self.header.get('version')} 已不再支持，"
+                             f"请用 index_snapshot.py 重新导出: {self.snapshot_path}")
+        self.name = self.header["collection_name"]
+        count = self.header["count"]
+
+        # 启动时只建立映射，不读取数据页
+        self.vectors = np.memmap(
+            self.snapshot_path,
+            dtype=self.header["dtype"],
+            mode='r',
+            offset=self.header["vectors_offset"],
+            shape=(count, self.header["dim"])
+        )
+        self._row_offsets = np.memmap(self.snapshot_path, dtype='<u8', mode='r',
+                                      offset=self.header["row_offsets_offset"], shape=(count + 1,))
+        self._id_hashes = np.memmap(self.snapshot_path, dtype='<u8', mode='r',
+                                    offset=self.header["id_hashes_offset"], shape=(count,))
+        self._id_rows = np.memmap(self.snapshot_path, dtype='<u8', mode='r',
+                                  offset=self.header["id_rows_offset"], shape=(count,))
+        with open(self.snapshot_path, 'rb') as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _row(self, index: int) -> list:
+        """解析单行记录 [id, 文档, 元数据]"""
+        start = self.header["records_offset"] + int(self._row_offsets[index])
+        end = self.header["records_offset"] + int(self._row_offsets[index + 1])
+        return json.loads(self._records[start:end].decode('utf-8'))
+
+    def _lookup_ids(self, ids: List[str]) -> List[int]:
+        """通过ID哈希索引二分查找行号（哈希冲突时核对记录中的ID）"""
+        indices = []
+        for doc_id in ids:
+            target = np.uint64(_id_hash(doc_id))
+            position = int(np.searchsorted(self._id_hashes, target, side='left'))
+            while position < len(self._id_hashes) and self._id_hashes[position] == target:
+                row = int(self._id_rows[position])
+                if self._row(row)[0] == doc_id:
+                    indices.append(row)
+                    break
+                position += 1
+        return indices
+
+    def count(self) -> int:
+        return self.header["count"]
+
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[List[str]] = None) -> Dict:
+        """按ID或分页读取条目"""
+        include = include or ['documents', 'metadatas']
+
+        if ids is not None:
+            indices = self._lookup_ids(ids)
+        else:
+            start = offset or 0
+            end = self.count() if limit is None else min(start + limit, self.count())
+            indices = list(range(start, end))
+
+        rows = [self._row(i) for i in indices]
+        result = {'ids': [row[0] for row in rows]}
+        if 'documents' in include:
+            result['documents'] = [row[1] for row in rows]
+        if 'metadatas' in include:
+            result['metadatas'] = [row[2] for row in rows]
+        if 'embeddings' in include:
+            result['embeddings'] = np.asarray(self.vectors[indices], dtype=np.float32)
+        return result
+
+    def search(self, query_vector, n_results: int, row_start: int = 0,
+               row_end: Optional[int] = None):
+        """
+        对单个查询向量做精确的余弦检索
+
+        Args:
+            query_vector: 查询向量
+            n_results: 返回数量
+            row_start, row_end: 只检索 [row_start, row_end) 范围内的行（用于分区并行检索）
+
+        Returns:
+            (行号数组, 距离数组)，按距离升序
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        row_end = self.count() if row_end is None else min(row_end, self.count())
+        n_results = min(n_results, row_end - row_start)
+        if n_results <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        best_indices = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(row_start, row_end, QUERY_CHUNK_ROWS):
+            block = np.asarray(self.vectors[start:min(start + QUERY_CHUNK_ROWS, row_end)], dtype=np.float32)
+            scores = block @ query
+            if len(scores) > n_results:
+                top = np.argpartition(-scores, n_results - 1)[:n_results]
+            else:
+                top = np.arange(len(scores))
+            best_indices = np.concatenate([best_indices, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_scores) > n_results:
+                keep = np.argpartition(-best_scores, n_results - 1)[:n_results]
+                best_indices, best_scores = best_indices[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores)
+        return best_indices[order], 1.0 - best_scores[order]
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              include: Optional[List[str]] = None) -> Dict:
+        """与ChromaDB集合的query接口兼容的检索"""
+        results = {'ids': [], 'distances': [], 'documents': [], 'metadatas': []}
+
+        for query_vector in query_embeddings:
+            indices, distances = self.search(query_vector, n_results)
+            self._append_rows(results, indices, distances)
+
+        return results
+
+    def _append_rows(self, results: Dict, indices, distances):
+        """把一次检索命中的行按query结果格式追加到results"""
+        rows = [self._row(int(i)) for i in indices]
+        results['ids'].append([row[0] for row in rows])
+        results['distances'].append([float(d) for d in distances])
+        results['documents'].append([row[1] for row in rows])
+        results['metadatas'].append([row[2] for row in rows])
+
+    def add(self, *args, **kwargs):
+        raise RuntimeError("快照集合是只读的，请在ChromaDB集合上写入后重新导出快照")
+
+    def to_numpy(self) -> np.ndarray:
+        """返回内存映射的向量矩阵 (count, dim)"""
+        return self.vectors
+
+    def to_dataframe(self, include_vectors: bool = False):
+        """将快照加载为pandas DataFrame（每行一个三元组，会解析全部行记录）"""
+        import pandas as pd
+
+        rows = [self._row(i) for i in range(self.count())]
+        frame = pd.DataFrame([row[2] for row in rows])
+        frame.insert(0, 'id', [row[0] for row in rows])
+        frame['document'] = [row[1] for row in rows]
+        if include_vectors:
+            frame['embedding'] = list(self.vectors)
+        return frame
+
+def load_snapshot(snapshot_path: str) -> SnapshotCollection:
+    """加载快照，返回只读集合"""
+    start_time = time.time()
+    collection = SnapshotCollection(snapshot_path)
+    elapsed_ms = (time.time() - start_time) * 1000
+    print(f"✅ 快照加载完成: {collection.name} ({collection.count()} 条, "
+          f"{collection.header['dtype']}) 耗时 {elapsed_ms:.1f} ms")
+    return collection
+
+def default_snapshot_path(collection_name: str) -> str:
+    """集合默认的快照文件路径"""
+    return str(Path(config.SNAPSHOT_DIR) / f"{collection_name}.kgsnap")
+
+def main():
+    """命令行入口 - 导出或检查索引快照"""
+    parser = argparse.ArgumentParser(description="导出/检查可内存映射的索引快照")
+    parser.add_argument('--collection', default=config.COLLECTION_NAME + "_enhanced",
+                       help='要导出的集合名称')
+    parser.add_argument('--output', default=None, help='快照输出路径')
+    parser.add_argument('--dtype', choices=SUPPORTED_DTYPES, default='float32',
+                       help='向量存储精度')
+    parser.add_argument('--inspect', default=None, help='只查看指定快照文件的头部信息')
+
+    args = parser.parse_args()
+
+    if args.inspect:
+        print(json.dumps(read_snapshot_header(args.inspect), indent=2, ensure_ascii=False))
+        return
+
+    from shared_resources import get_chroma_client, resolve_collection_alias
+    # 按别名当前指向的实际集合导出，快照文件名仍使用别名，检索端的默认路径不变
+    collection = get_chroma_client(config.CHROMA_DB_PATH).get_collection(
+        name=resolve_collection_alias(args.collection))
+    export_snapshot(collection, args.output or default_snapshot_path(args.collection), dtype=args.dtype)
+
+# 测试函数
+def test_index_snapshot():
+    """测试快照导出和加载（使用内存中的模拟集合）"""
+    import tempfile
+
+    class _MockCollection:
+        name = "mock_collection"
+
+        def __init__(self):
+            rng = np.random.default_rng(0)
+            self.embeddings = rng.normal(size=(50, 16)).astype(np.float32)
+            self.ids = [f"id_{i}" for i in range(50)]
+
+        def count(self):
+            return len(self.ids)
+
+        def get(self, limit, offset, include):
+            rows = range(offset, min(offset + limit, len(self.ids)))
+            return {
+                'ids': [self.ids[i] for i in rows],
+                'documents': [f"doc {i}" for i in rows],
+                'metadatas': [{'sub': f"S{i}", 'rel': 'leader', 'obj': f"O{i}"} for i in rows],
+                'embeddings': self.embeddings[list(rows)]
+            }
+
+    mock = _MockCollection()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "mock.kgsnap")
+        export_snapshot(mock, path, dtype='float16', page_size=16)
+        snapshot = load_snapshot(path)
+
+        results = snapshot.query([mock.embeddings[7].tolist()], n_results=3)
+        print(f"Top-1 ID: {results['ids'][0][0]} (预期: id_7)")
+        print(f"Top-1 距离: {results['distances'][0][0]:.4f}")
+        print(f"元数据: {results['metadatas'][0][0]}")
+        del snapshot
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ sys.path.append(str(Path(__file__).parent))
 
 from enhanced_embedding_system import EnhancedVectorDatabaseManager
 from data_loader import KnowledgeDataLoader
+from shared_resources import resolve_collection_alias
 import config
 
 def initialize_enhanced_database(reset: bool = False, show_progress: bool = True):
@@ -25,7 +26,7 @@ def initialize_enhanced_database(reset: bool = False, show_progress: bool = True
     print(f"   - 数据源: {config.DATASET_PATHS}")
     print(f"   - 嵌入模型: {config.EMBEDDING_MODEL}")
     print(f"   - 数据库路径: {config.CHROMA_DB_PATH}")
-    print(f"   - 集合名称: {config.ENHANCED_COLLECTION_NAME}")
+    print(f"   - 集合名称: {config.ENHANCED_COLLECTION_NAME} -> {resolve_collection_alias(config.ENHANCED_COLLECTION_NAME)}")
     print(f"   - 批处理大小: {config.BATCH_SIZE}")
     
     try:
@@ -202,6 +203,7 @@ def main():
     parser.add_argument('--check', action='store_true', help='只检查数据库状态')
     parser.add_argument('--compare', action='store_true', help='对比嵌入方法')
     parser.add_argument('--quiet', action='store_true', help='静默模式，减少输出')
+    parser.add_argument('--both', action='store_true', help='单次遍历同时构建原始集合和增强集合（A/B对比）')
     
     args = parser.parse_args()
     
@@ -217,6 +219,12 @@ def main():
         compare_embedding_methods()
         return
     
+    if args.both:
+        # 共用语料加载和嵌入批次构建两个集合
+        from multi_target_ingest import MultiTargetIngestor
+        MultiTargetIngestor(reset=args.reset).populate()
+        return
+    
     # 执行初始化
     success = initialize_enhanced_database(
         reset=args.reset, 
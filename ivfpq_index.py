@@ -0,0 +1,310 @@
+# ivfpq_index.py - 磁盘驻留的IVF-PQ索引（倒排列表 + 乘积量化）
+
+import argparse
+import time
+from pathlib import Path
+from typing import List, Dict
+import numpy as np
+import config
+from index_snapshot import SnapshotCollection, QUERY_CHUNK_ROWS
+
+# 训练质心/码本时最多使用的样本行数
+KMEANS_TRAIN_SAMPLE = 100000
+KMEANS_ITERATIONS = 20
+# 每个子空间的码本大小（uint8编码）
+PQ_CODEBOOK_SIZE = 256
+
+def ivfpq_index_paths(snapshot_path: str) -> Dict[str, str]:
+    """
+    IVF-PQ索引的文件路径：
+    - params: 粗质心、PQ码本和倒排列表偏移 (.npz，常驻内存，体积很小)
+    - codes: 按倒排列表排序的PQ码 (.npy，内存映射，只有被探测的列表会被读入)
+    - rows: 每个PQ码对应的快照行号 (.npy，内存映射)
+    """
+    base = f"{snapshot_path}.ivfpq"
+    return {'params': base + ".npz", 'codes': base + ".codes.npy", 'rows': base + ".rows.npy"}
+
+def _assign(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """按L2距离把每行分配到最近的质心（分块计算，避免生成完整距离矩阵）"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), 8192):
+        block = data[start:start + 8192]
+        distances = centroid_norms - 2 * block @ centroids.T
+        labels[start:start + len(block)] = np.argmin(distances, axis=1)
+    return labels
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """简单的Lloyd k-means，空簇用随机样本重新初始化"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=len(data) < k)].copy()
+    for _ in range(iterations):
+        labels = _assign(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+    return centroids
+
+def build_ivfpq_index(snapshot_path: str, nlist: int = None, num_subquantizers: int = 64) -> Dict[str, str]:
+    """
+    从索引快照离线构建IVF-PQ索引
+
+    Args:
+        snapshot_path: 索引快照文件
+        nlist: 倒排列表（粗质心）数量，默认约为 4 * sqrt(条目数)
+        num_subquantizers: PQ子空间数量，每条向量编码为该数量的字节
+    """
+    snapshot = SnapshotCollection(snapshot_path)
+    vectors = snapshot.to_numpy()
+    total, dim = vectors.shape
+    if dim % num_subquantizers != 0:
+        raise ValueError(f"维度 {dim} 不能被子空间数量 {num_subquantizers} 整除")
+    nlist = nlist or max(1, int(4 * np.sqrt(total)))
+    sub_dim = dim // num_subquantizers
+
+    print(f"🔄 构建IVF-PQ索引: {total} 条, {dim} 维, nlist={nlist}, "
+          f"{num_subquantizers} 个子空间 -> {num_subquantizers} 字节/条")
+
+    rng = np.random.default_rng(0)
+    sample_rows = np.sort(rng.choice(total, size=min(total, KMEANS_TRAIN_SAMPLE), replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+    # 1. 粗质心（在归一化向量上训练，检索时用内积打分）
+    centroids = _kmeans(sample, nlist)
+
+    # 2. 在残差上训练每个子空间的PQ码本
+    residuals = sample - centroids[_assign(sample, centroids)]
+    codebooks = np.stack([
+        _kmeans(residuals[:, j * sub_dim:(j + 1) * sub_dim], min(PQ_CODEBOOK_SIZE, len(sample)), seed=j)
+        for j in range(num_subquantizers)
+    ])
+    if codebooks.shape[1] < PQ_CODEBOOK_SIZE:
+        padding = np.zeros((num_subquantizers, PQ_CODEBOOK_SIZE - codebooks.shape[1], sub_dim), dtype=np.float32)
+        codebooks = np.concatenate([codebooks, padding], axis=1)
+
+    # 3. 按快照顺序分块编码全部向量（标签和PQ码先写入临时的内存映射文件，不在内存中保留全部结果）
+    paths = ivfpq_index_paths(snapshot_path)
+    tmp_labels_path, tmp_codes_path = paths['rows'] + ".labels.tmp", paths['codes'] + ".tmp"
+    labels = np.lib.format.open_memmap(tmp_labels_path, mode='w+', dtype=np.int32, shape=(total,))
+    codes_unsorted = np.lib.format.open_memmap(tmp_codes_path, mode='w+', dtype=np.uint8,
+                                               shape=(total, num_subquantizers))
+    list_sizes = np.zeros(nlist, dtype=np.int64)
+    for start in range(0, total, QUERY_CHUNK_ROWS):
+        block = np.asarray(vectors[start:start + QUERY_CHUNK_ROWS], dtype=np.float32)
+        end = start + len(block)
+        block_labels = _assign(block, centroids)
+        labels[start:end] = block_labels
+        list_sizes += np.bincount(block_labels, minlength=nlist)
+        block_residuals = block - centroids[block_labels]
+        for j in range(num_subquantizers):
+            codes_unsorted[start:end, j] = _assign(block_residuals[:, j * sub_dim:(j + 1) * sub_dim], codebooks[j])
+
+    # 4. 按倒排列表分块重排（计数排序），使每个列表在磁盘上连续
+    offsets = np.concatenate([[0], np.cumsum(list_sizes)]).astype(np.int64)
+    cursors = offsets[:-1].copy()
+    codes = np.lib.format.open_memmap(paths['codes'], mode='w+', dtype=np.uint8, shape=(total, num_subquantizers))
+    rows = np.lib.format.open_memmap(paths['rows'], mode='w+', dtype=np.int64, shape=(total,))
+    for start in range(0, total, QUERY_CHUNK_ROWS):
+        block_labels = np.asarray(labels[start:start + QUERY_CHUNK_ROWS])
+        order = np.argsort(block_labels, kind='stable')
+        sorted_labels = block_labels[order]
+        counts = np.bincount(sorted_labels, minlength=nlist)
+        rank = np.arange(len(order)) - (np.cumsum(counts) - counts)[sorted_labels]
+        positions = cursors[sorted_labels] + rank
+        codes[positions] = codes_unsorted[start + order]
+        rows[positions] = start + order
+        cursors += counts
+    codes.flush()
+    rows.flush()
+    del codes, rows, labels, codes_unsorted
+    Path(tmp_labels_path).unlink()
+    Path(tmp_codes_path).unlink()
+
+    np.savez(paths['params'], centroids=centroids, codebooks=codebooks, offsets=offsets)
+    print(f"✅ IVF-PQ索引已保存: {paths['codes']} "
+          f"(列表大小 平均 {list_sizes.mean():.1f}, 最大 {list_sizes.max()})")
+    return paths
+
+class IVFPQCollection:
+    """
+    IVF-PQ检索集合
+
+    查询时只探测与问题最相似的nprobe个倒排列表，用查表法(ADC)计算PQ近似内积；
+    开启rerank时再用快照中的全精度向量对 n_results * oversample 个候选精确重打分。
+    PQ码和行号均为内存映射文件，只有被探测的列表会被读入内存；
+    结果行的ID、文档和元数据也从快照的内存映射行记录中按需解析。
+    接口与ChromaDB集合的 count/get/query 一致。
+    """
+
+    def __init__(self, snapshot_path: str, nprobe: int = None, rerank: bool = True,
+                 oversample: int = None):
+        self.snapshot = SnapshotCollection(snapshot_path)
+        self.name = self.snapshot.name
+        self.nprobe = nprobe or config.IVF_NPROBE
+        self.rerank = rerank
+        self.oversample = oversample or config.IVF_RERANK_OVERSAMPLE
+
+        paths = ivfpq_index_paths(snapshot_path)
+        params = np.load(paths['params'])
+        self.centroids = params['centroids']
+        self.codebooks = params['codebooks']
+        self.offsets = params['offsets']
+        self.codes = np.load(paths['codes'], mmap_mode='r')
+        self.rows = np.load(paths['rows'], mmap_mode='r')
+        self.num_subquantizers, _, self.sub_dim = self.codebooks.shape
+
+    def count(self) -> int:
+        return self.snapshot.count()
+
+    def get(self, *args, **kwargs) -> Dict:
+        return self.snapshot.get(*args, **kwargs)
+
+    def search(self, query_vector, n_results: int):
+        """探测nprobe个倒排列表 + PQ近似打分 (+ 精确重打分)，返回 (行号数组, 距离数组)"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        centroid_scores = self.centroids @ query
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        # 查找表: lut[j, c] = 第j个子空间中 query_j 与码字c的内积
+        query_sub = query.reshape(self.num_subquantizers, self.sub_dim)
+        lut = np.einsum('jcd,jd->jc', self.codebooks, query_sub)
+        subspaces = np.arange(self.num_subquantizers)
+
+        candidate_rows, candidate_scores = [], []
+        for probe in probes:
+            start, end = self.offsets[probe], self.offsets[probe + 1]
+            if start == end:
+                continue
+            codes = np.asarray(self.codes[start:end])
+            candidate_scores.append(centroid_scores[probe] + lut[subspaces, codes].sum(axis=1))
+            candidate_rows.append(np.asarray(self.rows[start:end]))
+
+        if not candidate_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows = np.concatenate(candidate_rows)
+        scores = np.concatenate(candidate_scores)
+        n_candidates = min(len(rows), n_results * self.oversample if self.rerank else n_results)
+        if len(rows) > n_candidates:
+            top = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+            rows, scores = rows[top], scores[top]
+
+        if self.rerank:
+            order = np.argsort(rows)
+            rows = rows[order]
+            scores = np.asarray(self.snapshot.vectors[rows], dtype=np.float32) @ query
+
+        order = np.argsort(-scores)[:n_results]
+        return rows[order], 1.0 - scores[order]
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10) -> Dict:
+        results = {'ids': [], 'distances': [], 'documents': [], 'metadatas': []}
+        for query_vector in query_embeddings:
+            indices, distances = self.search(query_vector, n_results)
+            self.snapshot._append_rows(results, indices, distances)
+        return results
+
+    def memory_stats(self) -> Dict:
+        """全精度向量、PQ码与常驻参数的存储大小 (MB)"""
+        resident = self.centroids.nbytes + self.codebooks.nbytes + self.offsets.nbytes
+        return {
+            'full_mb': self.snapshot.vectors.nbytes / (1024 * 1024),
+            'codes_mb': (self.codes.nbytes + self.rows.nbytes) / (1024 * 1024),
+            'resident_mb': resident / (1024 * 1024)
+        }
+
+def benchmark_ivfpq_index(snapshot_path: str, k: int = 10, num_queries: int = 100,
+                          nprobe_values: List[int] = None) -> List[Dict]:
+    """对比IVF-PQ与全精度精确检索的recall@k和延迟"""
+    full = SnapshotCollection(snapshot_path)
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(full.count(), size=min(num_queries, full.count()), replace=False))
+    query_vectors = np.asarray(full.vectors[rows], dtype=np.float32)
+
+    start = time.perf_counter()
+    truth = [set(full.search(q, k)[0].tolist()) for q in query_vectors]
+    full_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+
+    report = []
+    for rerank in (False, True):
+        for nprobe in nprobe_values or [1, 4, 16, 64]:
+            index = IVFPQCollection(snapshot_path, nprobe=nprobe, rerank=rerank)
+            start = time.perf_counter()
+            found = [set(index.search(q, k)[0].tolist()) for q in query_vectors]
+            ivf_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+            report.append({
+                'nprobe': nprobe,
+                'rerank': rerank,
+                f'recall@{k}': float(np.mean([len(f & t) / k for f, t in zip(found, truth)])),
+                'ivf_ms': ivf_ms,
+                'full_ms': full_ms,
+                **index.memory_stats()
+            })
+    return report
+
+def main():
+    """命令行入口 - 构建IVF-PQ索引并输出基准报告"""
+    parser = argparse.ArgumentParser(description="磁盘驻留的IVF-PQ索引")
+    parser.add_argument('snapshot', help='索引快照文件 (index_snapshot.py导出)')
+    parser.add_argument('--nlist', type=int, default=None, help='倒排列表数量（默认约 4*sqrt(N)）')
+    parser.add_argument('--subquantizers', type=int, default=64, help='PQ子空间数量（需整除向量维度）')
+    parser.add_argument('--k', type=int, default=10, help='recall@k中的k')
+    parser.add_argument('--no-benchmark', action='store_true', help='只构建索引，不运行基准测试')
+
+    args = parser.parse_args()
+
+    build_ivfpq_index(args.snapshot, args.nlist, args.subquantizers)
+    if args.no_benchmark:
+        return
+
+    print(f"\n📊 基准测试 (recall@{args.k} 相对全精度精确检索):")
+    for row in benchmark_ivfpq_index(args.snapshot, k=args.k):
+        print(f"   nprobe={row['nprobe']:<3} rerank={str(row['rerank']):<5} "
+              f"recall@{args.k}={row[f'recall@{args.k}']:.4f} "
+              f"延迟 {row['ivf_ms']:.2f}ms vs {row['full_ms']:.2f}ms "
+              f"PQ码 {row['codes_mb']:.1f}MB vs 全精度 {row['full_mb']:.1f}MB")
+
+# 测试函数
+def test_ivfpq_index():
+    """在模拟的聚簇语料上测试IVF-PQ检索"""
+    import tempfile
+    from index_snapshot import export_snapshot
+
+    class _MockCollection:
+        name = "mock_collection"
+
+        def __init__(self, count=5000, dim=128, clusters=50):
+            rng = np.random.default_rng(0)
+            centers = rng.normal(size=(clusters, dim))
+            self.embeddings = (centers[rng.integers(clusters, size=count)]
+                               + 0.3 * rng.normal(size=(count, dim))).astype(np.float32)
+
+        def count(self):
+            return len(self.embeddings)
+
+        def get(self, limit, offset, include):
+            rows = range(offset, min(offset + limit, self.count()))
+            return {
+                'ids': [f"id_{i}" for i in rows],
+                'documents': [f"doc {i}" for i in rows],
+                'metadatas': [{'rel': 'leader'} for _ in rows],
+                'embeddings': self.embeddings[offset:offset + len(rows)]
+            }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "mock.kgsnap")
+        export_snapshot(_MockCollection(), path)
+        build_ivfpq_index(path, nlist=64, num_subquantizers=16)
+        for row in benchmark_ivfpq_index(path, k=10, num_queries=50, nprobe_values=[1, 8]):
+            print(f"nprobe={row['nprobe']} rerank={row['rerank']} recall@10={row['recall@10']:.3f} "
+                  f"PQ码 {row['codes_mb']:.2f}MB vs 全精度 {row['full_mb']:.2f}MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# llm_gateway.py - 统一的LLM调用入口（共享客户端 + 持久化响应缓存）
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Iterator, Optional
+import config
+from shared_resources import get_openai_client
+
+# 缓存策略
+#   always:        读写缓存（不论温度，适合需要可复现结果的评估）
+#   deterministic: 只缓存 temperature == 0 的调用
+#   refresh:       不读缓存，但写入新结果（强制刷新）
+#   off:           不使用缓存
+CACHE_POLICIES = ('always', 'deterministic', 'refresh', 'off')
+
+def cache_key(model: str, messages: List[Dict], temperature: float, max_tokens: Optional[int]) -> str:
+    """缓存键：(模型, 消息, 温度, 最大token数) 的SHA-256"""
+    payload = json.dumps({'model': model, 'messages': messages, 'temperature': temperature,
+                          'max_tokens': max_tokens}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class LLMResponseCache:
+    """
+    SQLite持久化的LLM响应缓存，超过条目上限时按最近使用时间淘汰
+    """
+
+    def __init__(self, db_path: str, max_entries: int = None):
+        self.db_path = db_path
+        self.max_entries = max_entries or config.LLM_CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS llm_responses "
+                         "(key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_last_used ON llm_responses (last_used)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT response FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE llm_responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO llm_responses (key, model, response, created, last_used) "
+                             "VALUES (?, ?, ?, ?, ?)", (key, model, response, now, now))
+            overflow = self._db.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._db.execute("DELETE FROM llm_responses WHERE key IN "
+                                 "(SELECT key FROM llm_responses ORDER BY last_used LIMIT ?)", (overflow,))
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM llm_responses")
+            self._db.commit()
+
+class LLMGateway:
+    """
+    所有OpenAI chat调用的统一入口
+
+    - 复用进程内共享的OpenAI客户端（连接池），不再每次调用都新建客户端
+    - 按调用方（caller）的缓存策略读写持久化响应缓存，重复运行评估时直接命中
+    """
+
+    def __init__(self, cache: Optional[LLMResponseCache] = None, policies: Dict[str, str] = None):
+        self.cache = cache
+        self.policies = dict(config.LLM_CACHE_POLICIES if policies is None else policies)
+        self.stats = {}
+
+    def policy_for(self, caller: str) -> str:
+        policy = self.policies.get(caller, config.LLM_CACHE_DEFAULT_POLICY)
+        return policy if policy in CACHE_POLICIES else 'off'
+
+    def _record(self, caller: str, outcome: str):
+        caller_stats = self.stats.setdefault(caller, {'hits': 0, 'misses': 0, 'uncached': 0})
+        caller_stats[outcome] += 1
+
+    def chat(self, messages: List[Dict], model: str = "gpt-3.5-turbo", temperature: float = 0.0,
+             max_tokens: Optional[int] = None, caller: str = "default", api_key: Optional[str] = None) -> str:
+        """
+        发送chat请求并返回回复文本；API错误原样抛出，由调用方决定回退方式
+
+        Args:
+            messages: OpenAI格式的消息列表
+            caller: 调用方名称，用于选择缓存策略和统计
+            api_key: API密钥，默认使用config.OPENAI_API_KEY
+        """
+        policy = self.policy_for(caller)
+        cacheable = self.cache is not None and (
+            policy in ('always', 'refresh') or (policy == 'deterministic' and temperature == 0)
+        )
+        key = cache_key(model, messages, temperature, max_tokens) if cacheable else None
+
+        if cacheable and policy != 'refresh':
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record(caller, 'hits')
+                return cached
+
+        client = get_openai_client(api_key)
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        content = response.choices[0].message.content or ""
+
+        if cacheable:
+            self.cache.put(key, model, content)
+            self._record(caller, 'misses')
+        else:
+            self._record(caller, 'uncached')
+        return content
+
+    def stream_chat(self, messages: List[Dict], model: str = "gpt-3.5-turbo", temperature: float = 0.0,
+                    max_tokens: Optional[int] = None, caller: str = "default",
+                    api_key: Optional[str] = None) -> Iterator[str]:
+        """
+        流式发送chat请求，逐段产出回复文本；缓存策略与chat()相同
+
+        缓存命中时一次性产出完整回复；完整接收后才写入缓存（中途中断的回复不缓存）
+        """
+        policy = self.policy_for(caller)
+        cacheable = self.cache is not None and (
+            policy in ('always', 'refresh') or (policy == 'deterministic' and temperature == 0)
+        )
+        key = cache_key(model, messages, temperature, max_tokens) if cacheable else None
+
+        if cacheable and policy != 'refresh':
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record(caller, 'hits')
+                yield cached
+                return
+
+        client = get_openai_client(api_key)
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+
+        if cacheable:
+            self.cache.put(key, model, "".join(parts))
+            self._record(caller, 'misses')
+        else:
+            self._record(caller, 'uncached')
+
+    def print_stats(self):
+        if not self.stats:
+            return
+        print("📊 LLM调用统计:")
+        for caller, caller_stats in self.stats.items():
+            print(f"   {caller} [{self.policy_for(caller)}]: 缓存命中 {caller_stats['hits']}, "
+                  f"未命中 {caller_stats['misses']}, 不缓存 {caller_stats['uncached']}")
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> LLMGateway:
+    """获取进程内共享的LLM网关（缓存按config.LLM_CACHE_ENABLED开启）"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            cache = LLMResponseCache(config.LLM_CACHE_FILE) if config.LLM_CACHE_ENABLED else None
+            _gateway = LLMGateway(cache)
+        return _gateway
+
+def chat_completion(messages: List[Dict], model: str = "gpt-3.5-turbo", temperature: float = 0.0,
+                    max_tokens: Optional[int] = None, caller: str = "default",
+                    api_key: Optional[str] = None) -> str:
+    """通过共享网关发送chat请求（get_llm_gateway().chat 的简写）"""
+    return get_llm_gateway().chat(messages, model=model, temperature=temperature, max_tokens=max_tokens,
+                                  caller=caller, api_key=api_key)
+
+def stream_chat_completion(messages: List[Dict], model: str = "gpt-3.5-turbo", temperature: float = 0.0,
+                           max_tokens: Optional[int] = None, caller: str = "default",
+                           api_key: Optional[str] = None) -> Iterator[str]:
+    """通过共享网关流式发送chat请求（get_llm_gateway().stream_chat 的简写）"""
+    return get_llm_gateway().stream_chat(messages, model=model, temperature=temperature, max_tokens=max_tokens,
+                                         caller=caller, api_key=api_key)
+
+# 测试函数
+def test_llm_gateway():
+    """用模拟客户端测试缓存策略和淘汰"""
+    import tempfile
+    import shared_resources
+
+    calls = []
+
+    class _MockCompletions:
+        def create(self, model, messages, temperature, max_tokens):
+            calls.append(messages[-1]['content'])
+            message = type('Message', (), {'content': f"answer to {messages[-1]['content']}"})
+            return type('Response', (), {'choices': [type('Choice', (), {'message': message})]})
+
+    mock_client = type('MockClient', (), {'chat': type('Chat', (), {'completions': _MockCompletions()})})
+    shared_resources._openai_clients['mock-key'] = mock_client
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = LLMResponseCache(str(Path(tmp_dir) / "llm.db"), max_entries=2)
+        gateway = LLMGateway(cache, policies={'eval': 'always', 'qa': 'deterministic'})
+        for question in ["q1", "q2", "q1", "q3", "q1"]:
+            gateway.chat([{'role': 'user', 'content': question}], temperature=0.0, caller='eval', api_key='mock-key')
+        gateway.chat([{'role': 'user', 'content': "qa"}], temperature=0.3, caller='qa', api_key='mock-key')
+        gateway.chat([{'role': 'user', 'content': "qa"}], temperature=0.3, caller='qa', api_key='mock-key')
+        print(f"实际API调用: {calls} (预期: ['q1', 'q2', 'q3', 'qa', 'qa'])")
+        print(f"缓存条目: {len(cache)} (上限 2)")
+        gateway.print_stats()
+        cache._db.close()
+
+    shared_resources._openai_clients.pop('mock-key', None)
+
+if __name__ == '__main__':
+    test_llm_gateway()
@@ -14,17 +14,44 @@ from evaluation_engine import EvaluationEngine
 class NewKGRAGSystem:
     """新的知识图谱RAG系统 - 集成CoTKR重写功能"""
     
-    def __init__(self):
+    def __init__(self, snapshot_path: str = None):
+        """
+        Args:
+            snapshot_path: 只读索引快照路径；提供时检索引擎直接从快照检索，不打开ChromaDB集合
+        """
         self.data_loader = KnowledgeDataLoader()
-        self.db_manager = VectorDatabaseManager()
-        self.retrieval_engine = RetrievalEngine()
         self.qa_generator = QAGenerator()
-        self.evaluator = EvaluationEngine()
+        self.snapshot_path = snapshot_path
+        # 数据库管理器、检索引擎和评估引擎在第一次使用时才创建（创建时会打开ChromaDB集合）
+        self._db_manager = None
+        self._retrieval_engine = None
+        self._evaluator = None
         
         print("🚀 新KG-RAG系统初始化完成")
         print(f"   - 嵌入模型: {config.EMBEDDING_MODEL}")
-        print(f"   - 数据库路径: {config.CHROMA_DB_PATH}")
-        print(f"   - 集合名称: {config.COLLECTION_NAME}")
+        if snapshot_path:
+            print(f"   - 索引快照: {snapshot_path}")
+        else:
+            print(f"   - 数据库路径: {config.CHROMA_DB_PATH}")
+            print(f"   - 集合名称: {config.COLLECTION_NAME}")
+    
+    @property
+    def db_manager(self) -> VectorDatabaseManager:
+        if self._db_manager is None:
+            self._db_manager = VectorDatabaseManager()
+        return self._db_manager
+    
+    @property
+    def retrieval_engine(self) -> RetrievalEngine:
+        if self._retrieval_engine is None:
+            self._retrieval_engine = RetrievalEngine(snapshot_path=self.snapshot_path)
+        return self._retrieval_engine
+    
+    @property
+    def evaluator(self) -> EvaluationEngine:
+        if self._evaluator is None:
+            self._evaluator = EvaluationEngine()
+        return self._evaluator
     
     def setup_database(self, reset: bool = False):
         """设置数据库"""
@@ -48,8 +75,20 @@ class NewKGRAGSystem:
         stats = self.db_manager.get_database_stats()
         print(f"✅ 数据库设置完成: {stats['total_documents']} 个文档")
     
-    def interactive_query(self):
-        """交互式查询模式"""
+    def use_snapshot(self, snapshot_path: str):
+        """使用只读索引快照提供检索；检索引擎尚未创建时不会再打开ChromaDB集合"""
+        print(f"⚡ 使用索引快照: {snapshot_path}")
+        self.snapshot_path = snapshot_path
+        if self._retrieval_engine is not None:
+            self._retrieval_engine.db_manager.use_snapshot(snapshot_path)
+    
+    def interactive_query(self, stream: bool = True):
+        """
+        交互式查询模式
+        
+        Args:
+            stream: 检索完成后立即显示三元组，并流式输出最终答案
+        """
         print("\n🤖 进入交互式查询模式")
         print("输入问题进行查询，输入 'quit' 退出")
         print("-" * 50)
@@ -65,6 +104,10 @@ class NewKGRAGSystem:
                 if not question:
                     continue
                 
+                if stream:
+                    self._stream_query(question)
+                    continue
+                
                 print("🔍 正在检索和重写知识...")
                 result = self.retrieval_engine.retrieve_and_rewrite(question)
                 
@@ -92,6 +135,40 @@ class NewKGRAGSystem:
             except Exception as e:
                 print(f"❌ 错误: {e}")
     
+    def _stream_query(self, question: str):
+        """流式查询：三元组和CoTKR知识一就绪就显示，答案逐段输出"""
+        print("🔍 正在检索...")
+        
+        def show_retrieved(items):
+            print(f"\n📋 检索到的三元组:")
+            for i, item in enumerate(items[:3], 1):
+                print(f"   {i}. {item['triple']} (距离: {item['distance']:.4f})")
+        
+        def show_knowledge(knowledge):
+            print(f"\n🧠 CoTKR重写知识:")
+            print(knowledge)
+            print(f"\n💡 最终答案: ", end="", flush=True)
+        
+        result = self.retrieval_engine.stream_retrieve_and_rewrite(
+            question,
+            on_retrieved=show_retrieved,
+            on_knowledge=show_knowledge,
+            on_token=lambda delta: print(delta, end="", flush=True)
+        )
+        print()
+        
+        if 'retrieval_stats' in result:
+            stats = result['retrieval_stats']
+            print(f"\n📊 检索统计:")
+            print(f"   - 问题类型: {stats['question_type']}")
+            print(f"   - 检索数量: {stats['num_retrieved']}")
+            print(f"   - 平均距离: {stats['avg_distance']:.4f}")
+        
+        timing = result['timing']
+        print(f"\n⏱ 检索 {timing['retrieval_ms']:.0f}ms | 首个token {timing['first_token_ms']:.0f}ms | "
+              f"总计 {timing['total_ms']:.0f}ms")
+        print("-" * 50)
+    
     def batch_query(self, questions: List[str], output_file: str = None):
         """批量查询"""
         print(f"🔄 批量查询 {len(questions)} 个问题")
@@ -152,21 +229,25 @@ def main():
     parser.add_argument('--questions', nargs='+', help='批量查询的问题列表')
     parser.add_argument('--output', help='输出文件路径')
     parser.add_argument('--max-qa', type=int, default=50, help='生成的QA对数量')
+    parser.add_argument('--snapshot', help='使用只读索引快照检索 (由index_snapshot.py导出)')
+    parser.add_argument('--no-stream', action='store_true', help='交互模式下等全部完成后再显示结果')
     
     args = parser.parse_args()
     
-    # 初始化系统
-    system = NewKGRAGSystem()
+    # 初始化系统（快照只用于交互和批量查询）
+    use_snapshot = args.snapshot if args.mode in ('interactive', 'batch') else None
+    system = NewKGRAGSystem(snapshot_path=use_snapshot)
     
     if args.mode == 'setup':
         # 设置数据库
         system.setup_database(reset=args.reset_db)
         
     elif args.mode == 'interactive':
-        # 确保数据库已设置
-        system.setup_database(reset=args.reset_db)
+        # 确保数据库已设置（使用快照时直接从快照检索）
+        if not args.snapshot:
+            system.setup_database(reset=args.reset_db)
         # 交互式查询
-        system.interactive_query()
+        system.interactive_query(stream=not args.no_stream)
         
     elif args.mode == 'batch':
         # 批量查询
@@ -174,7 +255,8 @@ def main():
             print("❌ 批量模式需要提供问题列表")
             return
         
-        system.setup_database(reset=args.reset_db)
+        if not args.snapshot:
+            system.setup_database(reset=args.reset_db)
         results = system.batch_query(args.questions, args.output)
         
         # 打印结果摘要
@@ -0,0 +1,177 @@
+# multi_target_ingest.py - 一次语料遍历同时构建原始集合和增强集合
+
+import argparse
+from typing import List, Dict, Optional
+from tqdm import tqdm
+import config
+from data_loader import KnowledgeDataLoader, group_entries_by_document, build_provenance_metadata
+from corpus_stats import CorpusStats, get_corpus_stats
+from sharded_collection import ShardedCollection
+
+def prepare_rows(knowledge_entries: List[Dict], to_document, create_metadata,
+                 deduplicate: bool) -> Dict[str, List]:
+    """按某个集合的文本转换和元数据函数生成 ids/documents/metadatas（与populate的准备步骤一致）"""
+    if deduplicate:
+        groups = group_entries_by_document(knowledge_entries, to_document)
+    else:
+        groups = [(to_document(entry["triple"], entry["schema"]), [entry]) for entry in knowledge_entries]
+
+    metadatas = []
+    for _, group in groups:
+        metadata = create_metadata(group[0])
+        if deduplicate:
+            metadata.update(build_provenance_metadata(group))
+        metadatas.append(metadata)
+
+    return {
+        'ids': [group[0]['id'] for _, group in groups],
+        'documents': [document for document, _ in groups],
+        'metadatas': metadatas
+    }
+
+class MultiTargetIngestor:
+    """
+    多目标写入：语料只加载一次，同时生成原始文本和增强文本，
+    两个集合的文档合并去重后共用嵌入批次，嵌入完成的行按顺序写入各自集合
+    """
+
+    def __init__(self, reset: bool = False):
+        from vector_database import VectorDatabaseManager
+        from enhanced_embedding_system import EnhancedVectorDatabaseManager
+
+        # 先打开现有集合，重置时才能删除（initialize_collection只删除已打开的集合）
+        self.original_db = VectorDatabaseManager()
+        self.original_db.initialize_collection()
+        # 增强集合与检索引擎使用的默认名称一致
+        self.enhanced_db = EnhancedVectorDatabaseManager()
+        self.enhanced_db.initialize_collection()
+        if reset:
+            self.original_db.initialize_collection(reset=True)
+            self.enhanced_db.initialize_collection(reset=True)
+        self.embedding_client = self.original_db.embedding_client
+
+        self.targets = {
+            'original': (self.original_db.collection,
+                         self.original_db.triple_to_embedding_text,
+                         self.original_db.create_metadata),
+            'enhanced': (self.enhanced_db.collection,
+                         self.enhanced_db.enhanced_triple_to_text,
+                         self.enhanced_db.create_enhanced_metadata)
+        }
+
+    def _write_rows(self, collection, rows: Dict[str, List], indices: List[int],
+                    vectors: Dict[str, List[float]], corpus_stats: CorpusStats):
+        """把嵌入已完成的行分批写入集合"""
+        for i in range(0, len(indices), config.BATCH_SIZE):
+            batch = [j for j in indices[i:i + config.BATCH_SIZE] if rows['documents'][j] in vectors]
+            if not batch:
+                continue
+            batch_ids = [rows['ids'][j] for j in batch]
+            batch_metadatas = [rows['metadatas'][j] for j in batch]
+            collection.add(
+                ids=batch_ids,
+                embeddings=[vectors[rows['documents'][j]] for j in batch],
+                documents=[rows['documents'][j] for j in batch],
+                metadatas=batch_metadatas
+            )
+            corpus_stats.update(batch_ids, batch_metadatas)
+
+    def populate(self, knowledge_entries: Optional[List[Dict]] = None, deduplicate: bool = None) -> Dict:
+        """
+        单次遍历填充两个集合
+
+        Args:
+            knowledge_entries: 知识条目，默认从数据集加载（只加载一次）
+            deduplicate: 是否按嵌入文本去重，默认使用config.DEDUPLICATE_TRIPLES
+        """
+        if deduplicate is None:
+            deduplicate = config.DEDUPLICATE_TRIPLES
+        if knowledge_entries is None:
+            knowledge_entries = KnowledgeDataLoader().get_knowledge_entries()
+        if not knowledge_entries:
+            print("❌ 没有找到知识条目")
+            return {}
+
+        rows = {name: prepare_rows(knowledge_entries, to_document, create_metadata, deduplicate)
+                for name, (_, to_document, create_metadata) in self.targets.items()}
+        stats = {name: CorpusStats.load(collection.name) or CorpusStats(collection.name)
+                 for name, (collection, _, _) in self.targets.items()}
+
+        # 两个集合的文档按批次交错排列并去重，保证各集合的写入进度同步推进
+        batch_size = config.BATCH_SIZE
+        remaining_uses: Dict[str, int] = {}
+        unique_texts = []
+        longest = max(len(target_rows['documents']) for target_rows in rows.values())
+        for start in range(0, longest, batch_size):
+            for target_rows in rows.values():
+                for document in target_rows['documents'][start:start + batch_size]:
+                    if document not in remaining_uses:
+                        unique_texts.append(document)
+                        remaining_uses[document] = 0
+                    remaining_uses[document] += 1
+
+        total_rows = sum(len(target_rows['documents']) for target_rows in rows.values())
+        print(f"🔄 单次遍历构建 {len(self.targets)} 个集合: {len(knowledge_entries)} 个条目, "
+              f"{total_rows} 行, 共用 {len(unique_texts)} 个唯一文本")
+
+        vectors: Dict[str, List[float]] = {}
+        resolved = set()
+        cursors = {name: 0 for name in rows}
+        api_calls, failed = 0, 0
+
+        for i in tqdm(range(0, len(unique_texts), batch_size), desc="多目标嵌入处理"):
+            batch_texts = unique_texts[i:i + batch_size]
+            batch_embeddings = self.embedding_client.get_embeddings_batch(batch_texts)
+            api_calls += 1
+            if batch_embeddings:
+                vectors.update(zip(batch_texts, batch_embeddings))
+            else:
+                failed += len(batch_texts)
+                print(f"⚠ 跳过批次 {i}，嵌入失败")
+            resolved.update(batch_texts)
+
+            # 各集合按顺序写入所有文本已处理完的行
+            for name, (collection, _, _) in self.targets.items():
+                documents = rows[name]['documents']
+                start = cursors[name]
+                end = start
+                while end < len(documents) and documents[end] in resolved:
+                    end += 1
+                if end == start:
+                    continue
+                self._write_rows(collection, rows[name], list(range(start, end)), vectors, stats[name])
+                cursors[name] = end
+                for document in documents[start:end]:
+                    remaining_uses[document] -= 1
+                    if remaining_uses[document] == 0:
+                        vectors.pop(document, None)
+
+        report = {'entries': len(knowledge_entries), 'unique_texts': len(unique_texts),
+                  'api_calls': api_calls, 'failed_texts': failed}
+        for name, (collection, _, _) in self.targets.items():
+            if isinstance(collection, ShardedCollection):
+                collection.save_router()
+            if stats[name].total_entries == collection.count():
+                stats[name].save()
+            else:
+                get_corpus_stats(collection, rebuild=True)
+            report[name] = {'collection': collection.name, 'count': collection.count()}
+            print(f"✅ {collection.name}: {collection.count()} 条")
+
+        print(f"📊 嵌入API调用 {api_calls} 次 (两个集合分别构建约需 "
+              f"{sum((len(r['documents']) + batch_size - 1) // batch_size for r in rows.values())} 次)")
+        return report
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="单次遍历同时构建原始集合和增强集合")
+    parser.add_argument('--reset', action='store_true', help='重置两个现有集合')
+    parser.add_argument('--no-dedup', action='store_true', help='不按嵌入文本去重')
+
+    args = parser.parse_args()
+
+    ingestor = MultiTargetIngestor(reset=args.reset)
+    ingestor.populate(deduplicate=False if args.no_dedup else None)
+
+if __name__ == '__main__':
+    main()
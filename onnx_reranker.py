@@ -0,0 +1,215 @@
+# onnx_reranker.py - ONNX / int8动态量化的Cross-Encoder推理（CPU服务）
+
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import List, Dict, Optional
+import numpy as np
+import config
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+
+# 没有可用数据库时用于一致性检查的示例句子对
+SAMPLE_PAIRS = [
+    ["Who is the leader of Belgium?", "Belgium has leader Philippe of Belgium. Country leader King."],
+    ["Who is the leader of Belgium?", "Brussels Airport is located in Belgium. Airport location Country."],
+    ["Where is Schiphol located?", "Amsterdam Airport Schiphol is located in Haarlemmermeer. Airport location City."],
+    ["Where is Schiphol located?", "Belgium has language French. Country language Language."],
+    ["What is the runway length of Aarhus Airport?", "Aarhus Airport has runway length 2776.0. Airport runwayLength Number."],
+    ["What is the runway length of Aarhus Airport?", "Aarhus Airport is operated by Aktieselskab. Airport operator Company."]
+]
+
+def export_onnx_reranker(model_name: str = None, output_dir: str = None, quantize: bool = True,
+                         opset_version: int = 14) -> Optional[str]:
+    """
+    将Cross-Encoder导出为ONNX，并可选地做int8动态量化
+
+    Args:
+        model_name: HuggingFace模型名称，默认使用config.RERANK_MODEL_NAME
+        output_dir: 输出目录（同时保存分词器），默认使用config.ONNX_RERANK_MODEL_DIR
+        quantize: 是否生成int8动态量化模型
+
+    Returns:
+        可直接加载的模型文件路径，依赖缺失时返回None
+    """
+    model_name = model_name or config.RERANK_MODEL_NAME
+    output_dir = Path(output_dir or config.ONNX_RERANK_MODEL_DIR)
+
+    try:
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    except ImportError:
+        print("⚠️ 导出ONNX需要安装 torch 和 transformers")
+        return None
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"🔄 导出ONNX重排模型: {model_name} -> {output_dir}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    dummy = tokenizer([SAMPLE_PAIRS[0][0]], [SAMPLE_PAIRS[0][1]], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch'}
+
+    fp32_path = output_dir / ONNX_FP32_FILE
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(dummy[name] for name in input_names), str(fp32_path),
+                          input_names=input_names, output_names=['logits'],
+                          dynamic_axes=dynamic_axes, opset_version=opset_version)
+    tokenizer.save_pretrained(str(output_dir))
+    print(f"✅ FP32 ONNX模型: {fp32_path} ({fp32_path.stat().st_size / 1024 / 1024:.1f} MB)")
+
+    if not quantize:
+        return str(fp32_path)
+
+    try:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+    except ImportError:
+        print("⚠️ onnxruntime未安装，跳过int8量化")
+        return str(fp32_path)
+
+    int8_path = output_dir / ONNX_INT8_FILE
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    print(f"✅ INT8 ONNX模型: {int8_path} ({int8_path.stat().st_size / 1024 / 1024:.1f} MB)")
+    return str(int8_path)
+
+class OnnxCrossEncoder:
+    """
+    基于onnxruntime的Cross-Encoder
+
+    predict 接口与 sentence_transformers.CrossEncoder 一致（单标签模型输出经过sigmoid），
+    可以直接替换 EnhancedVectorDatabaseManager.rerank_model
+    """
+
+    def __init__(self, model_dir: str = None, max_length: int = None, num_threads: int = None,
+                 quantized: bool = True):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir or config.ONNX_RERANK_MODEL_DIR)
+        self.max_length = max_length or config.ONNX_RERANK_MAX_LENGTH
+        num_threads = num_threads or config.ONNX_RERANK_THREADS or os.cpu_count() or 1
+
+        model_path = model_dir / (ONNX_INT8_FILE if quantized else ONNX_FP32_FILE)
+        if quantized and not model_path.exists():
+            print(f"⚠️ 未找到int8模型，使用FP32 ONNX模型")
+            model_path = model_dir / ONNX_FP32_FILE
+        self.model_path = str(model_path)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.model_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+
+    def predict(self, sentence_pairs: List[List[str]], batch_size: int = 32,
+                show_progress_bar: bool = False) -> np.ndarray:
+        """为句子对打分（每批只padding到批内最长序列）"""
+        scores = []
+        for start in range(0, len(sentence_pairs), batch_size):
+            batch = sentence_pairs[start:start + batch_size]
+            features = self.tokenizer([pair[0] for pair in batch], [pair[1] for pair in batch],
+                                      padding=True, truncation=True, max_length=self.max_length,
+                                      return_tensors='np')
+            inputs = {name: features[name].astype(np.int64) for name in self.input_names if name in features}
+            logits = self.session.run(None, inputs)[0]
+            scores.append(1.0 / (1.0 + np.exp(-logits[:, 0])))
+        return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+def check_parity(reference_model, onnx_model, sentence_pairs: List[List[str]],
+                 group_size: int = None) -> Dict:
+    """
+    对比PyTorch与ONNX模型的分数：最大绝对误差、Spearman相关系数、各组Top-1一致率，以及单次打分延迟
+
+    Args:
+        group_size: 每组（同一问题）的候选数，用于计算Top-1一致率
+    """
+    start = time.perf_counter()
+    reference = np.asarray(reference_model.predict(sentence_pairs), dtype=np.float32).reshape(-1)
+    reference_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    candidate = np.asarray(onnx_model.predict(sentence_pairs), dtype=np.float32).reshape(-1)
+    onnx_ms = (time.perf_counter() - start) * 1000
+
+    reference_ranks = np.argsort(np.argsort(reference))
+    candidate_ranks = np.argsort(np.argsort(candidate))
+    spearman = float(np.corrcoef(reference_ranks, candidate_ranks)[0, 1]) if len(reference) > 1 else 1.0
+
+    group_size = group_size or len(sentence_pairs)
+    top1 = [int(np.argmax(reference[i:i + group_size]) == np.argmax(candidate[i:i + group_size]))
+            for i in range(0, len(reference), group_size)]
+
+    return {
+        'num_pairs': len(sentence_pairs),
+        'max_abs_diff': float(np.max(np.abs(reference - candidate))),
+        'spearman': spearman,
+        'top1_agreement': float(np.mean(top1)),
+        'reference_ms': reference_ms,
+        'onnx_ms': onnx_ms,
+        'speedup': reference_ms / onnx_ms if onnx_ms > 0 else 0.0
+    }
+
+def _collect_parity_pairs(num_questions: int, candidates_per_question: int) -> List[List[str]]:
+    """从QA数据集和增强集合收集真实的 (问题, 候选文档) 句子对，失败时使用示例句子对"""
+    try:
+        from hnsw_tuner import load_sample_questions
+        from enhanced_embedding_system import EnhancedVectorDatabaseManager
+
+        questions = load_sample_questions(sample_size=num_questions)
+        db_manager = EnhancedVectorDatabaseManager()
+        db_manager.initialize_collection()
+        pairs = []
+        for question in questions:
+            candidates = db_manager._stage1_retrieval(question, candidates_per_question)
+            if len(candidates) == candidates_per_question:
+                pairs.extend([question, candidate['document']] for candidate in candidates)
+        if pairs:
+            return pairs
+    except Exception as e:
+        print(f"⚠️ 无法从数据库收集句子对，使用示例句子对: {e}")
+    return SAMPLE_PAIRS
+
+def main():
+    """命令行入口 - 导出ONNX模型并做一致性检查"""
+    parser = argparse.ArgumentParser(description="ONNX / int8 Cross-Encoder重排模型")
+    parser.add_argument('--export', action='store_true', help='导出ONNX模型（含int8量化）')
+    parser.add_argument('--no-quantize', action='store_true', help='只导出FP32 ONNX模型')
+    parser.add_argument('--parity', action='store_true', help='与PyTorch模型对比分数和延迟')
+    parser.add_argument('--questions', type=int, default=20, help='一致性检查使用的问题数')
+    parser.add_argument('--candidates', type=int, default=20, help='每个问题的候选文档数')
+
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx_reranker(quantize=not args.no_quantize)
+
+    if args.parity:
+        from shared_resources import get_rerank_model
+        reference_model = get_rerank_model(config.RERANK_MODEL_NAME, config.RERANK_MAX_LENGTH)
+        if reference_model is None:
+            print("❌ PyTorch参考模型不可用，无法做一致性检查")
+            return
+        onnx_model = OnnxCrossEncoder(quantized=not args.no_quantize)
+
+        pairs = _collect_parity_pairs(args.questions, args.candidates)
+        group_size = args.candidates if pairs is not SAMPLE_PAIRS else 2
+        report = check_parity(reference_model, onnx_model, pairs, group_size)
+
+        print(f"\n📊 一致性检查 ({Path(onnx_model.model_path).name}, {report['num_pairs']} 个句子对):")
+        print(f"   最大绝对误差: {report['max_abs_diff']:.4f}")
+        print(f"   Spearman相关系数: {report['spearman']:.4f}")
+        print(f"   Top-1一致率: {report['top1_agreement']:.2%}")
+        print(f"   延迟: PyTorch {report['reference_ms']:.1f}ms vs ONNX {report['onnx_ms']:.1f}ms "
+              f"(x{report['speedup']:.1f})")
+
+if __name__ == '__main__':
+    main()
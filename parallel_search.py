@@ -0,0 +1,144 @@
+# parallel_search.py - 多进程分区检索（scatter-gather）
+
+import atexit
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+import config
+from index_snapshot import SnapshotCollection
+
+# 工作进程内的快照（每个进程各自内存映射同一个文件，数据页由操作系统共享）
+_worker_snapshot: Optional[SnapshotCollection] = None
+
+def _init_worker(snapshot_path: str):
+    """工作进程初始化：打开快照文件"""
+    global _worker_snapshot
+    _worker_snapshot = SnapshotCollection(snapshot_path)
+
+def _search_partition(task: Tuple[int, int, np.ndarray, int]) -> List[Tuple[List[int], List[float]]]:
+    """
+    在一个分区内对一批查询向量检索Top-K
+
+    Returns:
+        每个查询一组 (行号列表, 距离列表)
+    """
+    row_start, row_end, query_vectors, n_results = task
+    partition_results = []
+    for query_vector in query_vectors:
+        indices, distances = _worker_snapshot.search(query_vector, n_results, row_start, row_end)
+        partition_results.append((indices.tolist(), distances.tolist()))
+    return partition_results
+
+class ParallelSearchCollection:
+    """
+    把快照的向量矩阵切分为多个分区，分散到本地进程池中并行检索
+
+    每个工作进程检索自己的分区并返回Top-K候选，协调进程用堆合并为全局Top-K。
+    接口与ChromaDB集合的 count/get/query 一致，可直接替换DB管理器的 collection，
+    multi_stage_retrieval 的 n_results / rerank_top_k 语义保持不变。
+    """
+
+    def __init__(self, snapshot_path: str, num_workers: int = None, num_partitions: int = None):
+        self.snapshot = SnapshotCollection(snapshot_path)
+        self.name = self.snapshot.name
+        self.num_workers = num_workers or config.PARALLEL_SEARCH_WORKERS or os.cpu_count() or 1
+        self.num_partitions = num_partitions or self.num_workers
+
+        total = self.snapshot.count()
+        bounds = np.linspace(0, total, self.num_partitions + 1, dtype=np.int64)
+        self.partitions = [(int(bounds[i]), int(bounds[i + 1]))
+                           for i in range(self.num_partitions) if bounds[i + 1] > bounds[i]]
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            initializer=_init_worker,
+            initargs=(snapshot_path,)
+        )
+        # 没有显式调用close()时，解释器退出前关闭进程池
+        atexit.register(self.close)
+
+    def count(self) -> int:
+        return self.snapshot.count()
+
+    def get(self, *args, **kwargs) -> Dict:
+        return self.snapshot.get(*args, **kwargs)
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10) -> Dict:
+        """向所有分区分发查询，合并各分区的Top-K"""
+        query_vectors = np.asarray(query_embeddings, dtype=np.float32)
+        tasks = [(start, end, query_vectors, n_results) for start, end in self.partitions]
+        partition_results = list(self.executor.map(_search_partition, tasks))
+
+        results = {'ids': [], 'distances': [], 'documents': [], 'metadatas': []}
+        for query_index in range(len(query_vectors)):
+            candidates = []
+            for per_query in partition_results:
+                indices, distances = per_query[query_index]
+                candidates.extend(zip(distances, indices))
+            merged = heapq.nsmallest(n_results, candidates)
+            self.snapshot._append_rows(results,
+                                       [index for _, index in merged],
+                                       [distance for distance, _ in merged])
+        return results
+
+    def close(self):
+        """关闭进程池（可重复调用）"""
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=True)
+        self.executor = None
+        atexit.unregister(self.close)
+
+# 测试函数
+def test_parallel_search():
+    """对比并行分区检索与单进程检索的结果和耗时"""
+    import tempfile
+    from pathlib import Path
+    from index_snapshot import export_snapshot
+
+    class _MockCollection:
+        name = "mock_collection"
+
+        def __init__(self, count=20000, dim=64):
+            rng = np.random.default_rng(0)
+            self.embeddings = rng.normal(size=(count, dim)).astype(np.float32)
+
+        def count(self):
+            return len(self.embeddings)
+
+        def get(self, limit, offset, include):
+            rows = range(offset, min(offset + limit, self.count()))
+            return {
+                'ids': [f"id_{i}" for i in rows],
+                'documents': [f"doc {i}" for i in rows],
+                'metadatas': [{'rel': 'leader'} for _ in rows],
+                'embeddings': self.embeddings[offset:offset + len(rows)]
+            }
+
+    mock = _MockCollection()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "mock.kgsnap")
+        export_snapshot(mock, path, page_size=5000)
+
+        single = SnapshotCollection(path)
+        parallel = ParallelSearchCollection(path, num_workers=4)
+        queries = mock.embeddings[:8].tolist()
+
+        start = time.time()
+        expected = single.query(queries, n_results=20)
+        single_ms = (time.time() - start) * 1000
+
+        parallel.query(queries[:1], n_results=20)  # 预热进程池
+        start = time.time()
+        actual = parallel.query(queries, n_results=20)
+        parallel_ms = (time.time() - start) * 1000
+
+        print(f"结果一致: {expected['ids'] == actual['ids']}")
+        print(f"单进程: {single_ms:.1f} ms, {len(parallel.partitions)}个分区并行: {parallel_ms:.1f} ms")
+        parallel.close()
+
+if __name__ == '__main__':
+    test_parallel_search()
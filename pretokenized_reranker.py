@@ -0,0 +1,211 @@
+# pretokenized_reranker.py - 文档分词结果缓存：每次请求只对查询分词
+
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+import config
+from rerank_cache import candidate_key
+
+class DocumentTokenCache:
+    """
+    文档token id的LRU缓存，键为文档ID + 文本校验值（与分数缓存相同）
+
+    文档在第一次被重排时分词，之后直接复用
+    """
+
+    def __init__(self, tokenizer, max_entries: int = None):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries or config.RERANK_TOKEN_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, candidates: List[Dict]) -> List[List[int]]:
+        """返回每个候选文档的token id（不含特殊token），未缓存的文档一次性批量分词"""
+        keys = [candidate_key(candidate) for candidate in candidates]
+        with self._lock:
+            token_ids = [self._entries.get(key) for key in keys]
+            for key, ids in zip(keys, token_ids):
+                if ids is not None:
+                    self._entries.move_to_end(key)
+
+        missing = [i for i, ids in enumerate(token_ids) if ids is None]
+        if missing:
+            encoded = self.tokenizer([candidates[i]['document'] for i in missing],
+                                     add_special_tokens=False)['input_ids']
+            with self._lock:
+                for i, ids in zip(missing, encoded):
+                    token_ids[i] = ids
+                    self._entries[keys[i]] = ids
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        self.hits += len(candidates) - len(missing)
+        self.misses += len(missing)
+        return token_ids
+
+def supports_pretokenized(model) -> bool:
+    """模型是否暴露了分词器和底层推理接口（sentence-transformers CrossEncoder 或 OnnxCrossEncoder）"""
+    return hasattr(model, 'tokenizer') and (hasattr(model, 'session') or hasattr(model, 'model'))
+
+class PretokenizedScorer:
+    """
+    使用缓存的文档token直接拼装模型输入：
+
+    [特殊token] 查询 [分隔] 文档 [特殊token]，按longest_first截断到max_length，
+    批内按实际token长度分桶并动态padding；单标签模型输出经过sigmoid（与CrossEncoder.predict一致）
+    """
+
+    def __init__(self, model, max_length: Optional[int] = None):
+        self.model = model
+        self.tokenizer = model.tokenizer
+        self.max_length = max_length or getattr(model, 'max_length', None) or config.RERANK_MAX_LENGTH
+        self.document_cache = DocumentTokenCache(self.tokenizer)
+        self._pair_budget = self.max_length - self.tokenizer.num_special_tokens_to_add(pair=True)
+        self._use_token_type_ids = 'token_type_ids' in getattr(self.tokenizer, 'model_input_names', [])
+
+    def _truncate(self, query_ids: List[int], document_ids: List[int]) -> Tuple[List[int], List[int]]:
+        """longest_first截断：总长度超出时每次从较长的一侧去掉一个token"""
+        overflow = len(query_ids) + len(document_ids) - self._pair_budget
+        if overflow <= 0:
+            return query_ids, document_ids
+        query_len, document_len = len(query_ids), len(document_ids)
+        for _ in range(overflow):
+            if document_len >= query_len:
+                document_len -= 1
+            else:
+                query_len -= 1
+        return query_ids[:query_len], document_ids[:document_len]
+
+    def _build_pair(self, query_ids: List[int], document_ids: List[int]) -> Tuple[List[int], List[int]]:
+        query_ids, document_ids = self._truncate(query_ids, document_ids)
+        input_ids = self.tokenizer.build_inputs_with_special_tokens(query_ids, document_ids)
+        if self._use_token_type_ids:
+            token_type_ids = self.tokenizer.create_token_type_ids_from_sequences(query_ids, document_ids)
+        else:
+            token_type_ids = []
+        return input_ids, token_type_ids
+
+    def _pad(self, pairs: List[Tuple[List[int], List[int]]]) -> Dict[str, np.ndarray]:
+        longest = max(len(input_ids) for input_ids, _ in pairs)
+        pad_id = self.tokenizer.pad_token_id or 0
+        features = {
+            'input_ids': np.full((len(pairs), longest), pad_id, dtype=np.int64),
+            'attention_mask': np.zeros((len(pairs), longest), dtype=np.int64)
+        }
+        if self._use_token_type_ids:
+            features['token_type_ids'] = np.zeros((len(pairs), longest), dtype=np.int64)
+        for row, (input_ids, token_type_ids) in enumerate(pairs):
+            features['input_ids'][row, :len(input_ids)] = input_ids
+            features['attention_mask'][row, :len(input_ids)] = 1
+            if self._use_token_type_ids:
+                features['token_type_ids'][row, :len(token_type_ids)] = token_type_ids
+        return features
+
+    def _run(self, features: Dict[str, np.ndarray]) -> np.ndarray:
+        """在ONNX会话或PyTorch模型上执行一批推理，返回logits的第一列"""
+        if hasattr(self.model, 'session'):
+            inputs = {name: value for name, value in features.items() if name in self.model.input_names}
+            logits = self.model.session.run(None, inputs)[0]
+        else:
+            import torch
+            torch_model = self.model.model
+            device = next(torch_model.parameters()).device
+            with torch.no_grad():
+                tensors = {name: torch.as_tensor(value, device=device) for name, value in features.items()}
+                logits = torch_model(**tensors, return_dict=True).logits.float().cpu().numpy()
+        return np.asarray(logits, dtype=np.float32)[:, 0]
+
+    def score_groups(self, groups: List[Tuple[str, List[Dict]]], batch_size: int = None) -> List[np.ndarray]:
+        """
+        多组 (查询, 候选列表) 打分：每个查询分词一次，文档token来自缓存
+
+        Returns:
+            与groups一一对应的分数数组
+        """
+        batch_size = batch_size or config.RERANK_BATCH_SIZE
+        pairs, boundaries = [], [0]
+        for query, candidates in groups:
+            if candidates:
+                query_ids = self.tokenizer(query, add_special_tokens=False)['input_ids']
+                pairs.extend(self._build_pair(query_ids, document_ids)
+                             for document_ids in self.document_cache.get_many(candidates))
+            boundaries.append(len(pairs))
+
+        scores = np.empty(len(pairs), dtype=np.float32)
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]))
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            logits = self._run(self._pad([pairs[i] for i in bucket]))
+            scores[bucket] = 1.0 / (1.0 + np.exp(-logits))
+
+        return [scores[boundaries[i]:boundaries[i + 1]] for i in range(len(groups))]
+
+_scorers: Dict[int, Tuple[object, PretokenizedScorer]] = {}
+_scorers_lock = threading.Lock()
+
+def get_pretokenized_scorer(model) -> Optional[PretokenizedScorer]:
+    """
+    获取进程内共享的预分词打分器（每个模型实例一份，文档token缓存随之共享）
+
+    未启用预分词或模型不暴露分词器时返回None，调用方回退到 predict 接口
+    """
+    if not config.RERANK_PRETOKENIZE or model is None or not supports_pretokenized(model):
+        return None
+    with _scorers_lock:
+        entry = _scorers.get(id(model))
+        if entry is None or entry[0] is not model:
+            entry = (model, PretokenizedScorer(model))
+            _scorers[id(model)] = entry
+        return entry[1]
+
+# 测试函数
+def test_pretokenized_scorer():
+    """用模拟分词器和ONNX会话测试输入拼装、截断和分数放回"""
+
+    class _MockTokenizer:
+        pad_token_id = 1
+        model_input_names = ['input_ids', 'attention_mask']
+
+        def __init__(self):
+            self.calls = 0
+
+        def __call__(self, texts, add_special_tokens=False):
+            self.calls += 1
+            if isinstance(texts, str):
+                return {'input_ids': [len(word) + 10 for word in texts.split()]}
+            return {'input_ids': [[len(word) + 10 for word in text.split()] for text in texts]}
+
+        def num_special_tokens_to_add(self, pair=False):
+            return 4
+
+        def build_inputs_with_special_tokens(self, first, second):
+            return [0] + first + [2, 2] + second + [2]
+
+    class _MockSession:
+        def run(self, outputs, inputs):
+            # logits = 非padding token数，便于检查分数能否放回原位置
+            return [inputs['attention_mask'].sum(axis=1, keepdims=True).astype(np.float32) / 10]
+
+    class _MockOnnxModel:
+        max_length = 12
+        input_names = {'input_ids', 'attention_mask'}
+
+        def __init__(self):
+            self.tokenizer = _MockTokenizer()
+            self.session = _MockSession()
+
+    model = _MockOnnxModel()
+    scorer = PretokenizedScorer(model, max_length=10)
+    candidates = [{'id': 'a', 'document': 'one two'}, {'id': 'b', 'document': 'one two three four five six seven'}]
+    first = scorer.score_groups([("who leads", candidates)])
+    second = scorer.score_groups([("who leads belgium", candidates[:1])])
+    print(f"分数: {[s.round(3).tolist() for s in first]}, {[s.round(3).tolist() for s in second]} "
+          f"(预期: [[0.69, 0.731]], [[0.711]]，第二个文档被截断到10个token)")
+    print(f"文档缓存: 命中 {scorer.document_cache.hits}, 未命中 {scorer.document_cache.misses} (预期: 1, 2)")
+    print(f"查询分词次数 + 文档批量分词次数: {model.tokenizer.calls} (预期: 3)")
+
+if __name__ == '__main__':
+    test_pretokenized_scorer()
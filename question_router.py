@@ -0,0 +1,224 @@
+# question_router.py - 基于查询嵌入的问题类型路由（最近质心分类）
+
+import argparse
+import json
+import random
+import threading
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+import config
+
+# CoTKRRewriter 使用的内部问题类型
+QUESTION_TYPES = ['subject', 'object', 'relationship', 'type']
+
+# QA数据集中的 question_type（即生成时的 prompt_type）到内部类型的映射
+LABEL_MAPPING = {
+    'sub': 'subject',
+    'obj': 'object',
+    'rel': 'relationship',
+    'type': 'type',
+    'subject': 'subject',
+    'object': 'object',
+    'relationship': 'relationship'
+}
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+class QuestionTypeRouter:
+    """
+    最近质心问题类型分类器
+
+    每个问题类型一个归一化的质心向量，分类只需要一次 (查询数 x 类型数) 的点积；
+    最高分与次高分相差小于min_margin时不下结论，由调用方回退到关键词规则
+    """
+
+    def __init__(self, labels: List[str], centroids: np.ndarray, min_margin: float = None,
+                 embedding_model: str = None):
+        self.labels = list(labels)
+        self.centroids = _normalize(np.asarray(centroids, dtype=np.float32))
+        self.min_margin = config.QUESTION_ROUTER_MIN_MARGIN if min_margin is None else min_margin
+        self.embedding_model = embedding_model or config.EMBEDDING_MODEL
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, labels: List[str], min_margin: float = None) -> "QuestionTypeRouter":
+        """每个类型的质心 = 该类型问题归一化嵌入的均值"""
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        label_array = np.array(labels)
+        present = [label for label in QUESTION_TYPES if np.any(label_array == label)]
+        centroids = np.vstack([embeddings[label_array == label].mean(axis=0) for label in present])
+        return cls(present, centroids, min_margin)
+
+    def scores(self, embeddings) -> np.ndarray:
+        """查询与各类型质心的余弦相似度 (查询数 x 类型数)"""
+        embeddings = _normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        return embeddings @ self.centroids.T
+
+    def classify_batch(self, embeddings) -> List[Optional[str]]:
+        scores = self.scores(embeddings)
+        if scores.shape[1] == 1:
+            return [self.labels[0]] * len(scores)
+        top_two = np.sort(scores, axis=1)[:, -2:]
+        best = np.argmax(scores, axis=1)
+        return [self.labels[index] if margin >= self.min_margin else None
+                for index, margin in zip(best, top_two[:, 1] - top_two[:, 0])]
+
+    def classify(self, embedding) -> Optional[str]:
+        """返回问题类型；置信度不足时返回None"""
+        return self.classify_batch(embedding)[0]
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, labels=np.array(self.labels), centroids=self.centroids,
+                 min_margin=np.float32(self.min_margin), embedding_model=np.array(self.embedding_model))
+
+    @classmethod
+    def load(cls, path: str) -> "QuestionTypeRouter":
+        data = np.load(path)
+        return cls([str(label) for label in data['labels']], data['centroids'],
+                   float(data['min_margin']), str(data['embedding_model']))
+
+_router: Optional[QuestionTypeRouter] = None
+_router_loaded = False
+_router_lock = threading.Lock()
+
+def get_question_router() -> Optional[QuestionTypeRouter]:
+    """
+    获取进程内共享的问题类型路由器
+
+    未启用、质心文件不存在或质心由其他嵌入模型拟合时返回None（调用方使用关键词规则）
+    """
+    global _router, _router_loaded
+    if not config.QUESTION_ROUTER_ENABLED:
+        return None
+    with _router_lock:
+        if not _router_loaded:
+            _router_loaded = True
+            if Path(config.QUESTION_ROUTER_FILE).exists():
+                router = QuestionTypeRouter.load(config.QUESTION_ROUTER_FILE)
+                if router.embedding_model == config.EMBEDDING_MODEL:
+                    _router = router
+                else:
+                    print(f"⚠️ 问题类型质心由 {router.embedding_model} 拟合，与当前嵌入模型不一致，使用关键词规则")
+        return _router
+
+def load_labeled_questions(dataset_path: str = config.QA_OUTPUT_DIR) -> List[Tuple[str, str]]:
+    """从QA数据集读取 (问题, 内部问题类型)，跳过没有可用类型标签的问题"""
+    labeled = {}
+    for qa_file in Path(dataset_path).glob("*.json"):
+        try:
+            with open(qa_file, 'r', encoding='utf-8') as f:
+                qa_data = json.load(f)
+        except (IOError, ValueError) as e:
+            print(f"⚠️ 跳过无法读取的QA文件 {qa_file.name}: {e}")
+            continue
+        if not isinstance(qa_data, list):
+            continue
+        for item in qa_data:
+            if not isinstance(item, dict) or not item.get('question'):
+                continue
+            label = LABEL_MAPPING.get(str(item.get('question_type', '')).lower())
+            if label:
+                labeled.setdefault(item['question'], label)
+    return list(labeled.items())
+
+def _embed_questions(questions: List[str]) -> Optional[np.ndarray]:
+    from shared_resources import get_embedding_client
+    embedding_client = get_embedding_client()
+    blocks = []
+    for start in range(0, len(questions), config.BATCH_SIZE):
+        embeddings = embedding_client.get_embeddings_batch(questions[start:start + config.BATCH_SIZE])
+        if not embeddings:
+            return None
+        blocks.append(np.asarray(embeddings, dtype=np.float32))
+    return np.vstack(blocks)
+
+def evaluate_router(router: QuestionTypeRouter, embeddings: np.ndarray, questions: List[str],
+                    labels: List[str]) -> Dict:
+    """比较质心路由（置信度不足时回退关键词）与纯关键词规则的准确率"""
+    from cotkr_rewriter import CoTKRRewriter
+    rewriter = CoTKRRewriter()
+
+    keyword = [rewriter._keyword_question_type(question) for question in questions]
+    routed = router.classify_batch(embeddings)
+    combined = [predicted or fallback for predicted, fallback in zip(routed, keyword)]
+    return {
+        'num_questions': len(questions),
+        'keyword_accuracy': float(np.mean([p == l for p, l in zip(keyword, labels)])),
+        'router_accuracy': float(np.mean([p == l for p, l in zip(combined, labels)])),
+        'router_coverage': float(np.mean([p is not None for p in routed]))
+    }
+
+def fit_question_router(dataset_path: str = config.QA_OUTPUT_DIR, holdout: float = 0.2,
+                        min_margin: float = None, seed: int = 42) -> Optional[Tuple[QuestionTypeRouter, Dict]]:
+    """
+    从QA数据集拟合问题类型质心：先在留出集上报告准确率，再用全部问题拟合最终质心
+
+    Returns:
+        (路由器, 留出集评估结果)，没有带标签的问题或嵌入失败时返回None
+    """
+    labeled = load_labeled_questions(dataset_path)
+    if not labeled:
+        print(f"❌ 在 {dataset_path} 中没有找到带问题类型标签的问题")
+        return None
+    random.Random(seed).shuffle(labeled)
+    questions = [question for question, _ in labeled]
+    labels = [label for _, label in labeled]
+    print(f"📊 带标签的问题: {len(questions)} " +
+          str({label: labels.count(label) for label in QUESTION_TYPES}))
+
+    embeddings = _embed_questions(questions)
+    if embeddings is None:
+        print("❌ 问题嵌入失败")
+        return None
+
+    split = int(len(questions) * (1 - holdout))
+    report = {}
+    if 0 < split < len(questions):
+        held_out_router = QuestionTypeRouter.fit(embeddings[:split], labels[:split], min_margin)
+        report = evaluate_router(held_out_router, embeddings[split:], questions[split:], labels[split:])
+
+    return QuestionTypeRouter.fit(embeddings, labels, min_margin), report
+
+def main():
+    """命令行入口 - 从QA数据集拟合问题类型质心"""
+    parser = argparse.ArgumentParser(description="基于查询嵌入的问题类型路由")
+    parser.add_argument('--qa-path', type=str, default=config.QA_OUTPUT_DIR, help='QA数据集路径')
+    parser.add_argument('--output', type=str, default=config.QUESTION_ROUTER_FILE, help='质心文件路径')
+    parser.add_argument('--holdout', type=float, default=0.2, help='用于评估的留出比例')
+    parser.add_argument('--min-margin', type=float, default=config.QUESTION_ROUTER_MIN_MARGIN,
+                        help='最高与次高相似度的最小差值，低于该值回退到关键词规则')
+
+    args = parser.parse_args()
+
+    result = fit_question_router(args.qa_path, args.holdout, args.min_margin)
+    if result is None:
+        return
+    router, report = result
+    if report:
+        print(f"\n📊 留出集 ({report['num_questions']} 个问题):")
+        print(f"   关键词规则准确率: {report['keyword_accuracy']:.2%}")
+        print(f"   质心路由准确率: {report['router_accuracy']:.2%} (质心覆盖 {report['router_coverage']:.2%})")
+    router.save(args.output)
+    print(f"✅ 问题类型质心已保存: {args.output}")
+
+# 测试函数
+def test_question_router():
+    """用合成嵌入测试最近质心分类和置信度回退"""
+    rng = np.random.default_rng(0)
+    directions = _normalize(rng.normal(size=(len(QUESTION_TYPES), 32)))
+    labels = [QUESTION_TYPES[i % len(QUESTION_TYPES)] for i in range(200)]
+    embeddings = np.vstack([directions[QUESTION_TYPES.index(label)] + 0.3 * rng.normal(size=32)
+                            for label in labels])
+
+    router = QuestionTypeRouter.fit(embeddings[:160], labels[:160], min_margin=0.02)
+    predicted = router.classify_batch(embeddings[160:])
+    accuracy = np.mean([p == l for p, l in zip(predicted, labels[160:]) if p is not None])
+    ambiguous = router.classify(router.centroids[0] + router.centroids[1])
+    print(f"质心数: {len(router.labels)}, 留出准确率: {accuracy:.2%}, 覆盖率: "
+          f"{np.mean([p is not None for p in predicted]):.2%}")
+    print(f"两个类型中间的查询: {ambiguous} (预期: None，回退关键词规则)")
+
+if __name__ == '__main__':
+    main()
@@ -84,8 +84,7 @@ class RAGvsLLMEvaluator:
     def call_pure_llm(self, question: str) -> str:
         """调用纯LLM获取答案"""
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.openai_api_key)
+            from llm_gateway import chat_completion
             
             # 构造严格的prompt，要求LLM只回答问题，不要多说
             prompt = f"""You are a helpful assistant. Answer the following question directly and concisely. 
@@ -101,7 +100,7 @@ Question: {question}
 
 Answer:"""
             
-            response = client.chat.completions.create(
+            answer = chat_completion(
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -114,10 +113,10 @@ Answer:"""
                     }
                 ],
                 temperature=0.1,  # 低温度确保一致性
-                max_tokens=50     # 限制输出长度
-            )
-            
-            answer = response.choices[0].message.content.strip()
+                max_tokens=50,    # 限制输出长度
+                caller="pure_llm_evaluation",
+                api_key=self.openai_api_key
+            ).strip()
             return answer
             
         except Exception as e:
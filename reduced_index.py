@@ -0,0 +1,267 @@
+# reduced_index.py - 降维检索 + 全精度重打分
+
+import argparse
+import time
+from pathlib import Path
+from typing import List, Dict, Optional
+import numpy as np
+import config
+from index_snapshot import SnapshotCollection, QUERY_CHUNK_ROWS
+
+SUPPORTED_METHODS = ('pca', 'prefix')
+# PCA拟合时最多使用的样本行数
+PCA_FIT_SAMPLE = 50000
+
+def reduced_index_paths(snapshot_path: str, method: str, target_dim: int) -> Dict[str, str]:
+    """降维索引的文件路径：降维向量(.npy，可内存映射) 和投影参数(.npz)"""
+    base = f"{snapshot_path}.{method}{target_dim}"
+    return {'vectors': base + ".npy", 'projection': base + ".proj.npz"}
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def build_reduced_index(snapshot_path: str, method: str = 'pca', target_dim: int = 256,
+                        dtype: str = 'float32') -> Dict[str, str]:
+    """
+    从索引快照构建降维索引
+
+    Args:
+        snapshot_path: 索引快照文件
+        method: 'pca' (在语料上拟合的PCA投影) 或 'prefix' (截取前target_dim维)
+        target_dim: 降维后的维度
+        dtype: 降维向量的存储精度
+    """
+    if method not in SUPPORTED_METHODS:
+        raise ValueError(f"不支持的降维方法: {method}，可选值: {SUPPORTED_METHODS}")
+
+    snapshot = SnapshotCollection(snapshot_path)
+    vectors = snapshot.to_numpy()
+    total, dim = vectors.shape
+    if target_dim >= dim:
+        raise ValueError(f"目标维度 {target_dim} 必须小于原始维度 {dim}")
+
+    print(f"🔄 构建降维索引: {method}, {dim} -> {target_dim} 维, {total} 条")
+
+    if method == 'pca':
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(total, size=min(total, PCA_FIT_SAMPLE), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float64)
+        mean = sample.mean(axis=0)
+        covariance = np.cov(sample - mean, rowvar=False)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:target_dim]
+        components = eigenvectors[:, order].T.astype(np.float32)
+        explained = float(eigenvalues[order].sum() / eigenvalues.sum())
+        print(f"   PCA保留方差比例: {explained:.4f}")
+    else:
+        mean = np.zeros(dim)
+        components = np.eye(dim, dtype=np.float32)[:target_dim]
+        explained = None
+
+    mean = mean.astype(np.float32)
+    paths = reduced_index_paths(snapshot_path, method, target_dim)
+    reduced = np.lib.format.open_memmap(paths['vectors'], mode='w+', dtype=dtype, shape=(total, target_dim))
+    for start in range(0, total, QUERY_CHUNK_ROWS):
+        block = np.asarray(vectors[start:start + QUERY_CHUNK_ROWS], dtype=np.float32)
+        reduced[start:start + len(block)] = _normalize_rows((block - mean) @ components.T)
+    reduced.flush()
+    del reduced
+
+    np.savez(paths['projection'], method=method, mean=mean, components=components,
+             explained_variance=np.float32(explained if explained is not None else -1))
+    print(f"✅ 降维索引已保存: {paths['vectors']}")
+    return paths
+
+class ReducedDimensionCollection:
+    """
+    降维检索集合
+
+    第一阶段在降维向量上检索 n_results * oversample 个候选，
+    再用快照中的全精度向量对候选精确重打分，返回精确距离的Top-K。
+    接口与ChromaDB集合的 count/get/query 一致。
+    """
+
+    def __init__(self, snapshot_path: str, method: str = 'pca', target_dim: int = 256,
+                 oversample: int = None):
+        self.snapshot = SnapshotCollection(snapshot_path)
+        self.name = self.snapshot.name
+        self.oversample = oversample or config.REDUCED_SEARCH_OVERSAMPLE
+
+        paths = reduced_index_paths(snapshot_path, method, target_dim)
+        self.reduced_vectors = np.load(paths['vectors'], mmap_mode='r')
+        projection = np.load(paths['projection'])
+        self.mean = projection['mean']
+        self.components = projection['components']
+
+    def count(self) -> int:
+        return self.snapshot.count()
+
+    def get(self, *args, **kwargs) -> Dict:
+        return self.snapshot.get(*args, **kwargs)
+
+    def _project(self, query_vector) -> np.ndarray:
+        query = np.asarray(query_vector, dtype=np.float32)
+        return _normalize_rows((query - self.mean) @ self.components.T)
+
+    def search(self, query_vector, n_results: int):
+        """降维粗排 + 全精度重打分，返回 (行号数组, 距离数组)"""
+        total = self.count()
+        n_candidates = min(total, n_results * self.oversample)
+        if n_candidates <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        reduced_query = self._project(query_vector)
+        candidate_rows, candidate_scores = [], []
+        for start in range(0, total, QUERY_CHUNK_ROWS):
+            scores = np.asarray(self.reduced_vectors[start:start + QUERY_CHUNK_ROWS], dtype=np.float32) @ reduced_query
+            if len(scores) > n_candidates:
+                top = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+            else:
+                top = np.arange(len(scores))
+            candidate_rows.append(top + start)
+            candidate_scores.append(scores[top])
+
+        rows = np.concatenate(candidate_rows)
+        scores = np.concatenate(candidate_scores)
+        if len(rows) > n_candidates:
+            rows = rows[np.argpartition(-scores, n_candidates - 1)[:n_candidates]]
+
+        # 全精度重打分（快照中的向量已归一化）
+        rows = np.sort(rows)
+        full_query = _normalize_rows(np.asarray(query_vector, dtype=np.float32))
+        exact_scores = np.asarray(self.snapshot.vectors[rows], dtype=np.float32) @ full_query
+        order = np.argsort(-exact_scores)[:n_results]
+        return rows[order], 1.0 - exact_scores[order]
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10) -> Dict:
+        results = {'ids': [], 'distances': [], 'documents': [], 'metadatas': []}
+        for query_vector in query_embeddings:
+            indices, distances = self.search(query_vector, n_results)
+            self.snapshot._append_rows(results, indices, distances)
+        return results
+
+    def memory_stats(self) -> Dict:
+        """全精度与降维向量的存储大小 (MB)"""
+        return {
+            'full_mb': self.snapshot.vectors.nbytes / (1024 * 1024),
+            'reduced_mb': self.reduced_vectors.nbytes / (1024 * 1024)
+        }
+
+def benchmark_reduced_index(snapshot_path: str, method: str = 'pca', target_dim: int = 256,
+                            query_vectors: Optional[np.ndarray] = None, k: int = 10,
+                            oversample_values: List[int] = None) -> List[Dict]:
+    """
+    对比降维检索与全维度精确检索：recall@k损失、平均延迟和向量内存
+
+    Args:
+        query_vectors: 查询向量，默认从语料中随机抽取100条
+    """
+    full = SnapshotCollection(snapshot_path)
+    if query_vectors is None:
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(full.count(), size=min(100, full.count()), replace=False))
+        query_vectors = np.asarray(full.vectors[rows], dtype=np.float32)
+
+    start = time.perf_counter()
+    truth = [set(full.search(q, k)[0].tolist()) for q in query_vectors]
+    full_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+
+    report = []
+    for oversample in oversample_values or [1, 2, 4, 8]:
+        reduced = ReducedDimensionCollection(snapshot_path, method, target_dim, oversample=oversample)
+        start = time.perf_counter()
+        found = [set(reduced.search(q, k)[0].tolist()) for q in query_vectors]
+        reduced_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+
+        memory = reduced.memory_stats()
+        report.append({
+            'method': method,
+            'target_dim': target_dim,
+            'oversample': oversample,
+            f'recall@{k}': float(np.mean([len(f & t) / k for f, t in zip(found, truth)])),
+            'full_ms': full_ms,
+            'reduced_ms': reduced_ms,
+            'speedup': full_ms / reduced_ms if reduced_ms > 0 else 0.0,
+            'full_mb': memory['full_mb'],
+            'reduced_mb': memory['reduced_mb']
+        })
+    return report
+
+def main():
+    """命令行入口 - 构建降维索引并输出基准报告"""
+    parser = argparse.ArgumentParser(description="降维检索索引 (PCA/前缀截断 + 全精度重打分)")
+    parser.add_argument('snapshot', help='索引快照文件 (index_snapshot.py导出)')
+    parser.add_argument('--method', choices=SUPPORTED_METHODS, default='pca', help='降维方法')
+    parser.add_argument('--dim', type=int, default=256, help='降维后的维度')
+    parser.add_argument('--k', type=int, default=10, help='recall@k中的k')
+    parser.add_argument('--questions', type=int, default=0,
+                       help='从qa_datasets抽取N个真实问题做基准（默认使用语料向量）')
+
+    args = parser.parse_args()
+
+    build_reduced_index(args.snapshot, args.method, args.dim)
+
+    query_vectors = None
+    if args.questions:
+        from hnsw_tuner import load_sample_questions
+        from shared_resources import get_embedding_client
+        questions = load_sample_questions(sample_size=args.questions)
+        if not questions:
+            print("❌ 没有可用的问题，无法用真实问题做基准")
+            return
+        embedding_client = get_embedding_client()
+        embeddings = []
+        for i in range(0, len(questions), config.BATCH_SIZE):
+            batch = embedding_client.get_embeddings_batch(questions[i:i + config.BATCH_SIZE])
+            if not batch:
+                # 不回退到语料向量，避免把语料基准误当成真实问题基准
+                print(f"❌ 问题嵌入失败 (批次 {i})，基准测试终止")
+                return
+            embeddings.extend(batch)
+        query_vectors = np.asarray(embeddings, dtype=np.float32)
+
+    print(f"\n📊 基准测试 (recall@{args.k} 相对全维度精确检索):")
+    for row in benchmark_reduced_index(args.snapshot, args.method, args.dim, query_vectors, k=args.k):
+        print(f"   oversample={row['oversample']:<2} recall@{args.k}={row[f'recall@{args.k}']:.4f} "
+              f"延迟 {row['reduced_ms']:.2f}ms vs {row['full_ms']:.2f}ms (x{row['speedup']:.1f}) "
+              f"内存 {row['reduced_mb']:.1f}MB vs {row['full_mb']:.1f}MB")
+
+# 测试函数
+def test_reduced_index():
+    """在模拟的低秩语料上测试PCA降维检索"""
+    import tempfile
+    from index_snapshot import export_snapshot
+
+    class _MockCollection:
+        name = "mock_collection"
+
+        def __init__(self, count=5000, dim=128, rank=24):
+            rng = np.random.default_rng(0)
+            basis = rng.normal(size=(rank, dim))
+            self.embeddings = (rng.normal(size=(count, rank)) @ basis
+                               + 0.05 * rng.normal(size=(count, dim))).astype(np.float32)
+
+        def count(self):
+            return len(self.embeddings)
+
+        def get(self, limit, offset, include):
+            rows = range(offset, min(offset + limit, self.count()))
+            return {
+                'ids': [f"id_{i}" for i in rows],
+                'documents': [f"doc {i}" for i in rows],
+                'metadatas': [{'rel': 'leader'} for _ in rows],
+                'embeddings': self.embeddings[offset:offset + len(rows)]
+            }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = str(Path(tmp_dir) / "mock.kgsnap")
+        export_snapshot(_MockCollection(), path)
+        build_reduced_index(path, 'pca', 32)
+        for row in benchmark_reduced_index(path, 'pca', 32, k=10, oversample_values=[1, 4]):
+            print(f"oversample={row['oversample']} recall@10={row['recall@10']:.3f} "
+                  f"内存 {row['reduced_mb']:.2f}MB vs {row['full_mb']:.2f}MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+# reindex.py - 零停机重建索引（影子集合 + 别名切换）
+
+import argparse
+import random
+from datetime import datetime
+from typing import List, Dict, Optional
+import config
+from data_loader import KnowledgeDataLoader, group_entries_by_document
+from corpus_stats import delete_corpus_stats
+from shared_resources import (get_chroma_client, get_or_create_collection, load_collection_aliases,
+                              resolve_collection_alias, set_collection_alias, forget_previous_collection)
+
+SUPPORTED_TARGETS = ('enhanced', 'original')
+
+class ReusingEmbeddingClient:
+    """
+    包装嵌入客户端：文本与现有集合中同ID条目的文档完全相同时直接复用其向量，
+    只有新增或变化的文本才调用嵌入API
+
+    每个批次只按ID从现有集合读取该批次的向量，不把现有集合整体读入内存
+    """
+
+    def __init__(self, embedding_client, live_collection=None, text_ids: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            embedding_client: 实际的嵌入客户端
+            live_collection: 别名当前指向的集合，None时不复用
+            text_ids: 嵌入文本 -> 条目ID（与写入集合时使用的ID一致）
+        """
+        self.embedding_client = embedding_client
+        self.live_collection = live_collection
+        self.text_ids = text_ids or {}
+        self.reused = 0
+        self.embedded = 0
+
+    def _live_vectors(self, texts: List[str]) -> Dict[str, List[float]]:
+        """按ID读取现有集合中的向量，只保留文档文本未变化的条目"""
+        ids = list(dict.fromkeys(self.text_ids[text] for text in texts if text in self.text_ids))
+        if self.live_collection is None or not ids:
+            return {}
+        try:
+            page = self.live_collection.get(ids=ids, include=['documents', 'embeddings'])
+        except Exception as e:
+            print(f"⚠️ 读取现有集合向量失败，改为重新嵌入: {e}")
+            return {}
+        return {document: [float(value) for value in embedding]
+                for document, embedding in zip(page['documents'], page['embeddings'])}
+
+    def get_embeddings_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        unique_texts = list(dict.fromkeys(texts))
+        vectors = self._live_vectors(unique_texts)
+        missing = [text for text in unique_texts if text not in vectors]
+        if missing:
+            embeddings = self.embedding_client.get_embeddings_batch(missing)
+            if not embeddings:
+                return None
+            vectors.update(zip(missing, embeddings))
+        # 按唯一文本计数：批次内的重复文本不算作复用
+        self.embedded += len(missing)
+        self.reused += len(unique_texts) - len(missing)
+        return [vectors[text] for text in texts]
+
+class ShadowReindexer:
+    """
+    零停机重建：在影子集合中完整构建新索引，校验通过后原子切换别名
+
+    构建期间检索引擎继续使用别名当前指向的集合；切换后各引擎在下一次查询时
+    通过 refresh_collection_alias() 打开新集合。旧集合保留用于回滚。
+    """
+
+    def __init__(self, target: str = 'enhanced', alias: str = None):
+        if target not in SUPPORTED_TARGETS:
+            raise ValueError(f"不支持的重建目标: {target}，可选值: {SUPPORTED_TARGETS}")
+        self.target = target
+        if target == 'enhanced':
+            from enhanced_embedding_system import EnhancedVectorDatabaseManager
+            self.manager = EnhancedVectorDatabaseManager()
+            self.to_document = self.manager.enhanced_triple_to_text
+            self.alias = alias or config.COLLECTION_NAME + "_enhanced"
+        else:
+            from vector_database import VectorDatabaseManager
+            self.manager = VectorDatabaseManager()
+            self.to_document = self.manager.triple_to_embedding_text
+            self.alias = alias or config.COLLECTION_NAME
+        self.client = get_chroma_client(config.CHROMA_DB_PATH)
+
+    def _live_collection(self):
+        try:
+            return self.client.get_collection(name=resolve_collection_alias(self.alias))
+        except Exception:
+            return None
+
+    def build_shadow(self, knowledge_entries: Optional[List[Dict]] = None, reuse_vectors: bool = True) -> str:
+        """在新的影子集合中构建索引，返回影子集合名称"""
+        shadow_name = f"{self.alias[:40]}__v{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        print(f"🏗 构建影子集合: {shadow_name} (别名 {self.alias} 仍指向 {resolve_collection_alias(self.alias)})")
+
+        # 嵌入模型变化时旧向量不可复用
+        live = self._live_collection()
+        live_model = load_collection_aliases().get(self.alias, {}).get('embedding_model', config.EMBEDDING_MODEL)
+        if not reuse_vectors or live_model != config.EMBEDDING_MODEL:
+            live = None
+
+        if knowledge_entries is None:
+            knowledge_entries = KnowledgeDataLoader().get_knowledge_entries()
+        text_ids = {}
+        if live is not None:
+            # 与populate一致：去重时每个文本使用分组中第一个条目的ID
+            for entry in knowledge_entries:
+                text_ids.setdefault(self.to_document(entry["triple"], entry["schema"]), entry["id"])
+
+        original_client = self.manager.embedding_client
+        self.manager.embedding_client = ReusingEmbeddingClient(original_client, live, text_ids)
+        self.manager.collection = get_or_create_collection(self.client, shadow_name)
+        try:
+            if self.target == 'enhanced':
+                self.manager.populate_enhanced_database(knowledge_entries)
+            else:
+                self.manager.populate_database(knowledge_entries)
+        finally:
+            reusing_client = self.manager.embedding_client
+            self.manager.embedding_client = original_client
+
+        print(f"♻️ 复用向量 {reusing_client.reused} 条, 新嵌入 {reusing_client.embedded} 条")
+        return shadow_name
+
+    def expected_count(self, knowledge_entries: Optional[List[Dict]] = None) -> int:
+        """按当前的文本转换和去重设置计算影子集合应有的条目数"""
+        if knowledge_entries is None:
+            knowledge_entries = KnowledgeDataLoader().get_knowledge_entries()
+        if config.DEDUPLICATE_TRIPLES:
+            return len(group_entries_by_document(knowledge_entries, self.to_document))
+        return len({entry['id'] for entry in knowledge_entries})
+
+    def validate(self, shadow_name: str, expected_count: int, sample_size: int = None,
+                 k: int = 10, min_recall: float = None) -> Dict:
+        """
+        校验影子集合：条目数与预期一致，且抽查条目用其文档文本重新嵌入后能在Top-K中检索到自身
+        """
+        sample_size = sample_size or config.REINDEX_SPOT_CHECK_SIZE
+        min_recall = config.REINDEX_MIN_RECALL if min_recall is None else min_recall
+
+        shadow = self.client.get_collection(name=shadow_name)
+        count = shadow.count()
+        report = {'shadow': shadow_name, 'count': count, 'expected_count': expected_count}
+
+        offsets = sorted(random.Random(42).sample(range(count), min(sample_size, count)))
+        sample_ids, sample_documents = [], []
+        for offset in offsets:
+            page = shadow.get(limit=1, offset=offset, include=['documents'])
+            sample_ids.extend(page['ids'])
+            sample_documents.extend(page['documents'])
+
+        hits = 0
+        for i in range(0, len(sample_documents), config.BATCH_SIZE):
+            embeddings = self.manager.embedding_client.get_embeddings_batch(sample_documents[i:i + config.BATCH_SIZE])
+            if not embeddings:
+                continue
+            results = shadow.query(query_embeddings=embeddings, n_results=min(k, count))
+            hits += sum(doc_id in found for doc_id, found in zip(sample_ids[i:i + config.BATCH_SIZE], results['ids']))
+
+        report['spot_check_size'] = len(sample_ids)
+        report[f'self_recall@{k}'] = hits / len(sample_ids) if sample_ids else 0.0
+        report['passed'] = bool(count == expected_count and sample_ids
+                                and report[f'self_recall@{k}'] >= min_recall)
+        return report
+
+    def swap(self, shadow_name: str) -> str:
+        """原子地把别名切换到影子集合，返回之前的实际集合名"""
+        previous = set_collection_alias(
+            self.alias, shadow_name,
+            embedding_model=config.EMBEDDING_MODEL,
+            swapped_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        )
+        print(f"🔀 别名已切换: {self.alias} -> {shadow_name} (之前: {previous})")
+        return previous
+
+    def rollback(self) -> Optional[str]:
+        """把别名切回上一次切换前的集合"""
+        entry = load_collection_aliases().get(self.alias)
+        if not entry or entry.get('previous') in (None, entry['collection']):
+            print("⚠️ 没有可回滚的集合")
+            return None
+        try:
+            self.client.get_collection(name=entry['previous'])
+        except Exception:
+            print(f"❌ 回滚目标集合 {entry['previous']} 已不存在，别名保持不变")
+            return None
+        return self.swap(entry['previous'])
+
+    def drop_collection(self, collection_name: str):
+        """删除不再使用的集合（不允许删除别名当前指向的集合）"""
+        if collection_name == resolve_collection_alias(self.alias):
+            raise ValueError(f"集合 {collection_name} 正在被别名 {self.alias} 使用，不能删除")
+        self.client.delete_collection(name=collection_name)
+        delete_corpus_stats(collection_name)
+        forget_previous_collection(collection_name)
+        print(f"🗑 已删除集合: {collection_name}")
+
+    def reindex(self, reuse_vectors: bool = True, drop_previous: bool = False) -> Dict:
+        """完整流程：构建影子集合 -> 校验 -> 切换别名（校验失败时保留现有集合并删除影子集合）"""
+        knowledge_entries = KnowledgeDataLoader().get_knowledge_entries()
+        if not knowledge_entries:
+            print("❌ 没有找到知识条目")
+            return {'passed': False}
+
+        shadow_name = self.build_shadow(knowledge_entries, reuse_vectors=reuse_vectors)
+        report = self.validate(shadow_name, self.expected_count(knowledge_entries))
+        print(f"📋 校验结果: {report}")
+
+        if not report['passed']:
+            print("❌ 影子集合校验失败，别名保持不变")
+            self.drop_collection(shadow_name)
+            return report
+
+        previous = self.swap(shadow_name)
+        report['previous'] = previous
+        if drop_previous and previous != shadow_name:
+            try:
+                self.drop_collection(previous)
+            except Exception as e:
+                print(f"⚠️ 旧集合删除失败: {e}")
+        return report
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="零停机重建索引（影子集合 + 别名切换）")
+    parser.add_argument('--target', choices=SUPPORTED_TARGETS, default='enhanced', help='重建的集合类型')
+    parser.add_argument('--alias', default=None, help='别名（默认为检索引擎使用的集合名）')
+    parser.add_argument('--no-reuse', action='store_true', help='不复用现有集合中的向量，全部重新嵌入')
+    parser.add_argument('--drop-previous', action='store_true', help='切换成功后删除旧集合')
+    parser.add_argument('--rollback', action='store_true', help='把别名切回上一个集合')
+
+    args = parser.parse_args()
+
+    reindexer = ShadowReindexer(args.target, args.alias)
+    if args.rollback:
+        reindexer.rollback()
+    else:
+        reindexer.reindex(reuse_vectors=not args.no_reuse, drop_previous=args.drop_previous)
+
+# 测试函数
+def test_reusing_embedding_client():
+    """测试向量复用：已存在的文本不再调用嵌入API"""
+
+    class _MockEmbeddingClient:
+        def __init__(self):
+            self.calls = []
+
+        def get_embeddings_batch(self, texts):
+            self.calls.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+    class _MockCollection:
+        name = "mock_live"
+        rows = {'a': ('old text', [1.0]), 'b': ('kept text', [2.0])}
+
+        def get(self, ids, include):
+            found = [doc_id for doc_id in ids if doc_id in self.rows]
+            return {'ids': found, 'documents': [self.rows[doc_id][0] for doc_id in found],
+                    'embeddings': [self.rows[doc_id][1] for doc_id in found]}
+
+    base = _MockEmbeddingClient()
+    # 'a' 的文本已变化，不能复用
+    client = ReusingEmbeddingClient(base, _MockCollection(), {'kept text': 'b', 'changed text': 'a', 'new text': 'c'})
+    vectors = client.get_embeddings_batch(['kept text', 'changed text', 'new text', 'new text'])
+    print(f"向量: {vectors}, API调用: {base.calls}, 复用 {client.reused}, 新嵌入 {client.embedded}")
+
+if __name__ == '__main__':
+    main()
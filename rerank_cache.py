@@ -0,0 +1,185 @@
+# rerank_cache.py - Cross-Encoder分数缓存（内存LRU + 可选磁盘持久化）
+
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Optional
+import config
+
+def normalize_query(query: str) -> str:
+    """归一化查询文本：小写并合并空白"""
+    return ' '.join(query.lower().split())
+
+def candidate_key(candidate: Dict) -> str:
+    """
+    候选文档的缓存键：文档ID + 文档文本的CRC32
+
+    重建索引后同一ID的文档文本可能变化，带上文本校验值可避免命中过期分数
+    """
+    return f"{candidate['id']}#{zlib.crc32(candidate['document'].encode('utf-8')):08x}"
+
+class RerankScoreCache:
+    """
+    按 (模型, 归一化查询, 文档) 缓存Cross-Encoder分数
+
+    内存中是有界LRU；开启持久化时分数同时写入SQLite文件，
+    内存未命中时再查磁盘，跨进程、跨运行复用
+    """
+
+    def __init__(self, model_name: str, max_entries: int = None, disk_path: Optional[str] = None):
+        self.model_name = model_name
+        self.max_entries = max_entries or config.RERANK_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if disk_path:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS rerank_scores (key TEXT PRIMARY KEY, score REAL)")
+            self._db.commit()
+
+    def _key(self, query: str, candidate: Dict) -> str:
+        return f"{self.model_name}\x1f{normalize_query(query)}\x1f{candidate_key(candidate)}"
+
+    def _remember(self, key: str, score: float):
+        self._entries[key] = score
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, query: str, candidates: List[Dict]) -> List[Optional[float]]:
+        """返回每个候选的缓存分数，未命中为None"""
+        keys = [self._key(query, candidate) for candidate in candidates]
+        with self._lock:
+            scores = []
+            for key in keys:
+                score = self._entries.get(key)
+                if score is not None:
+                    self._entries.move_to_end(key)
+                scores.append(score)
+
+            missing = [key for key, score in zip(keys, scores) if score is None]
+            if missing and self._db is not None:
+                found = {}
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, score FROM rerank_scores WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    found.update(rows)
+                for i, key in enumerate(keys):
+                    if scores[i] is None and key in found:
+                        scores[i] = found[key]
+                        self._remember(key, found[key])
+
+            hits = sum(score is not None for score in scores)
+            self.hits += hits
+            self.misses += len(scores) - hits
+            return scores
+
+    def put_many(self, query: str, candidates: List[Dict], scores):
+        """写入新计算的分数"""
+        entries = [(self._key(query, candidate), float(score)) for candidate, score in zip(candidates, scores)]
+        with self._lock:
+            for key, score in entries:
+                self._remember(key, score)
+            if self._db is not None and entries:
+                self._db.executemany("INSERT OR REPLACE INTO rerank_scores (key, score) VALUES (?, ?)", entries)
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'model_name': self.model_name,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'persistent': self._db is not None
+        }
+
+    def clear(self):
+        """清空内存和磁盘缓存"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM rerank_scores")
+                self._db.commit()
+
+_caches: Dict[str, RerankScoreCache] = {}
+_caches_lock = threading.Lock()
+
+def get_rerank_score_cache(model_name: str) -> Optional[RerankScoreCache]:
+    """获取进程内共享的分数缓存（每个模型一份），未启用缓存时返回None"""
+    if not config.RERANK_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            disk_path = config.RERANK_CACHE_FILE if config.RERANK_CACHE_PERSIST else None
+            cache = RerankScoreCache(model_name, disk_path=disk_path)
+            _caches[model_name] = cache
+        return cache
+
+def cached_rerank_scores(model_name: str, groups, scorer) -> List:
+    """
+    先查缓存，只对未缓存的 (查询, 候选) 调用scorer打分，再合并结果
+
+    Args:
+        groups: [(查询, 候选列表), ...]
+        scorer: scorer(groups) -> 每组的分数数组（例如 batch_reranker.rerank_groups）
+    """
+    cache = get_rerank_score_cache(model_name)
+    if cache is None:
+        return [list(scores) for scores in scorer(groups)]
+
+    results, missing_groups, missing_positions = [], [], []
+    for query, candidates in groups:
+        scores = cache.get_many(query, candidates)
+        positions = [i for i, score in enumerate(scores) if score is None]
+        results.append(scores)
+        missing_groups.append((query, [candidates[i] for i in positions]))
+        missing_positions.append(positions)
+
+    if any(candidates for _, candidates in missing_groups):
+        new_scores = scorer(missing_groups)
+        for (query, candidates), positions, scores, group_scores in zip(missing_groups, missing_positions,
+                                                                        new_scores, results):
+            cache.put_many(query, candidates, scores)
+            for position, score in zip(positions, scores):
+                group_scores[position] = float(score)
+
+    return results
+
+# 测试函数
+def test_rerank_cache():
+    """测试分数缓存：第二次只对新候选打分"""
+    import tempfile
+
+    calls = []
+
+    def scorer(groups):
+        calls.append(sum(len(candidates) for _, candidates in groups))
+        return [[float(len(candidate['document'])) for candidate in candidates] for _, candidates in groups]
+
+    candidates = [{'id': f'id_{i}', 'document': 'doc' * (i + 1)} for i in range(4)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original = (config.RERANK_CACHE_PERSIST, config.RERANK_CACHE_FILE)
+        config.RERANK_CACHE_PERSIST, config.RERANK_CACHE_FILE = True, str(Path(tmp_dir) / "scores.db")
+        try:
+            first = cached_rerank_scores("mock", [("Who leads  Belgium?", candidates[:3])], scorer)
+            second = cached_rerank_scores("mock", [("who leads belgium?", candidates)], scorer)
+            print(f"第一次: {first}, 第二次: {second}")
+            print(f"每次实际打分的句子对数: {calls} (预期: [3, 1])")
+            print(f"缓存统计: {get_rerank_score_cache('mock').stats()}")
+        finally:
+            config.RERANK_CACHE_PERSIST, config.RERANK_CACHE_FILE = original
+            _caches.pop("mock", None)
+
+if __name__ == '__main__':
+    test_rerank_cache()
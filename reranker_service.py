@@ -0,0 +1,374 @@
+# reranker_service.py - 共享的Cross-Encoder重排服务进程（Unix socket + 请求合批）
+
+import argparse
+import os
+import queue
+import secrets
+import stat
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+import config
+
+class _PendingRequest:
+    """等待合批打分的一次客户端请求"""
+
+    def __init__(self, groups: List[Tuple[str, List[Dict]]], batch_size: Optional[int]):
+        self.groups = groups
+        self.batch_size = batch_size
+        self.num_pairs = sum(len(candidates) for _, candidates in groups)
+        self.scores = None
+        self.error = None
+        self.done = threading.Event()
+
+def load_service_authkey(create: bool = False) -> bytes:
+    """
+    读取服务连接的认证密钥：优先使用config.RERANK_SERVICE_AUTHKEY，否则读取密钥文件
+
+    Args:
+        create: 密钥文件不存在时生成新的随机密钥（权限0600，服务端启动时使用）
+    """
+    if config.RERANK_SERVICE_AUTHKEY:
+        return config.RERANK_SERVICE_AUTHKEY.encode('utf-8')
+
+    key_path = config.RERANK_SERVICE_AUTHKEY_FILE
+    if create and not os.path.exists(key_path):
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        print(f"🔑 已生成重排服务密钥: {key_path}")
+
+    if os.stat(key_path).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise PermissionError(f"重排服务密钥文件权限过宽，请执行 chmod 600 {key_path}")
+    with open(key_path, 'r') as f:
+        return f.read().strip().encode('utf-8')
+
+def load_service_model(runtime: str = None):
+    """
+    加载服务持有的唯一一份重排模型
+
+    Returns:
+        (模型, 模型名称)，模型名称与 EnhancedVectorDatabaseManager.rerank_model_name 的约定一致；加载失败时模型为None
+    """
+    from shared_resources import get_rerank_model, get_onnx_rerank_model
+    runtime = runtime or config.RERANK_RUNTIME
+    if runtime == 'onnx':
+        model = get_onnx_rerank_model()
+        if model is not None:
+            return model, f"onnx:{model.model_path}"
+        print("⚠️ ONNX重排模型不可用，改用PyTorch模型")
+    return get_rerank_model(config.RERANK_MODEL_NAME, config.RERANK_MAX_LENGTH), config.RERANK_MODEL_NAME
+
+class RerankerService:
+    """
+    重排服务：一个进程持有一份模型，所有客户端的打分请求在短时间窗口内合并成大批次推理
+
+    协议基于 multiprocessing.connection（Unix socket，消息为pickle的字典）。
+    连接建立时先用共享密钥做HMAC握手，未通过认证的连接不会被反序列化任何消息；
+    socket文件权限为0600，只有服务所属用户可以连接：
+        {'op': 'ping'} -> {'ok': True, 'model_name': ..., 'stats': {...}}
+        {'op': 'score', 'groups': [(查询, [{'id', 'document'}, ...]), ...]} -> {'ok': True, 'scores': [[...], ...]}
+    """
+
+    def __init__(self, model, model_name: str, address: str = None, batch_window_ms: float = None,
+                 max_batch_pairs: int = None, authkey: bytes = None):
+        from batch_reranker import rerank_groups
+        from pretokenized_reranker import get_pretokenized_scorer
+
+        self.model = model
+        self.model_name = model_name
+        self.address = address or config.RERANK_SERVICE_ADDRESS
+        self.batch_window = (batch_window_ms if batch_window_ms is not None
+                             else config.RERANK_SERVICE_BATCH_WINDOW_MS) / 1000.0
+        self.max_batch_pairs = max_batch_pairs or config.RERANK_SERVICE_MAX_BATCH_PAIRS
+        self.authkey = authkey
+
+        pretokenized = get_pretokenized_scorer(model)
+        if pretokenized is not None:
+            self._score = pretokenized.score_groups
+        else:
+            self._score = lambda groups, batch_size=None: rerank_groups(model, groups, batch_size)
+
+        self._requests: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._listener = None
+        self._stopped = threading.Event()
+        self.stats = {'requests': 0, 'batches': 0, 'pairs': 0}
+
+    def _collect_batch(self) -> List[_PendingRequest]:
+        """取出第一个请求后，在时间窗口内继续收集请求，直到窗口结束或句子对数达到上限"""
+        try:
+            pending = [self._requests.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        num_pairs = pending[0].num_pairs
+        deadline = time.monotonic() + self.batch_window
+        while num_pairs < self.max_batch_pairs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(request)
+            num_pairs += request.num_pairs
+        return pending
+
+    def _batch_loop(self):
+        from rerank_cache import cached_rerank_scores
+
+        while not self._stopped.is_set():
+            pending = self._collect_batch()
+            if not pending:
+                continue
+
+            all_groups = [group for request in pending for group in request.groups]
+            batch_size = max((request.batch_size or 0) for request in pending) or None
+            try:
+                # 服务端的分数缓存对所有客户端共享
+                scores = cached_rerank_scores(self.model_name, all_groups,
+                                              lambda groups: self._score(groups, batch_size))
+                offset = 0
+                for request in pending:
+                    request.scores = [list(map(float, group_scores))
+                                      for group_scores in scores[offset:offset + len(request.groups)]]
+                    offset += len(request.groups)
+            except Exception as e:
+                for request in pending:
+                    request.error = str(e)
+
+            self.stats['requests'] += len(pending)
+            self.stats['batches'] += 1
+            self.stats['pairs'] += sum(request.num_pairs for request in pending)
+            for request in pending:
+                request.done.set()
+
+    def _handle_connection(self, conn):
+        """每个客户端连接一个线程：接收请求、放入合批队列、等待结果后回复"""
+        with conn:
+            while not self._stopped.is_set():
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    break
+
+                op = message.get('op')
+                if op == 'ping':
+                    reply = {'ok': True, 'model_name': self.model_name, 'stats': dict(self.stats)}
+                elif op == 'score':
+                    request = _PendingRequest(message['groups'], message.get('batch_size'))
+                    self._requests.put(request)
+                    request.done.wait()
+                    if request.error is None:
+                        reply = {'ok': True, 'scores': request.scores}
+                    else:
+                        reply = {'ok': False, 'error': request.error}
+                else:
+                    reply = {'ok': False, 'error': f"未知操作: {op}"}
+
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    break
+
+    def serve_forever(self):
+        """监听Unix socket直到stop()或Ctrl+C"""
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        authkey = self.authkey or load_service_authkey(create=True)
+        # socket文件创建时即为0600（umask），创建后再显式chmod一次
+        previous_umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family='AF_UNIX', authkey=authkey)
+        finally:
+            os.umask(previous_umask)
+        os.chmod(self.address, 0o600)
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        print(f"🚀 重排服务已启动: {self.address} (模型: {self.model_name}, "
+              f"合批窗口 {self.batch_window * 1000:.0f}ms, 每批最多 {self.max_batch_pairs} 个句子对)")
+
+        try:
+            while not self._stopped.is_set():
+                try:
+                    conn = self._listener.accept()
+                except AuthenticationError:
+                    print("⚠️ 拒绝未通过认证的连接")
+                    continue
+                except (OSError, EOFError):
+                    if self._stopped.is_set() or self._listener is None:
+                        break
+                    continue
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+class RerankerServiceClient:
+    """
+    重排服务客户端
+
+    同时提供 predict 接口（与 sentence_transformers.CrossEncoder 一致），
+    可以直接作为 EnhancedVectorDatabaseManager.rerank_model 使用
+    """
+
+    def __init__(self, address: str = None, authkey: bytes = None):
+        self.address = address or config.RERANK_SERVICE_ADDRESS
+        self.authkey = authkey
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _call(self, message: Dict) -> Dict:
+        """发送一条请求并等待回复，连接断开时重连一次"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None:
+                        if self.authkey is None:
+                            self.authkey = load_service_authkey()
+                        self._conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+                    self._conn.send(message)
+                    reply = self._conn.recv()
+                    break
+                except (EOFError, OSError):
+                    self.close()
+                    if attempt == 1:
+                        raise
+        if not reply.get('ok'):
+            raise RuntimeError(f"重排服务返回错误: {reply.get('error')}")
+        return reply
+
+    def ping(self) -> Dict:
+        return self._call({'op': 'ping'})
+
+    def score_groups(self, groups: List[Tuple[str, List[Dict]]], batch_size: int = None) -> List[np.ndarray]:
+        """为多组 (查询, 候选列表) 打分；只发送候选的ID和文档文本"""
+        payload = [(query, [{'id': candidate.get('id', ''), 'document': candidate['document']}
+                            for candidate in candidates])
+                   for query, candidates in groups]
+        reply = self._call({'op': 'score', 'groups': payload, 'batch_size': batch_size})
+        return [np.asarray(scores, dtype=np.float32) for scores in reply['scores']]
+
+    def predict(self, sentence_pairs: List[List[str]], batch_size: int = 32,
+                show_progress_bar: bool = False) -> np.ndarray:
+        """句子对打分（每个句子对作为单独一组）"""
+        groups = [(query, [{'id': '', 'document': document}]) for query, document in sentence_pairs]
+        scores = self.score_groups(groups, batch_size)
+        return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+
+def connect_reranker_service(address: str = None,
+                             authkey: bytes = None) -> Tuple[Optional[RerankerServiceClient], Optional[str]]:
+    """
+    连接重排服务
+
+    Returns:
+        (客户端, 服务端模型名称)，服务未启动时返回 (None, None)
+    """
+    client = RerankerServiceClient(address, authkey)
+    try:
+        model_name = client.ping()['model_name']
+    except (OSError, EOFError, RuntimeError, AuthenticationError) as e:
+        print(f"⚠️ 无法连接重排服务 {client.address}: {e}")
+        return None, None
+    return client, model_name
+
+def main():
+    """命令行入口 - 启动重排服务或查看服务状态"""
+    parser = argparse.ArgumentParser(description="共享的Cross-Encoder重排服务")
+    parser.add_argument('--address', default=config.RERANK_SERVICE_ADDRESS, help='Unix socket路径')
+    parser.add_argument('--runtime', choices=['pytorch', 'onnx'], default=config.RERANK_RUNTIME,
+                        help='推理后端')
+    parser.add_argument('--window-ms', type=float, default=config.RERANK_SERVICE_BATCH_WINDOW_MS,
+                        help='合批等待窗口（毫秒）')
+    parser.add_argument('--max-batch-pairs', type=int, default=config.RERANK_SERVICE_MAX_BATCH_PAIRS,
+                        help='每批最多句子对数')
+    parser.add_argument('--status', action='store_true', help='查看正在运行的服务状态')
+
+    args = parser.parse_args()
+
+    if args.status:
+        client, model_name = connect_reranker_service(args.address)
+        if client is not None:
+            stats = client.ping()['stats']
+            mean_pairs = stats['pairs'] / stats['batches'] if stats['batches'] else 0.0
+            print(f"📊 重排服务 {args.address}: 模型 {model_name}")
+            print(f"   请求 {stats['requests']}, 批次 {stats['batches']}, 平均每批 {mean_pairs:.1f} 个句子对")
+            client.close()
+        return
+
+    model, model_name = load_service_model(args.runtime)
+    if model is None:
+        print("❌ 重排模型加载失败，服务未启动")
+        return
+
+    service = RerankerService(model, model_name, args.address, args.window_ms, args.max_batch_pairs)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 重排服务已停止")
+
+# 测试函数
+def test_reranker_service():
+    """用模拟模型启动服务，多个客户端并发请求，检查请求被合并成批次"""
+    import tempfile
+
+    class _MockModel:
+        def __init__(self):
+            self.batch_sizes = []
+
+        def predict(self, pairs, batch_size=32, show_progress_bar=False):
+            self.batch_sizes.append(len(pairs))
+            return [float(len(document)) for _, document in pairs]
+
+    model = _MockModel()
+    address = os.path.join(tempfile.mkdtemp(), "reranker.sock")
+    authkey = b"test-key"
+    service = RerankerService(model, "mock-service", address, batch_window_ms=50, authkey=authkey)
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    while not os.path.exists(address):
+        time.sleep(0.01)
+
+    results = {}
+
+    def worker(i):
+        client = RerankerServiceClient(address, authkey)
+        candidates = [{'id': f'{i}_{n}', 'document': 'x' * (n + i)} for n in range(3)]
+        results[i] = client.score_groups([(f"question {i}", candidates)])[0].tolist()
+        client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    intruder, _ = connect_reranker_service(address, b"wrong-key")
+    client, model_name = connect_reranker_service(address, authkey)
+    stats = client.ping()['stats']
+    client.close()
+    socket_mode = oct(os.stat(address).st_mode & 0o777)
+    service.stop()
+    print(f"错误密钥的连接: {intruder} (预期: None), socket权限: {socket_mode} (预期: 0o600)")
+    print(f"分数: {[results[i] for i in range(4)]}")
+    print(f"服务模型: {model_name}, 请求 {stats['requests']}, 批次 {stats['batches']}, "
+          f"模型调用批大小 {model.batch_sizes}")
+
+if __name__ == '__main__':
+    main()
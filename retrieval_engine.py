@@ -1,6 +1,7 @@
 # retrieval_engine.py - 检索引擎
 
-from typing import List, Dict, Optional
+import time
+from typing import List, Dict, Optional, Callable
 from vector_database import VectorDatabaseManager
 from cotkr_rewriter import CoTKRRewriter
 import config
@@ -8,12 +9,19 @@ import config
 class RetrievalEngine:
     """新系统的检索引擎 - 集成CoTKR重写功能"""
     
-    def __init__(self):
+    def __init__(self, snapshot_path: str = None):
+        """
+        Args:
+            snapshot_path: 只读索引快照路径；提供时直接从快照检索，不打开ChromaDB集合
+        """
         self.db_manager = VectorDatabaseManager()
         self.cotkr_rewriter = CoTKRRewriter()
         
         # 初始化数据库连接
-        self.db_manager.initialize_collection()
+        if snapshot_path:
+            self.db_manager.use_snapshot(snapshot_path)
+        else:
+            self.db_manager.initialize_collection()
         
     def retrieve_and_rewrite(self, question: str, n_results: int = 5, prompt_type: str = None) -> Dict:
         """
@@ -37,21 +45,95 @@ class RetrievalEngine:
             }
         
         # 2. 使用CoTKR方法重写检索到的知识，传入prompt_type
-        cotkr_knowledge = self.cotkr_rewriter.rewrite_knowledge(retrieved_items, question, prompt_type)
+        detected_type = self._detect_question_type(question, prompt_type)
+        cotkr_knowledge = self.cotkr_rewriter.rewrite_knowledge(retrieved_items, question, prompt_type,
+                                                                question_type=detected_type)
         
         # 3. 从重写的知识中提取答案
         final_answer = self.cotkr_rewriter.extract_answer_from_knowledge(
             question, cotkr_knowledge, retrieved_items, prompt_type
         )
         
+        return self._build_result(question, retrieved_items, cotkr_knowledge, final_answer, prompt_type, detected_type)
+    
+    def stream_retrieve_and_rewrite(self, question: str, n_results: int = 5, prompt_type: str = None,
+                                    on_retrieved: Callable[[List[Dict]], None] = None,
+                                    on_knowledge: Callable[[str], None] = None,
+                                    on_token: Callable[[str], None] = None) -> Dict:
+        """
+        流式版本的 retrieve_and_rewrite：每一步完成就通过回调交给调用方展示
+        
+        Args:
+            on_retrieved: 检索完成后调用，参数为检索到的项目
+            on_knowledge: CoTKR重写完成后调用，参数为重写的知识
+            on_token: 答案片段到达时调用
+        
+        Returns:
+            与 retrieve_and_rewrite 相同的结果，另含 'timing'（毫秒）：
+            retrieval_ms（检索完成）、first_token_ms（首个答案片段）、total_ms，均从调用开始计时
+        """
+        start = time.perf_counter()
+        elapsed_ms = lambda: (time.perf_counter() - start) * 1000
+        
+        retrieved_items = self.db_manager.query_database(question, n_results)
+        timing = {'retrieval_ms': elapsed_ms(), 'first_token_ms': None, 'total_ms': None}
+        if on_retrieved:
+            on_retrieved(retrieved_items)
+        
+        if not retrieved_items:
+            cotkr_knowledge = "No relevant information found."
+            final_answer = "I don't have enough information to answer this question."
+            timing['first_token_ms'] = timing['total_ms'] = elapsed_ms()
+            if on_knowledge:
+                on_knowledge(cotkr_knowledge)
+            if on_token:
+                on_token(final_answer)
+            return {
+                'question': question,
+                'retrieved_items': [],
+                'cotkr_knowledge': cotkr_knowledge,
+                'final_answer': final_answer,
+                'timing': timing
+            }
+        
+        detected_type = self._detect_question_type(question, prompt_type)
+        cotkr_knowledge = self.cotkr_rewriter.rewrite_knowledge(retrieved_items, question, prompt_type,
+                                                                question_type=detected_type)
+        if on_knowledge:
+            on_knowledge(cotkr_knowledge)
+        
+        answer_parts = []
+        for delta in self.cotkr_rewriter.stream_answer_from_knowledge(question, cotkr_knowledge,
+                                                                      retrieved_items, prompt_type):
+            if timing['first_token_ms'] is None:
+                timing['first_token_ms'] = elapsed_ms()
+            answer_parts.append(delta)
+            if on_token:
+                on_token(delta)
+        timing['total_ms'] = elapsed_ms()
+        
+        result = self._build_result(question, retrieved_items, cotkr_knowledge, "".join(answer_parts).strip(),
+                                    prompt_type, detected_type)
+        result['timing'] = timing
+        return result
+    
+    def _detect_question_type(self, question: str, prompt_type: Optional[str]) -> Optional[str]:
+        """检测一次问题类型（复用检索时计算的查询嵌入）；提供了prompt_type时不检测"""
+        if prompt_type:
+            return None
+        return self.cotkr_rewriter.detect_question_type(question, self.db_manager.get_query_embedding(question))
+    
+    def _build_result(self, question: str, retrieved_items: List[Dict], cotkr_knowledge: str,
+                      final_answer: str, prompt_type: Optional[str], detected_type: Optional[str]) -> Dict:
+        """组装检索结果"""
         # 确定问题类型
         if prompt_type:
             # 如果提供了prompt_type，直接使用
             question_type = prompt_type
         else:
-            # 否则检测问题类型
+            # 否则使用检测出的问题类型
             is_question = question.strip().endswith('?') or any(question.lower().startswith(word) for word in ['who', 'what', 'where', 'when', 'why', 'how'])
-            question_type = self.cotkr_rewriter.detect_question_type(question) if is_question else 'statement'
+            question_type = detected_type if is_question else 'statement'
         
         return {
             'question': question,
@@ -65,14 +147,39 @@ class RetrievalEngine:
             }
         }
     
-    def batch_retrieve(self, questions: List[str], n_results: int = 5) -> List[Dict]:
-        """批量检索和重写"""
-        results = []
+    def batch_retrieve(self, questions: List[str], n_results: int = 5, prompt_type: str = None) -> List[Dict]:
+        """
+        批量检索和重写
         
+        开启config.COTKR_BATCH_EXTRACTION时，多个问题的答案提取合并成少量LLM请求
+        """
+        if not config.COTKR_BATCH_EXTRACTION:
+            return [self.retrieve_and_rewrite(question, n_results, prompt_type) for question in questions]
+        
+        extraction_items, detected_types = [], []
         for question in questions:
-            result = self.retrieve_and_rewrite(question, n_results)
-            results.append(result)
+            retrieved_items = self.db_manager.query_database(question, n_results)
+            detected_type = self._detect_question_type(question, prompt_type)
+            cotkr_knowledge = self.cotkr_rewriter.rewrite_knowledge(retrieved_items, question, prompt_type,
+                                                                    question_type=detected_type)
+            extraction_items.append((question, cotkr_knowledge, retrieved_items, prompt_type))
+            detected_types.append(detected_type)
+        
+        answers = self.cotkr_rewriter.extract_answers_batch(extraction_items)
         
+        results = []
+        for (question, cotkr_knowledge, retrieved_items, _), final_answer, detected_type in zip(
+                extraction_items, answers, detected_types):
+            if not retrieved_items:
+                results.append({
+                    'question': question,
+                    'retrieved_items': [],
+                    'cotkr_knowledge': "No relevant information found.",
+                    'final_answer': "I don't have enough information to answer this question."
+                })
+            else:
+                results.append(self._build_result(question, retrieved_items, cotkr_knowledge,
+                                                  final_answer, prompt_type, detected_type))
         return results
     
     def get_system_status(self) -> Dict:
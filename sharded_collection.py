@@ -0,0 +1,330 @@
+# sharded_collection.py - 按领域分片的集合与查询路由
+
+import heapq
+import json
+import re
+from pathlib import Path
+from typing import List, Dict, Optional
+import numpy as np
+import config
+from shared_resources import get_or_create_collection
+
+# 路由状态累计多少次写入后自动保存一次（populate结束时也会显式保存）
+ROUTER_SAVE_EVERY = 50
+# 实体路由时从问题中提取的最长n-gram
+MAX_ENTITY_NGRAM = 5
+
+def domain_from_source_file(source_file: str) -> str:
+    """
+    从来源文件名推断领域，例如 '.../3_Airport.xml' -> 'Airport'
+    """
+    if not source_file:
+        return "unknown"
+    stem = Path(str(source_file).replace('\\', '/')).stem
+    domain = re.sub(r'^\d+_', '', stem)
+    return domain or "unknown"
+
+def shard_collection_name(base_name: str, domain: str) -> str:
+    """生成分片集合名称（ChromaDB集合名最长63个字符，只允许字母数字和._-）"""
+    domain_clean = re.sub(r'[^a-zA-Z0-9_-]', '_', domain)[:20]
+    return f"{base_name[:40]}__{domain_clean}"
+
+class ShardedCollection:
+    """
+    按领域分片的集合
+
+    每个领域（来源文件）对应一个ChromaDB集合，并维护一个轻量路由器：
+    - 分片质心：各分片归一化嵌入的均值，用于按相似度挑选分片
+    - 实体索引：实体名称 -> 所在分片，问题中出现的实体直接命中对应分片
+    查询时只检索被路由到的分片，再按距离合并Top-K。
+    接口与ChromaDB集合的 count/get/query/add 保持一致。
+    """
+
+    def __init__(self, client, base_name: str, route_top_n: int = None):
+        self.client = client
+        self.name = base_name
+        self.route_top_n = route_top_n or config.SHARD_ROUTING_TOP_N
+        self.router_path = Path(config.CHROMA_DB_PATH) / f"{base_name}_shard_router.json"
+
+        self.shards: Dict[str, object] = {}
+        self.centroid_sums: Dict[str, np.ndarray] = {}
+        self.shard_counts: Dict[str, int] = {}
+        self.entity_index: Dict[str, set] = {}
+        self.last_routed_shards: List[str] = []
+        self._pending_adds = 0
+
+        self._load_router()
+
+    # ---------- 路由状态 ----------
+
+    def _load_router(self):
+        """加载路由状态并打开已有的分片集合"""
+        if not self.router_path.exists():
+            return
+        try:
+            with open(self.router_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (IOError, ValueError) as e:
+            print(f"⚠️ 分片路由状态读取失败，将检索全部分片: {e}")
+            return
+
+        for domain, info in state.get('shards', {}).items():
+            self.shards[domain] = self._get_shard(domain)
+            self.shard_counts[domain] = info['count']
+            self.centroid_sums[domain] = np.asarray(info['centroid_sum'], dtype=np.float32)
+        self.entity_index = {entity: set(domains) for entity, domains in state.get('entities', {}).items()}
+
+    def save_router(self):
+        """保存路由状态（分片质心、条目数和实体索引）"""
+        state = {
+            'base_name': self.name,
+            'shards': {
+                domain: {
+                    'collection': shard_collection_name(self.name, domain),
+                    'count': self.shard_counts.get(domain, 0),
+                    'centroid_sum': self.centroid_sums[domain].tolist()
+                }
+                for domain in self.centroid_sums
+            },
+            'entities': {entity: sorted(domains) for entity, domains in self.entity_index.items()}
+        }
+        self.router_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.router_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        self._pending_adds = 0
+
+    def _get_shard(self, domain: str):
+        shard = self.shards.get(domain)
+        if shard is None:
+            shard = get_or_create_collection(self.client, shard_collection_name(self.name, domain))
+            self.shards[domain] = shard
+        return shard
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def route(self, query_embedding, routing_text: Optional[str] = None) -> List[str]:
+        """
+        选择要检索的分片：实体命中的分片 + 质心最相似的route_top_n个分片
+
+        没有路由状态时返回全部分片
+        """
+        if not self.centroid_sums:
+            return list(self.shards.keys())
+
+        selected = []
+
+        # 1. 实体索引命中
+        if routing_text and self.entity_index:
+            words = re.findall(r"[\w'-]+", routing_text.lower())
+            for size in range(MAX_ENTITY_NGRAM, 0, -1):
+                for start in range(len(words) - size + 1):
+                    for domain in self.entity_index.get(' '.join(words[start:start + size]), ()):
+                        if domain not in selected:
+                            selected.append(domain)
+
+        # 2. 质心相似度
+        domains = list(self.centroid_sums.keys())
+        centroids = self._normalize(np.stack([self.centroid_sums[d] for d in domains]))
+        similarities = centroids @ self._normalize(query_embedding)
+        for index in np.argsort(-similarities)[:self.route_top_n]:
+            if domains[index] not in selected:
+                selected.append(domains[index])
+
+        return selected
+
+    # ---------- 集合接口 ----------
+
+    def add(self, ids: List[str], embeddings: List[List[float]],
+            documents: List[str], metadatas: List[Dict]):
+        """按来源文件的领域把条目写入对应分片，并更新路由状态"""
+        grouped = {}
+        for i, metadata in enumerate(metadatas):
+            domain = domain_from_source_file(metadata.get('source_file', ''))
+            grouped.setdefault(domain, []).append(i)
+
+        normalized = self._normalize(embeddings)
+        for domain, rows in grouped.items():
+            self._get_shard(domain).add(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                documents=[documents[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows]
+            )
+
+            centroid_sum = normalized[rows].sum(axis=0)
+            if domain in self.centroid_sums:
+                self.centroid_sums[domain] += centroid_sum
+            else:
+                self.centroid_sums[domain] = centroid_sum
+            self.shard_counts[domain] = self.shard_counts.get(domain, 0) + len(rows)
+
+            for i in rows:
+                for key in ('sub', 'obj'):
+                    entity = metadatas[i].get(key, '').replace('_', ' ').lower()
+                    if entity:
+                        self.entity_index.setdefault(entity, set()).add(domain)
+
+        self._pending_adds += 1
+        if self._pending_adds >= ROUTER_SAVE_EVERY:
+            self.save_router()
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards.values())
+
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[List[str]] = None) -> Dict:
+        """按ID或跨分片分页读取条目"""
+        include = include or ['documents', 'metadatas']
+        result = {'ids': []}
+        for key in include:
+            result[key] = []
+
+        remaining_offset = offset or 0
+        remaining_limit = limit
+        for domain in sorted(self.shards):
+            shard = self.shards[domain]
+            if ids is not None:
+                page = shard.get(ids=ids, include=include)
+            else:
+                shard_count = shard.count()
+                if remaining_offset >= shard_count:
+                    remaining_offset -= shard_count
+                    continue
+                if remaining_limit is not None and remaining_limit <= 0:
+                    break
+                page = shard.get(limit=remaining_limit, offset=remaining_offset, include=include)
+                remaining_offset = 0
+                if remaining_limit is not None:
+                    remaining_limit -= len(page['ids'])
+
+            result['ids'].extend(page['ids'])
+            for key in include:
+                result[key].extend(list(page[key]))
+
+        return result
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              routing_text: Optional[str] = None) -> Dict:
+        """只检索被路由到的分片，并按距离合并各分片的Top-K"""
+        results = {'ids': [], 'distances': [], 'documents': [], 'metadatas': []}
+
+        for query_embedding in query_embeddings:
+            domains = self.route(query_embedding, routing_text)
+            self.last_routed_shards = domains
+
+            candidates = []
+            for domain in domains:
+                shard = self.shards.get(domain)
+                shard_count = shard.count() if shard is not None else 0
+                if shard_count == 0:
+                    continue
+                shard_results = shard.query(
+                    query_embeddings=[query_embedding],
+                    n_results=min(n_results, shard_count)
+                )
+                for i in range(len(shard_results['ids'][0])):
+                    candidates.append((
+                        shard_results['distances'][0][i],
+                        shard_results['ids'][0][i],
+                        shard_results['documents'][0][i],
+                        shard_results['metadatas'][0][i]
+                    ))
+
+            merged = heapq.nsmallest(n_results, candidates, key=lambda item: item[0])
+            results['distances'].append([item[0] for item in merged])
+            results['ids'].append([item[1] for item in merged])
+            results['documents'].append([item[2] for item in merged])
+            results['metadatas'].append([item[3] for item in merged])
+
+        return results
+
+    def get_shard_stats(self) -> Dict[str, int]:
+        """各分片的条目数"""
+        return {domain: shard.count() for domain, shard in sorted(self.shards.items())}
+
+    def delete_all(self):
+        """删除全部分片集合和路由状态"""
+        for domain in list(self.shards):
+            try:
+                self.client.delete_collection(name=shard_collection_name(self.name, domain))
+            except Exception:
+                pass
+        self.shards.clear()
+        self.centroid_sums.clear()
+        self.shard_counts.clear()
+        self.entity_index.clear()
+        if self.router_path.exists():
+            self.router_path.unlink()
+
+def collection_query(collection, query_embeddings: List[List[float]], n_results: int,
+                     query_text: Optional[str] = None) -> Dict:
+    """对普通集合或分片集合执行查询，分片集合额外使用问题文本做实体路由"""
+    if isinstance(collection, ShardedCollection):
+        return collection.query(query_embeddings=query_embeddings, n_results=n_results,
+                                routing_text=query_text)
+    return collection.query(query_embeddings=query_embeddings, n_results=n_results)
+
+# 测试函数
+def test_sharded_collection():
+    """测试分片路由（使用内存中的模拟客户端）"""
+    import tempfile
+
+    class _MockShard:
+        def __init__(self):
+            self.rows = []
+
+        def add(self, ids, embeddings, documents, metadatas):
+            self.rows.extend(zip(ids, embeddings, documents, metadatas))
+
+        def count(self):
+            return len(self.rows)
+
+        def query(self, query_embeddings, n_results):
+            q = ShardedCollection._normalize(query_embeddings[0])
+            scored = sorted(self.rows, key=lambda r: 1 - float(ShardedCollection._normalize(r[1]) @ q))[:n_results]
+            return {
+                'ids': [[r[0] for r in scored]],
+                'distances': [[1 - float(ShardedCollection._normalize(r[1]) @ q) for r in scored]],
+                'documents': [[r[2] for r in scored]],
+                'metadatas': [[r[3] for r in scored]]
+            }
+
+    class _MockClient:
+        def __init__(self):
+            self.collections = {}
+
+        def get_collection(self, name):
+            return self.collections[name]
+
+        def get_or_create_collection(self, name, metadata=None):
+            return self.collections.setdefault(name, _MockShard())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original_path = config.CHROMA_DB_PATH
+        config.CHROMA_DB_PATH = tmp_dir
+        try:
+            sharded = ShardedCollection(_MockClient(), "mock", route_top_n=1)
+            sharded.add(
+                ids=['a1', 'a2', 'c1'],
+                embeddings=[[1, 0, 0], [0.9, 0.1, 0], [0, 0, 1]],
+                documents=['airport 1', 'airport 2', 'city 1'],
+                metadatas=[
+                    {'sub': 'Brussels_Airport', 'obj': 'Belgium', 'source_file': '3_Airport.xml'},
+                    {'sub': 'Schiphol', 'obj': 'Netherlands', 'source_file': '3_Airport.xml'},
+                    {'sub': 'Brussels', 'obj': 'Belgium', 'source_file': '2_City.xml'}
+                ]
+            )
+            results = sharded.query([[1, 0, 0]], n_results=2, routing_text="Where is Brussels located?")
+            print(f"分片: {sharded.get_shard_stats()}")
+            print(f"路由到的分片: {sharded.last_routed_shards}")
+            print(f"合并结果: {results['ids'][0]}")
+        finally:
+            config.CHROMA_DB_PATH = original_path
+
+if __name__ == '__main__':
+    test_sharded_collection()
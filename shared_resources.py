@@ -0,0 +1,286 @@
+# shared_resources.py - 进程级共享资源注册表
+
+import json
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+import config
+
+# 注册表：同一进程内按键复用重量级对象
+_chroma_clients: Dict[str, object] = {}
+_rerank_models: Dict[Tuple[str, int], object] = {}
+_embedding_clients: Dict[Tuple[str, str], object] = {}
+_openai_clients: Dict[str, object] = {}
+# _registry_lock只保护字典本身；创建对象时只持有该键自己的锁，
+# 加载模型等慢操作不会阻塞其他资源的获取
+_registry_lock = threading.Lock()
+_key_locks: Dict[Tuple[int, object], threading.Lock] = {}
+
+def _get_or_create(registry: Dict, key, factory: Callable[[], object]):
+    """
+    从注册表获取对象，不存在时调用factory创建；同一个键只创建一次
+
+    factory返回None表示创建失败，失败结果不缓存
+    """
+    with _registry_lock:
+        value = registry.get(key)
+        if value is not None:
+            return value
+        key_lock = _key_locks.setdefault((id(registry), key), threading.Lock())
+
+    with key_lock:
+        with _registry_lock:
+            value = registry.get(key)
+        if value is None:
+            value = factory()
+            if value is not None:
+                with _registry_lock:
+                    registry[key] = value
+        return value
+
+def get_chroma_client(db_path: Optional[str] = None):
+    """
+    获取共享的ChromaDB客户端，每个数据库路径只创建一个PersistentClient
+
+    Args:
+        db_path: 数据库路径，默认使用config.CHROMA_DB_PATH
+    """
+    if db_path is None:
+        db_path = config.CHROMA_DB_PATH
+
+    def create():
+        import chromadb
+        return chromadb.PersistentClient(path=db_path)
+
+    return _get_or_create(_chroma_clients, db_path, create)
+
+def get_rerank_model(model_name: Optional[str] = None, max_length: Optional[int] = None):
+    """
+    获取共享的Cross-Encoder重排模型，每个(模型名, max_length)只加载一次
+
+    加载失败或sentence-transformers未安装时返回None，且不缓存失败结果
+
+    Args:
+        model_name: 模型名称，默认使用config.RERANK_MODEL_NAME
+        max_length: 最大序列长度，默认使用config.RERANK_MAX_LENGTH
+    """
+    if model_name is None:
+        model_name = config.RERANK_MODEL_NAME
+    if max_length is None:
+        max_length = config.RERANK_MAX_LENGTH
+
+    def create():
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            print("⚠️ sentence-transformers未安装，将使用原有的重排方法")
+            return None
+
+        try:
+            print(f"🔄 加载Cross-Encoder重排模型: {model_name}...")
+            model = CrossEncoder(model_name, max_length=max_length)
+            print("✅ Cross-Encoder模型加载成功")
+            return model
+        except Exception as e:
+            print(f"⚠️ Cross-Encoder模型加载失败: {e}")
+            return None
+
+    return _get_or_create(_rerank_models, (model_name, max_length), create)
+
+def get_onnx_rerank_model(model_dir: Optional[str] = None, max_length: Optional[int] = None,
+                          num_threads: Optional[int] = None):
+    """
+    获取共享的ONNX Cross-Encoder，每个(模型目录, max_length)只加载一次
+
+    onnxruntime/transformers未安装或模型未导出时返回None，且不缓存失败结果
+
+    Args:
+        model_dir: onnx_reranker.py导出的模型目录，默认使用config.ONNX_RERANK_MODEL_DIR
+        max_length: 最大序列长度，默认使用config.ONNX_RERANK_MAX_LENGTH
+        num_threads: intra-op线程数，默认使用config.ONNX_RERANK_THREADS
+    """
+    if model_dir is None:
+        model_dir = config.ONNX_RERANK_MODEL_DIR
+    if max_length is None:
+        max_length = config.ONNX_RERANK_MAX_LENGTH
+
+    def create():
+        try:
+            from onnx_reranker import OnnxCrossEncoder
+            print(f"🔄 加载ONNX重排模型: {model_dir}...")
+            model = OnnxCrossEncoder(model_dir, max_length=max_length, num_threads=num_threads)
+            print(f"✅ ONNX重排模型加载成功: {model.model_path}")
+            return model
+        except ImportError:
+            print("⚠️ onnxruntime或transformers未安装，无法使用ONNX重排模型")
+            return None
+        except Exception as e:
+            print(f"⚠️ ONNX重排模型加载失败（需先运行 python onnx_reranker.py --export）: {e}")
+            return None
+
+    return _get_or_create(_rerank_models, (f"onnx:{model_dir}", max_length), create)
+
+def get_embedding_client(api_url: Optional[str] = None, model: Optional[str] = None):
+    """
+    获取共享的嵌入客户端，每个(API地址, 模型)只创建一个实例
+
+    Args:
+        api_url: 嵌入服务地址，默认使用config.SILICONFLOW_API_URL
+        model: 嵌入模型名称，默认使用config.EMBEDDING_MODEL
+    """
+    if api_url is None:
+        api_url = config.SILICONFLOW_API_URL
+    if model is None:
+        model = config.EMBEDDING_MODEL
+
+    def create():
+        from embedding_client import EmbeddingClient
+        client = EmbeddingClient()
+        client.api_url = api_url
+        client.model = model
+        return client
+
+    return _get_or_create(_embedding_clients, (api_url, model), create)
+
+def get_openai_client(api_key: Optional[str] = None):
+    """
+    获取共享的OpenAI客户端，每个API密钥只创建一个实例（复用其HTTP连接池）
+
+    Args:
+        api_key: API密钥，默认使用config.OPENAI_API_KEY
+    """
+    if api_key is None:
+        api_key = config.OPENAI_API_KEY
+
+    def create():
+        from openai import OpenAI
+        return OpenAI(api_key=api_key)
+
+    return _get_or_create(_openai_clients, api_key, create)
+
+def load_hnsw_settings() -> Dict:
+    """读取hnsw_tuner.py写入的HNSW参数（只包含hnsw:*键），文件不存在时返回空字典"""
+    if not os.path.exists(config.HNSW_SETTINGS_FILE):
+        return {}
+    try:
+        with open(config.HNSW_SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+    except (IOError, ValueError) as e:
+        print(f"⚠️ HNSW参数文件读取失败，使用默认参数: {e}")
+        return {}
+    return {key: value for key, value in settings.items() if key.startswith('hnsw:')}
+
+def get_or_create_collection(client, name: str):
+    """
+    获取或创建集合，新建时使用余弦距离和调优后的HNSW参数
+
+    HNSW参数只能在创建时指定，已存在的集合按原参数打开
+    """
+    try:
+        return client.get_collection(name=name)
+    except Exception:
+        metadata = {"hnsw:space": "cosine"}
+        metadata.update(load_hnsw_settings())
+        return client.get_or_create_collection(name=name, metadata=metadata)
+
+def load_collection_aliases() -> Dict:
+    """读取集合别名表 {别名: {"collection": 实际集合名, ...}}，文件不存在时返回空字典"""
+    if not os.path.exists(config.COLLECTION_ALIASES_FILE):
+        return {}
+    try:
+        with open(config.COLLECTION_ALIASES_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        print(f"⚠️ 集合别名文件读取失败，按原名称打开集合: {e}")
+        return {}
+
+def resolve_collection_alias(name: str) -> str:
+    """把集合别名解析为实际集合名，没有别名时返回原名称"""
+    entry = load_collection_aliases().get(name)
+    return entry["collection"] if entry else name
+
+def get_alias_version() -> float:
+    """别名表的修改时间，检索引擎据此判断别名是否已切换"""
+    try:
+        return os.path.getmtime(config.COLLECTION_ALIASES_FILE)
+    except OSError:
+        return 0.0
+
+def set_collection_alias(name: str, collection: str, **info) -> Optional[str]:
+    """
+    原子地把别名指向新的实际集合（先写临时文件再替换），返回之前指向的集合名
+
+    Args:
+        name: 别名（检索引擎使用的逻辑集合名）
+        collection: 实际集合名
+        info: 额外记录的信息（嵌入模型、构建时间等）
+    """
+    with _registry_lock:
+        aliases = load_collection_aliases()
+        previous = aliases.get(name, {}).get("collection", name)
+        aliases[name] = {"collection": collection, "previous": previous, **info}
+        _write_collection_aliases(aliases)
+        return previous
+
+def forget_previous_collection(collection: str):
+    """集合被删除后，清除别名表中指向它的回滚记录（previous）"""
+    with _registry_lock:
+        aliases = load_collection_aliases()
+        changed = False
+        for entry in aliases.values():
+            if entry.get("previous") == collection:
+                entry["previous"] = None
+                changed = True
+        if changed:
+            _write_collection_aliases(aliases)
+
+def _write_collection_aliases(aliases: Dict):
+    """原子地写入别名表（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(config.COLLECTION_ALIASES_FILE) or '.', exist_ok=True)
+    tmp_file = config.COLLECTION_ALIASES_FILE + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(aliases, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, config.COLLECTION_ALIASES_FILE)
+
+def get_registry_stats() -> Dict:
+    """获取注册表中已创建的共享资源概况"""
+    with _registry_lock:
+        return {
+            "chroma_clients": list(_chroma_clients.keys()),
+            "rerank_models": [f"{name} (max_length={length})" for name, length in _rerank_models],
+            "embedding_clients": [f"{model} @ {url}" for url, model in _embedding_clients],
+            # 只显示密钥末尾4位
+            "openai_clients": [f"...{api_key[-4:]}" if api_key else "(默认)" for api_key in _openai_clients]
+        }
+
+def clear_registry():
+    """清空注册表（用于测试或释放内存）"""
+    with _registry_lock:
+        _chroma_clients.clear()
+        _rerank_models.clear()
+        _embedding_clients.clear()
+        _openai_clients.clear()
+        _key_locks.clear()
+
+# 测试函数
+def test_shared_resources():
+    """测试共享资源注册表"""
+    print("🧪 测试共享资源注册表")
+    print("=" * 50)
+
+    client_a = get_embedding_client()
+    client_b = get_embedding_client()
+    print(f"嵌入客户端复用: {client_a is client_b}")
+
+    chroma_a = get_chroma_client()
+    chroma_b = get_chroma_client()
+    print(f"Chroma客户端复用: {chroma_a is chroma_b}")
+
+    model_a = get_rerank_model()
+    model_b = get_rerank_model()
+    print(f"重排模型复用: {model_a is model_b}")
+
+    print(f"\n注册表概况: {get_registry_stats()}")
+
+if __name__ == '__main__':
+    test_shared_resources()
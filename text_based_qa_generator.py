@@ -242,10 +242,9 @@ Answer: [your answer]
 """
             
             # 3. 发送给LLM
-            from openai import OpenAI
-            client = OpenAI(api_key=self.openai_api_key)
+            from llm_gateway import chat_completion
             
-            response = client.chat.completions.create(
+            content = chat_completion(
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -258,11 +257,12 @@ Answer: [your answer]
                     }
                 ],
                 temperature=0.3,
-                max_tokens=200
-            )
+                max_tokens=200,
+                caller="text_qa_generation",
+                api_key=self.openai_api_key
+            ).strip()
             
             # 4. 解析响应
-            content = response.choices[0].message.content.strip()
             question, answer = self._parse_qa_response(content)
             
             if question and answer:
@@ -336,10 +336,9 @@ Question: [your question]
 Answer: [your answer]
 """
             
-            from openai import OpenAI
-            client = OpenAI(api_key=self.openai_api_key)
+            from llm_gateway import chat_completion
             
-            response = client.chat.completions.create(
+            content = chat_completion(
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -352,10 +351,11 @@ Answer: [your answer]
                     }
                 ],
                 temperature=0.3,
-                max_tokens=150
-            )
+                max_tokens=150,
+                caller="text_qa_generation",
+                api_key=self.openai_api_key
+            ).strip()
             
-            content = response.choices[0].message.content.strip()
             question, answer = self._parse_qa_response(content)
             
             if question and answer:
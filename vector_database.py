@@ -1,37 +1,124 @@
 # vector_database.py - 向量数据库管理器
 
-import chromadb
 from typing import List, Dict, Optional
+from collections import OrderedDict
 from tqdm import tqdm
 import config
-from data_loader import KnowledgeDataLoader
-from embedding_client import EmbeddingClient
+from data_loader import KnowledgeDataLoader, group_entries_by_document, build_provenance_metadata, parse_provenance
+from corpus_stats import CorpusStats, delete_corpus_stats, get_corpus_stats
+from shared_resources import (get_chroma_client, get_embedding_client, get_or_create_collection,
+                              resolve_collection_alias, get_alias_version)
+from sharded_collection import ShardedCollection, collection_query
 
 class VectorDatabaseManager:
     """向量数据库管理器"""
     
+    QUERY_EMBEDDING_MEMORY = 256  # 记录的最近查询嵌入数
+    
     def __init__(self):
-        self.client = chromadb.PersistentClient(path=config.CHROMA_DB_PATH)
+        # 使用进程级共享的客户端，避免多个引擎重复创建；第一次访问时才打开（使用快照时不打开）
+        self._client = None
         self.collection = None
-        self.embedding_client = EmbeddingClient()
+        self._alias_collection = None
+        self._alias_version = 0.0
+        # 最近查询的嵌入（按查询文本，有界）
+        self._query_embeddings = OrderedDict()
+        self.embedding_client = get_embedding_client()
+        
+    @property
+    def client(self):
+        """ChromaDB客户端，第一次访问时打开"""
+        if self._client is None:
+            self._client = get_chroma_client(config.CHROMA_DB_PATH)
+        return self._client
+        
+    def initialize_collection(self, reset: bool = False, sharded: bool = None):
+        """
+        初始化或重置集合
+        
+        Args:
+            reset: 是否删除现有集合
+            sharded: 是否使用按领域分片的集合，默认使用config.SHARDED_COLLECTIONS
+        """
+        if sharded is None:
+            sharded = config.SHARDED_COLLECTIONS
+        
+        # 集合名可能是别名（reindex.py切换影子集合后指向新的实际集合）
+        physical_name = config.COLLECTION_NAME if sharded else resolve_collection_alias(config.COLLECTION_NAME)
         
-    def initialize_collection(self, reset: bool = False):
-        """初始化或重置集合"""
         if reset and self.collection:
             try:
-                self.client.delete_collection(name=config.COLLECTION_NAME)
-                print(f"🗑 已删除现有集合: {config.COLLECTION_NAME}")
+                if isinstance(self.collection, ShardedCollection):
+                    self.collection.delete_all()
+                else:
+                    self.client.delete_collection(name=physical_name)
+                delete_corpus_stats(physical_name)
+                print(f"🗑 已删除现有集合: {physical_name}")
             except:
                 pass
         
-        self.collection = self.client.get_or_create_collection(
-            name=config.COLLECTION_NAME,
-            metadata={"hnsw:space": "cosine"}
-        )
+        if sharded:
+            self.collection = ShardedCollection(self.client, config.COLLECTION_NAME)
+            self._alias_collection = None
+        else:
+            self.collection = get_or_create_collection(self.client, physical_name)
+            self._alias_collection = self.collection
+            self._alias_version = get_alias_version()
         
-        print(f"✅ 集合初始化完成: {config.COLLECTION_NAME}")
+        print(f"✅ 集合初始化完成: {physical_name}")
         print(f"   - 当前文档数量: {self.collection.count()}")
         
+    def refresh_collection_alias(self):
+        """别名被切换后重新打开别名指向的集合（只对通过别名打开的ChromaDB集合生效）"""
+        if self.collection is None or self.collection is not self._alias_collection:
+            return
+        version = get_alias_version()
+        if version == self._alias_version:
+            return
+        self._alias_version = version
+        physical_name = resolve_collection_alias(config.COLLECTION_NAME)
+        if physical_name != self.collection.name:
+            # 只打开已存在的集合；别名指向的集合不存在时继续使用当前集合，不新建空集合
+            try:
+                collection = self.client.get_collection(name=physical_name)
+            except Exception as e:
+                print(f"⚠️ 别名 {config.COLLECTION_NAME} 指向的集合 {physical_name} 无法打开，继续使用 {self.collection.name}: {e}")
+                return
+            self.collection = collection
+            self._alias_collection = self.collection
+            print(f"🔀 集合别名已切换: {config.COLLECTION_NAME} -> {physical_name}")
+        
+    def remember_query_embedding(self, query: str, embedding: List[float]):
+        """记录检索时计算的查询嵌入（问题类型路由等后续步骤直接复用）"""
+        self._query_embeddings[query] = embedding
+        self._query_embeddings.move_to_end(query)
+        while len(self._query_embeddings) > self.QUERY_EMBEDDING_MEMORY:
+            self._query_embeddings.popitem(last=False)
+    
+    def get_query_embedding(self, query: str) -> Optional[List[float]]:
+        """最近检索过的查询的嵌入，没有时返回None"""
+        return self._query_embeddings.get(query)
+        
+    def use_snapshot(self, snapshot_path: str):
+        """使用只读索引快照代替ChromaDB集合（快速启动，多进程共享内存页）"""
+        from index_snapshot import load_snapshot
+        self.collection = load_snapshot(snapshot_path)
+        
+    def use_binary_index(self, snapshot_path: str, rescore: str = 'float32', oversample: int = None):
+        """
+        使用二值量化索引作为第一阶段：1-bit码Hamming预筛选，再对候选重打分
+        
+        Args:
+            snapshot_path: 索引快照文件（需先用binary_index.py构建二值码）
+            rescore: 重打分精度 ('float32' 或 'int8')
+            oversample: 候选扩充倍数，默认使用config.BINARY_SEARCH_OVERSAMPLE
+        """
+        from binary_index import BinaryQuantizedCollection
+        self.collection = BinaryQuantizedCollection(snapshot_path, rescore, oversample)
+        memory = self.collection.memory_stats()
+        print(f"✅ 已启用二值量化检索: {rescore}重打分, "
+              f"{memory['binary_mb']:.1f}MB (全精度 {memory['full_mb']:.1f}MB)")
+        
     def triple_to_embedding_text(self, triple: tuple, schema: tuple) -> str:
         """
         将三元组和Schema转换为用于嵌入的简洁文本
@@ -47,8 +134,34 @@ class VectorDatabaseManager:
         # 简洁但信息完整的表示
         return f"{sub_clean} {rel} {obj_clean}. Types: {schema_sub} {schema_rel} {schema_obj}."
     
-    def populate_database(self, knowledge_entries: Optional[List[Dict]] = None):
-        """填充向量数据库"""
+    def create_metadata(self, entry: Dict) -> Dict:
+        """创建条目的元数据（完整的三元组和Schema信息）"""
+        return {
+            # 原始三元组
+            "sub": entry["triple"][0], 
+            "rel": entry["triple"][1], 
+            "obj": entry["triple"][2],
+            # Schema信息
+            "sub_type": entry["schema"][0], 
+            "rel_type": entry["schema"][1], 
+            "obj_type": entry["schema"][2],
+            # 额外信息
+            "source_file": entry.get("source_file", ""),
+            "text": entry.get("text", "")
+        }
+    
+    def populate_database(self, knowledge_entries: Optional[List[Dict]] = None,
+                          deduplicate: bool = None):
+        """
+        填充向量数据库
+        
+        Args:
+            knowledge_entries: 知识条目，默认从数据集加载
+            deduplicate: 是否按嵌入文本去重，默认使用config.DEDUPLICATE_TRIPLES
+        """
+        if deduplicate is None:
+            deduplicate = config.DEDUPLICATE_TRIPLES
+        
         if not self.collection:
             self.initialize_collection()
         
@@ -63,32 +176,31 @@ class VectorDatabaseManager:
         
         print(f"🔄 开始填充数据库，共 {len(knowledge_entries)} 个条目")
         
-        # 准备数据
-        ids = [entry['id'] for entry in knowledge_entries]
-        documents = [self.triple_to_embedding_text(entry["triple"], entry["schema"]) 
-                    for entry in knowledge_entries]
+        # 准备数据：相同的嵌入文本只嵌入一次，所有来源条目记录为provenance
+        if deduplicate:
+            groups = group_entries_by_document(knowledge_entries, self.triple_to_embedding_text)
+            print(f"🔁 去重后剩余 {len(groups)} 个唯一文本 (原始条目 {len(knowledge_entries)} 个)")
+        else:
+            groups = [(self.triple_to_embedding_text(entry["triple"], entry["schema"]), [entry])
+                      for entry in knowledge_entries]
+        
+        ids = [group[0]['id'] for _, group in groups]
+        documents = [document for document, _ in groups]
         
         # 准备元数据（保存完整的三元组和Schema信息）
-        metadatas = [
-            {
-                # 原始三元组
-                "sub": entry["triple"][0], 
-                "rel": entry["triple"][1], 
-                "obj": entry["triple"][2],
-                # Schema信息
-                "sub_type": entry["schema"][0], 
-                "rel_type": entry["schema"][1], 
-                "obj_type": entry["schema"][2],
-                # 额外信息
-                "source_file": entry.get("source_file", ""),
-                "text": entry.get("text", "")
-            } 
-            for entry in knowledge_entries
-        ]
+        metadatas = []
+        for _, group in groups:
+            metadata = self.create_metadata(group[0])
+            if deduplicate:
+                metadata.update(build_provenance_metadata(group))
+            metadatas.append(metadata)
         
         # 分批处理
         batch_size = config.BATCH_SIZE
         
+        # 语料统计随批次增量更新
+        corpus_stats = CorpusStats.load(self.collection.name) or CorpusStats(self.collection.name)
+        
         for i in tqdm(range(0, len(ids), batch_size), desc="嵌入处理"):
             batch_ids = ids[i:i+batch_size]
             batch_documents = documents[i:i+batch_size]
@@ -104,9 +216,19 @@ class VectorDatabaseManager:
                     documents=batch_documents,
                     metadatas=batch_metadatas
                 )
+                corpus_stats.update(batch_ids, batch_metadatas)
             else:
                 print(f"⚠ 跳过批次 {i}，嵌入失败")
         
+        if isinstance(self.collection, ShardedCollection):
+            self.collection.save_router()
+        
+        # 统计与集合不一致（例如重复ID或外部写入）时重新扫描
+        if corpus_stats.total_entries == self.collection.count():
+            corpus_stats.save()
+        else:
+            get_corpus_stats(self.collection, rebuild=True)
+        
         print(f"✅ 数据库填充完成，总条目数: {self.collection.count()}")
     
     def query_database(self, query: str, n_results: int = 5) -> List[Dict]:
@@ -115,6 +237,8 @@ class VectorDatabaseManager:
             print("❌ 集合未初始化")
             return []
         
+        self.refresh_collection_alias()
+        
         # 增强查询 - 生成多个查询变体
         enhanced_queries = self._generate_query_variants(query)
         
@@ -125,12 +249,11 @@ class VectorDatabaseManager:
             query_embedding = self.embedding_client.get_embeddings_batch([enhanced_query])
             if not query_embedding:
                 continue
+            if enhanced_query == query:
+                self.remember_query_embedding(query, query_embedding[0])
             
-            # 执行查询
-            results = self.collection.query(
-                query_embeddings=query_embedding,
-                n_results=n_results
-            )
+            # 执行查询（分片集合会按问题路由到相关分片）
+            results = collection_query(self.collection, query_embedding, n_results, query)
             
             # 格式化结果
             if results and results['ids'][0]:
@@ -145,6 +268,7 @@ class VectorDatabaseManager:
                         'document': results['documents'][0][i],
                         'text': metadata.get('text', ''),
                         'source_file': metadata.get('source_file', ''),
+                        'provenance': parse_provenance(metadata),
                         'query_variant': enhanced_query
                     }
                     all_results.append(result_item)
@@ -258,16 +382,29 @@ class VectorDatabaseManager:
         
         return score
     
-    def get_database_stats(self) -> Dict:
-        """获取数据库统计信息"""
+    def get_database_stats(self, include_corpus_stats: bool = False) -> Dict:
+        """
+        获取数据库统计信息
+        
+        Args:
+            include_corpus_stats: 是否附带语料统计（关系直方图、实体频率、类型计数、关系样例）
+        """
         if not self.collection:
             return {"status": "Collection not initialized"}
         
-        return {
+        stats = {
             "collection_name": self.collection.name,
             "total_documents": self.collection.count(),
             "status": "ready"
         }
+        
+        if isinstance(self.collection, ShardedCollection):
+            stats["shards"] = self.collection.get_shard_stats()
+        
+        if include_corpus_stats:
+            stats["corpus_stats"] = get_corpus_stats(self.collection).to_dict()
+        
+        return stats
 
 # 测试函数
 def test_vector_database():